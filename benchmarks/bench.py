@@ -0,0 +1,233 @@
+"""
+Downloader throughput and latency benchmarks against local stand-in HTTP server
+
+Server runs in separate process so measured CPU time is the client's only.
+Every request can shape its response with query parameters:
+    latency  - milliseconds to wait before responding
+    size     - response body size in bytes
+    gzip     - gzip encode body when 1
+    error    - share of requests answered with 503
+
+    $ python benchmarks/bench.py --requests 5000 --concurrency 200 --output results.json
+    $ python benchmarks/bench.py --scenario many_slots --scenario large_bodies
+
+Progress is printed to stderr as JSON line per scenario.
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+from time import perf_counter, process_time, time
+from typing import Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+from loguru import logger as log
+
+from requestr import Downloader, Request, Response
+from requestr.downloader import DEFAULT_MWARES
+from requestr.exceptions import RequestFailed
+from requestr.metrics import Histogram
+from requestr.middlewares import RetryStatuses
+from requestr.transport import ReplayTransport
+
+# buckets fine enough for sub-millisecond local responses
+LATENCY_BUCKETS = tuple(i / 10_000 for i in range(1, 100)) + tuple(i / 100 for i in range(1, 100)) + (1, 2, 5, 10)
+
+
+# server
+
+
+async def handle(request: web.Request) -> web.Response:
+    query = request.query
+    latency = float(query.get("latency", 0)) / 1000
+    if latency:
+        await asyncio.sleep(latency)
+    if random.random() < float(query.get("error", 0)):
+        return web.Response(status=503, text="unavailable")
+    body = request.app["body"][: int(query.get("size", 1024))]
+    if query.get("gzip") == "1":
+        return web.Response(body=gzip.compress(body, 1), headers={"Content-Encoding": "gzip"})
+    return web.Response(body=body, content_type="text/html")
+
+
+def serve(conn, max_size: int):
+    random.seed(0)
+    app = web.Application()
+    app["body"] = (b"<p>" + b"requestr " * 100 + b"</p>\n") * (max_size // 912 + 1)
+    app.router.add_get("/{tail:.*}", handle)
+
+    async def start():
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0, backlog=4096)
+        await site.start()
+        conn.send(site._server.sockets[0].getsockname()[1])
+        await asyncio.Event().wait()
+
+    asyncio.run(start())
+
+
+class Server:
+    """stand-in server running in child process"""
+
+    def __init__(self, max_size: int = 2**21) -> None:
+        self.max_size = max_size
+        self.process: Optional[multiprocessing.Process] = None
+        self.url = ""
+
+    def __enter__(self):
+        ctx = multiprocessing.get_context("spawn")
+        conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=serve, args=(child_conn, self.max_size), daemon=True)
+        self.process.start()
+        self.url = f"http://127.0.0.1:{conn.recv()}"
+        return self
+
+    def __exit__(self, *args):
+        self.process.terminate()
+        self.process.join()
+
+
+# client
+
+
+def rss() -> int:
+    """resident memory of this process in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # peak rather than current memory outside of linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+SCENARIOS: Dict[str, Dict] = {
+    "single_slot": dict(slots=1),
+    "many_slots": dict(slots=2000),
+    "default_mwares": dict(slots=1, mwares=DEFAULT_MWARES),
+    "latency_50ms": dict(slots=1, query={"latency": 50}),
+    "retries": dict(slots=1, query={"error": 0.2}, mwares={900: RetryStatuses(503, times=5, sleep=[0.01])}),
+    "gzip": dict(slots=1, query={"gzip": 1, "size": 65536}),
+    "large_bodies": dict(slots=1, query={"size": 2**21}, requests=0.1),
+    # no network: scheduler, limiter and middleware overhead only
+    "replay": dict(slots=1, mwares=DEFAULT_MWARES, replay=True),
+}
+
+
+async def run_scenario(
+    name: str,
+    base_url: str,
+    requests: int,
+    concurrency: int,
+    slots: int = 1,
+    query: Dict = None,
+    mwares: Dict = None,
+    limit: float = 10**6,
+    replay: bool = False,
+) -> Dict:
+    """send `requests` through Downloader with `concurrency` in flight and measure them"""
+    latencies = Histogram(LATENCY_BUCKETS)
+    failed = 0
+    peak_rss = baseline_rss = rss()
+    params = "&".join(f"{key}={value}" for key, value in (query or {}).items())
+    reqs = (Request(f"{base_url}/{i}?{params}", slot=f"slot{i % slots}") for i in range(requests))
+
+    async def sample_memory():
+        nonlocal peak_rss
+        while True:
+            peak_rss = max(peak_rss, rss())
+            await asyncio.sleep(0.02)
+
+    async def worker(dl: Downloader):
+        # `concurrency` workers share lazy request generator so only requests in flight exist at any time
+        nonlocal failed
+        for req in reqs:
+            started = perf_counter()
+            try:
+                await dl.send(req)
+            except (RequestFailed, aiohttp.ClientError, asyncio.TimeoutError):
+                failed += 1
+            latencies.observe(perf_counter() - started)
+
+    transport = None
+    if replay:
+        body = b"<p>" + b"requestr " * 100 + b"</p>\n"
+        transport = ReplayTransport(lambda req: Response(req.url, 200, content=body, request=req))
+    sampler = asyncio.ensure_future(sample_memory())
+    # rate limits are lifted so downloader itself is measured
+    async with Downloader(
+        mwares=mwares or {}, limit=limit, shared_connector=True, metrics=False, transport=transport
+    ) as dl:
+        cpu_started, started = process_time(), perf_counter()
+        await asyncio.gather(*[worker(dl) for _ in range(concurrency)])
+        elapsed, cpu = perf_counter() - started, process_time() - cpu_started
+        sent = dl.stats["req/sent"]
+    sampler.cancel()
+    return {
+        "scenario": name,
+        "requests": requests,
+        "concurrency": concurrency,
+        "slots": slots,
+        "sent": int(sent),
+        "failed": failed,
+        "seconds": round(elapsed, 4),
+        "requests_per_second": round(requests / elapsed, 1),
+        "latency_p50_ms": round(latencies.quantile(0.5) * 1000, 3),
+        "latency_p95_ms": round(latencies.quantile(0.95) * 1000, 3),
+        "latency_p99_ms": round(latencies.quantile(0.99) * 1000, 3),
+        "cpu_seconds": round(cpu, 4),
+        "cpu_ms_per_response": round(cpu / max(sent, 1) * 1000, 4),
+        "memory_per_inflight_kb": round(max(peak_rss - baseline_rss, 0) / concurrency / 1024, 2),
+        "peak_rss_mb": round(peak_rss / 2**20, 1),
+    }
+
+
+async def run(scenarios: List[str], requests: int, concurrency: int) -> Dict:
+    results = []
+    with Server() as server:
+        for name in scenarios:
+            options = dict(SCENARIOS[name])
+            count = max(1, int(requests * options.pop("requests", 1)))
+            result = await run_scenario(name, server.url, count, concurrency, **options)
+            print(json.dumps(result), file=sys.stderr)
+            results.append(result)
+    return {
+        "timestamp": time(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "aiohttp": aiohttp.__version__,
+        "scenarios": results,
+    }
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=100, help="requests in flight")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="scenario to run, all by default")
+    parser.add_argument("--output", help="file to write JSON results to instead of stdout")
+    parser.add_argument("--log-level", default="WARNING", help="downloader log level, debug logging skews results")
+    args = parser.parse_args(argv)
+
+    log.remove()
+    log.add(sys.stderr, level=args.log_level)
+
+    results = asyncio.run(run(args.scenario or list(SCENARIOS), args.requests, args.concurrency))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,6 @@ Web Scraper using Downloader to scrape ycombinator.com news (aka Hacker News)
 
 Scrapes first page of comments on every topic in page 1
 """
-from asyncio import as_completed
 from time import time
 from typing import List
 
@@ -29,9 +28,11 @@ class HNCommentsScraper:
         self.stats["elapsed"] = self.stats["end"] - self.stats["start"]
         await self.dl.close()
 
-    async def scrape_comments(self, url: URL) -> List[str]:
-        resp = await self.dl.send(Request(url))
-        return resp.tree.css(".commtext::text").extract()
+    async def scrape_comments(self, urls: List[URL]) -> List[List[str]]:
+        comments = []
+        async for _req, resp in self.dl.send_many((Request(url) for url in urls), concurrency=10):
+            comments.append(resp.tree.css(".commtext::text").extract())
+        return comments
 
     async def scrape_page(self, page: int = 1) -> List[URL]:
         front_page = await self.dl.send(Request(f"https://news.ycombinator.com/news?p={page}"))
@@ -44,11 +45,9 @@ class HNCommentsScraper:
 
 
 async def scrape():
-    comments = []
     async with HNCommentsScraper() as scraper:
         page_urls = await scraper.scrape_page(page=1)
-        for data in as_completed([scraper.scrape_comments(url) for url in page_urls]):
-            comments.append(await data)
+        comments = await scraper.scrape_comments(page_urls)
 
     print(f"found {len(comments)} comments in 1 page of hacker news")
     print(f"stats: {dict(scraper.stats)}")
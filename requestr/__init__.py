@@ -1,4 +1,4 @@
 from requestr.request import Request
-from requestr.response import Response
+from requestr.response import Response, StreamResponse
 from requestr.session import Session
 from requestr.downloader import Downloader
@@ -0,0 +1,348 @@
+"""
+WARC-style archive of request/response exchanges in compressed, append-only segment files
+for re-parsing crawls without refetching and for replaying real traffic in load tests.
+
+Every exchange is single gzip member holding WARC/1.1 `response` and `request` records,
+so records can be read independently by offset like in `.warc.gz` files.
+Segment `segment-00000.warc.gz` has sidecar index `segment-00000.idx` of `fingerprint offset length` lines
+which is loaded to memory on open for O(1) lookups; latest exchange of a fingerprint wins.
+Response bodies are stored decoded, as `Response.content` holds them. Request bodies are stored as sent
+with their original type (json, form, text or bytes) so rebuilt requests keep their fingerprint.
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import re
+import uuid
+from datetime import datetime, timezone
+from http import HTTPStatus
+from time import time
+from typing import IO, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple, Union
+from urllib.parse import parse_qsl, urlencode
+
+from multidict import CIMultiDict
+from yarl import URL
+
+from requestr.request import Request
+from requestr.response import Response
+from requestr.transport import NullSession, ReplayTransport
+from requestr.utils import canonical_url, request_fingerprint
+
+segment_re = re.compile(r"^segment-(\d{5})\.warc\.gz$")
+
+
+def _segment_name(segment: int) -> str:
+    return f"segment-{segment:05d}.warc.gz"
+
+
+def _index_name(segment: int) -> str:
+    return f"segment-{segment:05d}.idx"
+
+
+def _request_body(req: Request) -> Tuple[bytes, str]:
+    """request body as sent and its type to restore it with"""
+    if req.json is not None:
+        return json.dumps(req.json).encode(), "json"
+    data = req.data
+    if data is None:
+        return b"", "bytes"
+    if isinstance(data, bytes):
+        return data, "bytes"
+    if isinstance(data, str):
+        return data.encode(), "text"
+    if isinstance(data, Mapping):
+        return urlencode(data).encode(), "form"
+    return repr(data).encode(), "bytes"
+
+
+def _restore_body(body: bytes, body_type: str) -> Dict:
+    """Request keyword arguments of body stored by `_request_body`"""
+    if body_type == "json":
+        return {"json": json.loads(body)}
+    if body_type == "form":
+        return {"data": dict(parse_qsl(body.decode(), keep_blank_values=True))}
+    if body_type == "text":
+        return {"data": body.decode()}
+    return {"data": body or None}
+
+
+def _http_block(start_line: str, headers: Iterable[Tuple[str, str]], body: bytes) -> bytes:
+    head = start_line + "\r\n" + "".join(f"{name}: {value}\r\n" for name, value in headers) + "\r\n"
+    return head.encode() + body
+
+
+def _warc_record(warc_type: str, url: str, date: str, record_id: str, block: bytes, **fields: str) -> bytes:
+    headers = {
+        "WARC-Type": warc_type,
+        "WARC-Record-ID": f"<urn:uuid:{record_id}>",
+        "WARC-Date": date,
+        "WARC-Target-URI": url,
+        **{name.replace("_", "-"): value for name, value in fields.items()},
+        "Content-Type": f"application/http; msgtype={warc_type}",
+        "Content-Length": str(len(block)),
+    }
+    return _http_block("WARC/1.1", headers.items(), block) + b"\r\n\r\n"
+
+
+def _parse_warc(data: bytes) -> List[Tuple[Dict[str, str], bytes]]:
+    records = []
+    pos = 0
+    while pos < len(data):
+        end = data.index(b"\r\n\r\n", pos)
+        lines = data[pos:end].decode().split("\r\n")
+        headers = dict(line.split(": ", 1) for line in lines[1:])
+        start = end + 4
+        length = int(headers["Content-Length"])
+        records.append((headers, data[start : start + length]))
+        pos = start + length + 4
+    return records
+
+
+def _parse_http(block: bytes) -> Tuple[str, CIMultiDict, bytes]:
+    head, _, body = block.partition(b"\r\n\r\n")
+    start_line, *lines = head.decode().split("\r\n")
+    return start_line, CIMultiDict(line.split(": ", 1) for line in lines), body
+
+
+def encode_exchange(req: Request, resp: Response, fingerprint: str) -> bytes:
+    """WARC response and request records of exchange"""
+    started = time() - (resp.elapsed or 0)
+    date = datetime.fromtimestamp(started, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    response_id, request_id = uuid.uuid4(), uuid.uuid4()
+    url = URL(canonical_url(req.url, req.params))
+    try:
+        reason = HTTPStatus(resp.status).phrase
+    except ValueError:
+        reason = ""
+    response_block = _http_block(f"HTTP/1.1 {resp.status} {reason}", resp.headers.items(), resp.content)
+    body, body_type = _request_body(req)
+    request_block = _http_block(
+        f"{req.method.upper()} {url.raw_path_qs} HTTP/1.1",
+        [("Host", url.raw_host or ""), *(req._headers or {}).items()],
+        body,
+    )
+    return _warc_record(
+        "response",
+        str(resp.url),
+        date,
+        response_id,
+        response_block,
+        Requestr_Fingerprint=fingerprint,
+        Requestr_Elapsed=f"{resp.elapsed or 0:.6f}",
+    ) + _warc_record(
+        "request",
+        str(url),
+        date,
+        request_id,
+        request_block,
+        WARC_Concurrent_To=f"<urn:uuid:{response_id}>",
+        Requestr_Body_Type=body_type,
+    )
+
+
+def decode_exchange(data: bytes) -> Response:
+    """Response with its Request from records written by `encode_exchange`"""
+    (response_fields, response_block), (request_fields, request_block) = _parse_warc(data)
+    status_line, headers, content = _parse_http(response_block)
+    request_line, request_headers, body = _parse_http(request_block)
+    del request_headers["Host"]
+    method = request_line.split(" ", 1)[0]
+    body_kwargs = _restore_body(body, request_fields.get("Requestr-Body-Type", "bytes"))
+    req = Request(request_fields["WARC-Target-URI"], method, headers=request_headers or None, **body_kwargs)
+    return Response(
+        URL(response_fields["WARC-Target-URI"]),
+        int(status_line.split(" ", 2)[1]),
+        content=content,
+        method=method,
+        headers=headers,
+        request=req,
+        meta={"archived": True},
+        elapsed=float(response_fields["Requestr-Elapsed"]),
+    )
+
+
+class Archive:
+    """
+    Append-only archive of exchanges in directory `path`, rotated to new segment after `segment_size` bytes.
+    Requests are keyed by `request_fingerprint` including values of `headers`:
+
+        with Archive("crawl") as archive:
+            archive.write(req, resp)
+            resp = archive.get(req)
+            for resp in archive:  # every exchange in recording order
+                ...
+
+    Exchanges that were partially written when process died are dropped on open.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, os.PathLike] = ".requestr_archive",
+        segment_size: int = 2**26,
+        headers: Iterable[str] = (),
+        compresslevel: int = 6,
+    ) -> None:
+        self.path = path
+        self.segment_size = segment_size
+        self.headers = tuple(headers)
+        self.compresslevel = compresslevel
+        # fingerprint -> (segment, offset, length)
+        self.index: Dict[str, Tuple[int, int, int]] = {}
+        self.segments: List[int] = []
+        self._loaded = False
+        self._segment = 0
+        self._file: Optional[IO[bytes]] = None
+        self._index_file: Optional[IO[str]] = None
+        self._readers: Dict[int, IO[bytes]] = {}
+
+    def fingerprint(self, req: Request) -> str:
+        return request_fingerprint(req, headers=self.headers)
+
+    def _load(self):
+        if self._loaded:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        self.segments = sorted(
+            int(match.group(1)) for match in map(segment_re.match, os.listdir(self.path)) if match is not None
+        )
+        for segment in self.segments:
+            entries, torn = self._entries(segment)
+            for fingerprint, offset, length in entries:
+                self.index[fingerprint] = (segment, offset, length)
+            if torn and segment == self.segments[-1]:
+                # drop exchange torn by crash so appends continue after last complete one
+                end = max((offset + length for _, offset, length in entries), default=0)
+                os.truncate(os.path.join(self.path, _segment_name(segment)), end)
+                with open(os.path.join(self.path, _index_name(segment)), "w") as f:
+                    f.writelines(f"{fingerprint} {offset} {length}\n" for fingerprint, offset, length in entries)
+        self._segment = self.segments[-1] if self.segments else 0
+        self._loaded = True
+
+    def _entries(self, segment: int) -> Tuple[List[Tuple[str, int, int]], bool]:
+        """complete index entries of segment and whether segment or its index was torn by crash"""
+        size = os.path.getsize(os.path.join(self.path, _segment_name(segment)))
+        entries, torn, end = [], False, 0
+        try:
+            with open(os.path.join(self.path, _index_name(segment))) as f:
+                for line in f:
+                    parts = line.split()
+                    complete = len(parts) == 3 and line.endswith("\n") and parts[1].isdigit() and parts[2].isdigit()
+                    if not complete or int(parts[1]) + int(parts[2]) > size:
+                        torn = True
+                        continue
+                    entries.append((parts[0], int(parts[1]), int(parts[2])))
+                    end = max(end, int(parts[1]) + int(parts[2]))
+        except FileNotFoundError:
+            pass
+        return entries, torn or end < size
+
+    def _open_segment(self, segment: int):
+        self._close_writer()
+        self._segment = segment
+        if segment not in self.segments:
+            self.segments.append(segment)
+        self._file = open(os.path.join(self.path, _segment_name(segment)), "ab")
+        self._index_file = open(os.path.join(self.path, _index_name(segment)), "a")
+
+    def write(self, req: Request, resp: Response) -> str:
+        """append exchange to archive; returns fingerprint of request"""
+        self._load()
+        fingerprint = self.fingerprint(req)
+        data = gzip.compress(encode_exchange(req, resp, fingerprint), self.compresslevel)
+        if self._file is None:
+            self._open_segment(self._segment)
+        if self._file.tell() and self._file.tell() + len(data) > self.segment_size:
+            self._open_segment(self._segment + 1)
+        offset = self._file.tell()
+        self._file.write(data)
+        self._index_file.write(f"{fingerprint} {offset} {len(data)}\n")
+        self.index[fingerprint] = (self._segment, offset, len(data))
+        return fingerprint
+
+    def _read(self, segment: int, offset: int, length: int) -> Response:
+        if segment == self._segment and self._file is not None:
+            self._file.flush()
+        reader = self._readers.get(segment)
+        if reader is None:
+            reader = self._readers[segment] = open(os.path.join(self.path, _segment_name(segment)), "rb")
+        reader.seek(offset)
+        return decode_exchange(gzip.decompress(reader.read(length)))
+
+    def get(self, req: Union[Request, str]) -> Optional[Response]:
+        """latest recorded response to request or request fingerprint"""
+        self._load()
+        location = self.index.get(req if isinstance(req, str) else self.fingerprint(req))
+        if location is None:
+            return None
+        return self._read(*location)
+
+    def __iter__(self) -> Iterator[Response]:
+        self._load()
+        self.flush()
+        for segment in list(self.segments):
+            for _, offset, length in self._entries(segment)[0]:
+                yield self._read(segment, offset, length)
+
+    def __contains__(self, req: Union[Request, str]) -> bool:
+        self._load()
+        return (req if isinstance(req, str) else self.fingerprint(req)) in self.index
+
+    def __len__(self) -> int:
+        self._load()
+        return len(self.index)
+
+    def flush(self):
+        if self._file is not None:
+            # data goes first so index never points past end of segment
+            self._file.flush()
+            self._index_file.flush()
+
+    def _close_writer(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._index_file.close()
+            self._file = self._index_file = None
+
+    def close(self):
+        self._close_writer()
+        for reader in self._readers.values():
+            reader.close()
+        self._readers.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ArchiveTransport(ReplayTransport):
+    """
+    Transport answering requests from Archive, e.g. to re-parse historical crawl at CPU speed:
+
+        async with Downloader(transport=ArchiveTransport(Archive("crawl"))) as dl:
+            resp = await dl.send(Request(url))
+
+    with `speed` every response is delayed by its recorded time divided by `speed`,
+    so load tests get timing shape of real traffic (`speed=2` replays twice as fast).
+    """
+
+    def __init__(self, archive: Archive, latency: float = 0.0, speed: Optional[float] = None) -> None:
+        super().__init__(latency=latency, headers=archive.headers)
+        self.archive = archive
+        self.speed = speed
+
+    def find(self, req: Request) -> Optional[Response]:
+        return self.archive.get(req)
+
+    async def request(self, req: Request, session: NullSession) -> Response:
+        resp = await super().request(req, session)
+        if self.speed and resp.elapsed:
+            await asyncio.sleep(resp.elapsed / self.speed)
+        return resp
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.archive.path!r}, speed={self.speed})"
@@ -1,19 +1,28 @@
-from collections import defaultdict
-from copy import deepcopy
-from time import time
-from typing import Callable, Dict, List, Optional, Type
+import asyncio
+import functools
+from collections import defaultdict, deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from time import perf_counter, time
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, Iterable, Optional, Tuple, Type, Union
 
 from loguru import logger as log
 from aiohttp import TCPConnector
-from aiolimiter import AsyncLimiter
 
-from requestr.defaults import DEFAULT_LIMIT
+from requestr import instrument as phases
 from requestr.exceptions import MwareRedirectLimit, UnsupportedMwareReturn
+from requestr.http2 import Http2Session, Http2Transport
+from requestr.instrument import Instrument, sampled, tracing
+from requestr.metrics import Metrics
 from requestr.middlewares import Middleware, RetryExceptions, RetryStatuses, RandomUserAgent
+from requestr.pipeline import MiddlewarePipeline, PipelineCache
 from requestr.request import Request
-from requestr.response import Response
-from requestr.session import Session
-from requestr.throttler import Throttler
+from requestr.response import DEFAULT_CHUNK_SIZE, Response, StreamResponse
+from requestr.session import Session, SessionPool
+from requestr.throttler import DelayQueue, RateScheduler, SendWindow
+from requestr.transport import AiohttpTransport, Transport
+from requestr.utils import request_fingerprint
 
 DEFAULT_MWARES = {
     # downloader
@@ -33,6 +42,16 @@ DEFAULT_HEADERS = {
 DEFAULT_SESSION_KWARGS = {
     "headers": DEFAULT_HEADERS,
 }
+# concurrency window of send_many the current request belongs to
+_send_window: ContextVar[Optional[SendWindow]] = ContextVar("send_window", default=None)
+# whether the current request holds its place in that window, deferred requests give it up for a while
+_window_held: ContextVar[bool] = ContextVar("window_held", default=False)
+
+DEFAULT_CONNECTOR_KWARGS = {
+    "limit": 0,
+    "ttl_dns_cache": 300,
+    "keepalive_timeout": 30,
+}
 
 
 class Downloader:
@@ -42,14 +61,105 @@ class Downloader:
         session_cls: Callable = Session,
         session_kwargs: Dict = None,
         limit: int = 120,
+        max_sessions: Optional[int] = None,
+        session_ttl: Optional[float] = None,
+        shared_connector: Union[bool, TCPConnector] = False,
+        connector_kwargs: Dict = None,
+        coalesce: bool = False,
+        coalesce_headers: Iterable[str] = (),
+        coalesce_methods: Iterable[str] = ("GET", "HEAD"),
+        global_limit: Optional[int] = None,
+        metrics: Union[bool, Metrics] = False,
+        executor: Union[None, str, Executor] = None,
+        instrument: Optional[Instrument] = None,
+        http2: Union[bool, Iterable[str]] = False,
+        transport: Optional[Transport] = None,
     ):
-        self.sessions = {}
+        self.sessions = SessionPool(max_size=max_sessions, ttl=session_ttl)
         self.session_kwargs = session_kwargs or DEFAULT_SESSION_KWARGS
         self.stats = defaultdict(float)
         self.mwares = mwares
+        self.pipelines = PipelineCache()
         self.mware_req_limit = 10
         self.session_cls = session_cls
         self.limit = limit
+        # rate limits of all slot sessions and optional global cap of requests per second
+        self.scheduler = RateScheduler(global_limit=global_limit)
+        # requests returned by middlewares with `meta["delay"]` wait here before being resubmitted
+        self.delayed = DelayQueue()
+        # when enabled all slot sessions share single connection pool,
+        # cookies, headers and limiter remain isolated per session
+        self.shared_connector = shared_connector
+        self.connector_kwargs = connector_kwargs or DEFAULT_CONNECTOR_KWARGS
+        self._connector: Optional[TCPConnector] = (
+            shared_connector if isinstance(shared_connector, TCPConnector) else None
+        )
+        # when enabled concurrent identical requests on same slot share single in-flight download
+        self.coalesce = coalesce
+        self.coalesce_headers = tuple(coalesce_headers)
+        self.coalesce_methods = {method.upper() for method in coalesce_methods}
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        # opt-in detailed instrumentation: latency histograms, per slot/status counters, traffic, middleware timings
+        self.metrics: Optional[Metrics] = metrics if isinstance(metrics, Metrics) else Metrics() if metrics else None
+        # receivers of send phase timings (session, middleware hooks, limiter, network, body read)
+        self.instrument = instrument
+        self.instruments = [i for i in (self.metrics, instrument) if i is not None]
+        # cpu bound post-processing (decoding, parsing, callbacks) is offloaded here to keep event loop free for I/O:
+        # "thread", "process" or executor instance; None uses event loop's default thread pool
+        self._own_executor = isinstance(executor, str)
+        if executor == "thread":
+            executor = ThreadPoolExecutor(thread_name_prefix="requestr")
+        elif executor == "process":
+            executor = ProcessPoolExecutor()
+        elif isinstance(executor, str):
+            raise ValueError(f'unknown executor "{executor}", expected "thread" or "process"')
+        self.executor: Optional[Executor] = executor
+        # carrier of requests of slot sessions, aiohttp by default;
+        # slots selected by `http2` (True for all) are served by HTTP/2 sessions multiplexing requests over one connection
+        self.http2 = http2 if isinstance(http2, bool) else frozenset(http2)
+        self._http2_transport: Optional[Http2Transport] = None
+        if transport is None:
+            http2_session = isinstance(session_cls, type) and issubclass(session_cls, Http2Session)
+            transport = Http2Transport(session_cls) if http2_session else AiohttpTransport(session_cls)
+        self.transport = transport
+
+    @property
+    def connector(self) -> Optional[TCPConnector]:
+        """connector shared by all sessions if shared_connector is enabled"""
+        if not self.shared_connector:
+            return None
+        if self._connector is None or self._connector.closed:
+            log.info(f"starting shared connector {self.connector_kwargs}")
+            self._connector = TCPConnector(**self.connector_kwargs)
+        return self._connector
+
+    def uses_http2(self, slot: str) -> bool:
+        return self.http2 is True or (bool(self.http2) and slot in self.http2)
+
+    def transport_for(self, slot: str) -> Transport:
+        """transport new session of slot is created by"""
+        if not self.uses_http2(slot):
+            return self.transport
+        return self._transport_of(Http2Session)
+
+    def _transport_of(self, session_cls: Optional[Callable]) -> Optional[Transport]:
+        """transport that can serve sessions of `session_cls` when aiohttp can't"""
+        if not (isinstance(session_cls, type) and issubclass(session_cls, Http2Session)):
+            return None
+        if self._http2_transport is None:
+            self._http2_transport = Http2Transport()
+        return self._http2_transport
+
+    def pipeline(self, mwares: Union[Dict[int, Middleware], MiddlewarePipeline] = None) -> MiddlewarePipeline:
+        """
+        get compiled middleware pipeline for middleware dict;
+        pipelines are cached by dict identity and recompiled only when middleware set changes
+        """
+        if isinstance(mwares, MiddlewarePipeline):
+            return mwares
+        if mwares is None:
+            mwares = self.mwares
+        return self.pipelines.get(mwares)
 
     async def new_session(
         self,
@@ -57,6 +167,7 @@ class Downloader:
         session_cls: Type[Session] = None,
         limit=None,
         session_defaults=True,
+        transport: Transport = None,
         **session_kwargs,
     ) -> Session:
         """
@@ -72,166 +183,493 @@ class Downloader:
             [description], by default 120
         session_defaults : bool, optional
             [description], by default True
+        transport : Transport, optional
+            transport serving the session, by default one matching `session_cls` or `transport_for(key)`
 
         Returns
         -------
         Session
             [description]
         """
-        if not session_cls:
-            session_cls = self.session_cls
+        key = str(key)
+        if not transport:
+            transport = self._transport_of(session_cls) or self.transport_for(key)
+        elif session_cls is not None and self._transport_of(session_cls) and not isinstance(transport, Http2Transport):
+            raise TypeError(f"{session_cls} sessions can't be served by {transport}")
         if not limit:
             limit = self.limit
         if session_defaults:
             session_kwargs = {**self.session_kwargs, **session_kwargs}
-        key = str(key)
+        # connection pool and tracing are aiohttp's
+        aiohttp_session = isinstance(transport, AiohttpTransport)
+        if aiohttp_session and self.shared_connector and "connector" not in session_kwargs:
+            session_kwargs["connector"] = self.connector
+            session_kwargs["connector_owner"] = False
+        if aiohttp_session and self.metrics is not None:
+            session_kwargs["trace_configs"] = [
+                *session_kwargs.get("trace_configs", []),
+                self.metrics.trace_config(key),
+            ]
 
-        log.info(f"starting session {key} based on {session_cls}")
+        log.info(f"starting session {key} based on {session_cls or transport.session_cls}")
         self.stats["session/new"] += 1
-        try:
-            await self.sessions[key].close()
-            log.debug(f"closed existing session on {key}")
-        except KeyError:
-            pass
-
-        new_session = session_cls(**session_kwargs)
-        new_session.limiter = AsyncLimiter(limit, 1)
-        self.sessions[key] = new_session
-        return self.sessions[key]
-
-    async def _send(self, req: Request, session: Session):
-        async with session.limiter:
-            resp = await session._request(
-                method=req.method,
-                str_or_url=req.url,
-                params=req.params,
-                data=req.data,
-                json=req.json,
-                cookies=req.cookies,
-                headers=req.headers,
-                skip_auto_headers=req.skip_auto_headers,
-                auth=req.auth,
-                allow_redirects=req.allow_redirects,
-                max_redirects=req.max_redicrects,
-                compress=req.compress,
-                chunked=req.chuncked,
-                expect100=req.expect100,
-                raise_for_status=req.raise_for_status,
-                read_until_eof=req.read_unti_eof,
-                proxy=req.proxy,
-                proxy_auth=req.proxy_auth,
-                timeout=req.timeout,
-                verify_ssl=req.verify_ssl,
-                fingerprint=req.fingerprint,
-                ssl_context=req.ssl_context,
-                ssl=req.ssl,
-                proxy_headers=req.proxy_headers,
-                trace_request_ctx=req.trace_request_ctx,
-                read_bufsize=req.read_buffsize,
-            )
-        self.stats["req/sent"] += 1
-        resp = await Response.from_aiohttp(resp)
+        new_session = transport.new_session(session_cls, **session_kwargs)
+        new_session.limiter = self.scheduler.limiter(key, limit)
+        new_session.transport = transport
+        return await self.sessions.put(key, new_session)
+
+    async def get_session(self, key: str) -> Session:
+        """retrieve session of slot from session pool or start new one"""
+        session = self.sessions.get(key)
+        if session is None:
+            session = await self.new_session(key)
+        return session
+
+    async def offload(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        run `func(*args, **kwargs)` in downloader's executor, e.g. parse response off event loop:
+
+            data = await dl.offload(parse, resp)
+
+        for process executor `func` has to be picklable (module level) and responses are shipped
+        without their decoded caches; results are returned to the event loop the same way.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def _request(self, req: Request, session: Session) -> Any:
+        return await session.transport.request(req, session)
+
+    async def _send(self, req: Request, session: Session) -> Response:
+        if not self.coalesce or req.method.upper() not in self.coalesce_methods:
+            return await self._download(req, session)
+
+        key = (req.slot, request_fingerprint(req, headers=self.coalesce_headers))
+        inflight = self._inflight.get(key)
+        if inflight is None:
+            inflight = asyncio.ensure_future(self._download(req, session))
+            self._inflight[key] = inflight
+
+            def _done(future, key=key):
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+
+            inflight.add_done_callback(_done)
+        else:
+            log.debug(f"{req} joined identical in-flight request")
+            self.stats["req/coalesced"] += 1
+        # shielded so cancelling one of the callers doesn't cancel download for the rest
+        resp = await asyncio.shield(inflight)
+        return resp.copy(request=req)
+
+    async def _download(self, req: Request, session: Session) -> Response:
+        instrument = tracing.get()
+        queued = time()
+        await session.limiter.acquire(req.meta.get("priority", 0))
+        started = time()
+        if instrument is None:
+            resp = await self._request(req, session)
+            self.stats["req/sent"] += 1
+            resp = await session.transport.read(resp, session)
+        else:
+            instrument.record(phases.LIMITER, started - queued, req)
+            headers_at = perf_counter()
+            resp = await self._request(req, session)
+            self.stats["req/sent"] += 1
+            read_at = perf_counter()
+            instrument.record(phases.NETWORK, read_at - headers_at, req)
+            resp = await session.transport.read(resp, session)
+            instrument.record(phases.READ, perf_counter() - read_at, req)
+        resp.elapsed = time() - started
         resp.request = req
+        if self.metrics is not None:
+            slot = self.metrics.slot(req.slot)
+            self.metrics.observe("limiter_wait_seconds", started - queued, slot=slot)
+            self.metrics.observe("response_seconds", resp.elapsed, slot=slot)
+            self.metrics.inc("responses_total", slot=slot, status=resp.status)
         return resp
 
+    async def defer(self, seconds: float):
+        """
+        hold current request in delay queue; when sent through `send_many`
+        it gives up its place in concurrency window until it's due
+        """
+        window = _send_window.get()
+        if window is not None and _window_held.get():
+            window.release()
+            _window_held.set(False)
+        if self.metrics is not None:
+            self.metrics.inc("deferred_total")
+        await self.delayed.sleep(seconds)
+        if window is not None:
+            await window.acquire()
+            _window_held.set(True)
+
     async def send(
         self,
         req: Request,
         mwares: Dict[int, Middleware] = None,
     ) -> Response:
-        if mwares is None:
-            mwares = self.mwares
+        mwares = self.pipeline(mwares)
 
         log.debug(f'{req} on "{req.slot}"')
         self.stats["req/scheduled"] += 1
+        instrument = sampled(self.instruments, req) if self.instruments else None
+        tracing_token = tracing.set(instrument)
 
         _redirect_history = []
-        while len(_redirect_history) < self.mware_req_limit:
-            if req.slot not in self.sessions:
-                session = await self.new_session(req.slot)
-            else:
-                session = self.sessions[req.slot]
-
-            # request middleware
-            req_mid_result = await self.process_req(req, session=session, mwares=mwares)
-            if isinstance(req_mid_result, Request):
-                log.debug(f"{req} reformed to {req_mid_result} by req middleware")
-                _redirect_history.append(req)
-                self.stats["reqmid/return/req"] += 1
-                req = req_mid_result
-                continue
-            if isinstance(req_mid_result, Response):
-                log.debug(f"{req} redirected to local response {req_mid_result} by req middleware")
-                self.stats["reqmid/return/resp"] += 1
-                return req_mid_result
-            if req_mid_result is not None:
-                raise UnsupportedMwareReturn("unhandled request middleware return", req_mid_result)
-
-            # exception middleware
-            try:
-                resp = await self._send(req, session)
-            except Exception as e:
-                exc_mid_result = await self.process_resp_exception(e, req=req, session=session, mwares=mwares)
-                if isinstance(exc_mid_result, Request):
-                    log.debug(f"{req} exception {e} reformed to {exc_mid_result}")
-                    self.stats["respmid/exc/req"] += 1
+        session, slot = None, None
+        try:
+            while len(_redirect_history) < self.mware_req_limit:
+                if session is not None:
+                    await self.sessions.checkin(session, slot)
+                    session = None
+                if req.meta.get("delay"):
+                    await self.defer(req.meta.pop("delay"))
+                slot = req.slot
+                if instrument is None:
+                    session = self.sessions.checkout(await self.get_session(slot))
+                else:
+                    started = perf_counter()
+                    session = self.sessions.checkout(await self.get_session(slot))
+                    instrument.record(phases.SESSION, perf_counter() - started, req)
+
+                # request middleware
+                req_mid_result = await self.process_req(req, session=session, mwares=mwares)
+                if isinstance(req_mid_result, Request):
+                    log.debug(f"{req} reformed to {req_mid_result} by req middleware")
+                    _redirect_history.append(req)
+                    self.stats["reqmid/return/req"] += 1
+                    req = req_mid_result
+                    continue
+                if isinstance(req_mid_result, Response):
+                    log.debug(f"{req} redirected to local response {req_mid_result} by req middleware")
+                    self.stats["reqmid/return/resp"] += 1
+                    return req_mid_result
+                if req_mid_result is not None:
+                    raise UnsupportedMwareReturn("unhandled request middleware return", req_mid_result)
+
+                # exception middleware
+                try:
+                    resp = await self._send(req, session)
+                except Exception as e:
+                    exc_mid_result = await self.process_resp_exception(e, req=req, session=session, mwares=mwares)
+                    if isinstance(exc_mid_result, Request):
+                        log.debug(f"{req} exception {e} reformed to {exc_mid_result}")
+                        self.stats["respmid/exc/req"] += 1
+                        _redirect_history.append(req)
+                        req = exc_mid_result
+                        continue
+                    if isinstance(exc_mid_result, Response):
+                        log.debug(f"{req} exception {e} redirect to local response {exc_mid_result}")
+                        self.stats["respmid/exc/resp"] += 1
+                    if exc_mid_result is not None:
+                        raise UnsupportedMwareReturn("unhandled exception middleware return", req_mid_result)
+                    raise  # unhandled :(
+
+                # response middleware
+                resp_mid_result = await self.process_resp(resp, session=session, mwares=mwares)
+                if resp_mid_result is None:
+                    log.debug(f"{req} got {resp.status}")
+                    resp.request = req
+                    return resp
+                if isinstance(resp_mid_result, Request):
                     _redirect_history.append(req)
-                    req = exc_mid_result
+                    log.debug(f"{req} reformed to {resp_mid_result} by response middleware")
+                    self.stats["respmid/return/req"] += 1
+                    req = resp_mid_result
                     continue
-                if isinstance(exc_mid_result, Response):
-                    log.debug(f"{req} exception {e} redirect to local response {exc_mid_result}")
-                    self.stats["respmid/exc/resp"] += 1
-                if exc_mid_result is not None:
-                    raise UnsupportedMwareReturn("unhandled exception middleware return", req_mid_result)
-                raise  # unhandled :(
-
-            # response middleware
-            resp_mid_result = await self.process_resp(resp, session=session, mwares=mwares)
-            if resp_mid_result is None:
-                log.debug(f"{req} got {resp.status}")
-                resp.request = req
+                if isinstance(resp_mid_result, Response):
+                    log.debug(f"{req} redirected to local response {resp_mid_result} by response middleware")
+                    self.stats["respmid/return/resp"] += 1
+                    return resp_mid_result
+                if req_mid_result is not None:
+                    raise UnsupportedMwareReturn("unhandled response middleware return", resp_mid_result)
                 return resp
-            if isinstance(resp_mid_result, Request):
-                _redirect_history.append(req)
-                log.debug(f"{req} reformed to {resp_mid_result} by response middleware")
-                self.stats["respmid/return/req"] += 1
-                req = resp_mid_result
-                continue
-            if isinstance(resp_mid_result, Response):
-                log.debug(f"{req} redirected to local response {resp_mid_result} by response middleware")
-                self.stats["respmid/return/resp"] += 1
-                return resp_mid_result
-            if req_mid_result is not None:
-                raise UnsupportedMwareReturn("unhandled response middleware return", resp_mid_result)
+        finally:
+            if session is not None:
+                await self.sessions.checkin(session, slot)
+            tracing.reset(tracing_token)
+        raise MwareRedirectLimit(f"too many middleware redirects {self.mware_req_limit}", history=_redirect_history)
+
+    async def send_many(
+        self,
+        reqs: Union[Iterable[Request], AsyncIterable[Request]],
+        concurrency: int = 100,
+        ordered: bool = False,
+        return_exceptions: bool = False,
+        mwares: Dict[int, Middleware] = None,
+        callback: Callable[[Response], Any] = None,
+    ) -> AsyncIterator[Tuple[Request, Union[Response, Exception, Any]]]:
+        """
+        send many requests with at most `concurrency` of them in flight:
+
+            async for req, resp in dl.send_many(Request(url) for url in urls):
+                ...
+
+        requests are pulled lazily from (async) iterable only when there's free capacity,
+        results are yielded with their originating request either as they complete
+        or in original order when `ordered` is set.
+        With `return_exceptions` failures are yielded in place of responses rather than raised.
+        Requests waiting for delayed retry don't count towards `concurrency`; in `ordered` mode
+        finished requests waiting for earlier ones do, so results can't pile up behind slow request.
+        With `callback` its result is yielded in place of response, callback runs in `executor` (see `offload`)
+        after request has left the window so parsing doesn't hold up I/O.
+        """
+        if isinstance(reqs, AsyncIterable):
+            pending_reqs = reqs.__aiter__()
+
+            async def next_req():
+                return await pending_reqs.__anext__()
+
+        else:
+            pending_reqs = iter(reqs)
+
+            async def next_req():
+                try:
+                    return next(pending_reqs)
+                except StopIteration:
+                    raise StopAsyncIteration
+
+        window = SendWindow(concurrency)
+
+        async def run(req):
+            _send_window.set(window)
+            _window_held.set(True)
+            try:
+                resp = await self.send(req, mwares=mwares)
+            finally:
+                # request cancelled while deferred doesn't hold place it could release
+                if _window_held.get():
+                    window.release()
+            if callback is not None:
+                return await self.offload(callback, resp)
             return resp
+
+        def capped(inflight) -> bool:
+            # in order finished requests wait for earlier ones and hold memory until yielded
+            return ordered and len(inflight) >= concurrency
+
+        async def fill(inflight):
+            while not window.full and not capped(inflight):
+                try:
+                    req = await next_req()
+                except StopAsyncIteration:
+                    return False
+                window.reserve()
+                task = asyncio.ensure_future(run(req))
+                task.request = req
+                if ordered:
+                    inflight.append(task)
+                else:
+                    inflight.add(task)
+            return True
+
+        def result(task):
+            if task.cancelled() or not return_exceptions or task.exception() is None:
+                return task.request, task.result()
+            return task.request, task.exception()
+
+        inflight = deque() if ordered else set()
+        try:
+            more = await fill(inflight)
+            while inflight:
+                # wake up either on finished request or when deferred request frees up window
+                waiting = [inflight[0]] if ordered else list(inflight)
+                if more and not capped(inflight):
+                    waiting.append(window.freed())
+                await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+                if ordered:
+                    while inflight and inflight[0].done():
+                        yield result(inflight.popleft())
+                else:
+                    for task in [task for task in inflight if task.done()]:
+                        inflight.discard(task)
+                        yield result(task)
+                if more:
+                    more = await fill(inflight)
+        finally:
+            for task in inflight:
+                task.cancel()
+            if inflight:
+                await asyncio.gather(*inflight, return_exceptions=True)
+
+    @asynccontextmanager
+    async def stream(
+        self,
+        req: Request,
+        mwares: Dict[int, Middleware] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        decompress: bool = True,
+    ) -> AsyncIterator[StreamResponse]:
+        """
+        send request and stream response body instead of buffering it in memory:
+
+            async with dl.stream(Request(url)) as resp:
+                async for chunk in resp:
+                    ...
+
+        request and exception middlewares are applied same as in `send`,
+        response middlewares are skipped as response body is not available to them.
+        """
+        mwares = self.pipeline(mwares)
+
+        log.debug(f'streaming {req} on "{req.slot}"')
+        self.stats["req/scheduled"] += 1
+        tracing_token = tracing.set(sampled(self.instruments, req) if self.instruments else None)
+
+        _redirect_history = []
+        session, slot = None, None
+        try:
+            while len(_redirect_history) < self.mware_req_limit:
+                if session is not None:
+                    await self.sessions.checkin(session, slot)
+                    session = None
+                if req.meta.get("delay"):
+                    await self.defer(req.meta.pop("delay"))
+                slot = req.slot
+                session = self.sessions.checkout(await self.get_session(slot))
+
+                # request middleware
+                req_mid_result = await self.process_req(req, session=session, mwares=mwares)
+                if isinstance(req_mid_result, Request):
+                    log.debug(f"{req} reformed to {req_mid_result} by req middleware")
+                    _redirect_history.append(req)
+                    self.stats["reqmid/return/req"] += 1
+                    req = req_mid_result
+                    continue
+                if isinstance(req_mid_result, Response):
+                    log.debug(f"{req} redirected to local response {req_mid_result} by req middleware")
+                    self.stats["reqmid/return/resp"] += 1
+                    yield StreamResponse.from_response(req_mid_result, chunk_size=chunk_size)
+                    return
+                if req_mid_result is not None:
+                    raise UnsupportedMwareReturn("unhandled request middleware return", req_mid_result)
+
+                # exception middleware
+                try:
+                    queued = time()
+                    await session.limiter.acquire(req.meta.get("priority", 0))
+                    started = time()
+                    resp = await self._request(req, session)
+                except Exception as e:
+                    exc_mid_result = await self.process_resp_exception(e, req=req, session=session, mwares=mwares)
+                    if isinstance(exc_mid_result, Request):
+                        log.debug(f"{req} exception {e} reformed to {exc_mid_result}")
+                        self.stats["respmid/exc/req"] += 1
+                        _redirect_history.append(req)
+                        req = exc_mid_result
+                        continue
+                    if isinstance(exc_mid_result, Response):
+                        log.debug(f"{req} exception {e} redirect to local response {exc_mid_result}")
+                        self.stats["respmid/exc/resp"] += 1
+                        yield StreamResponse.from_response(exc_mid_result, chunk_size=chunk_size)
+                        return
+                    if exc_mid_result is not None:
+                        raise UnsupportedMwareReturn("unhandled exception middleware return", exc_mid_result)
+                    raise  # unhandled :(
+
+                self.stats["req/sent"] += 1
+                stream_resp = session.transport.stream(
+                    resp, session, request=req, chunk_size=chunk_size, decompress=decompress
+                )
+                if self.metrics is not None:
+                    self.metrics.observe("limiter_wait_seconds", started - queued, slot=self.metrics.slot(req.slot))
+                    self.metrics.inc("responses_total", slot=self.metrics.slot(req.slot), status=stream_resp.status)
+                log.debug(f"{req} got {stream_resp.status}, streaming body")
+                try:
+                    yield stream_resp
+                finally:
+                    await session.transport.release(resp, session)
+                return
+        finally:
+            if session is not None:
+                await self.sessions.checkin(session, slot)
+            tracing.reset(tracing_token)
         raise MwareRedirectLimit(f"too many middleware redirects {self.mware_req_limit}", history=_redirect_history)
 
-    async def process_req(self, req: Request, session: Session, mwares: List[Middleware]):
-        for mw in sorted(list(mwares)):
-            mw = mwares[mw]
-            if result := await mw.request(req=req, session=session, dl=self):
-                # TODO stats here
+    async def process_req(self, req: Request, session: Session, mwares: Union[Dict, MiddlewarePipeline] = None):
+        instrument = tracing.get()
+        for mw, hook in self.pipeline(mwares).request:
+            if instrument is None:
+                result = await hook(req=req, session=session, dl=self)
+            else:
+                started = perf_counter()
+                result = await hook(req=req, session=session, dl=self)
+                instrument.record(
+                    phases.MIDDLEWARE, perf_counter() - started, req, middleware=type(mw).__name__, hook="request"
+                )
+            if result:
                 return result
 
-    async def process_resp(self, resp: Response, session: Session, mwares: Dict[int, Middleware]):
-        for mw in sorted(list(mwares), reverse=True):
-            mw = mwares[mw]
-            if result := await mw.response(resp=resp, req=resp.request, session=session, dl=self):
-                # TODO stats here
+    async def process_resp(self, resp: Response, session: Session, mwares: Union[Dict, MiddlewarePipeline] = None):
+        instrument = tracing.get()
+        for mw, hook in self.pipeline(mwares).response:
+            if instrument is None:
+                result = await hook(resp=resp, req=resp.request, session=session, dl=self)
+            else:
+                started = perf_counter()
+                result = await hook(resp=resp, req=resp.request, session=session, dl=self)
+                instrument.record(
+                    phases.MIDDLEWARE,
+                    perf_counter() - started,
+                    resp.request,
+                    middleware=type(mw).__name__,
+                    hook="response",
+                )
+            if result:
                 return result
 
-    async def process_resp_exception(self, exc: Exception, req: Request, session: Session, mwares: List[Middleware]):
-        for mw in sorted(list(mwares), reverse=True):
-            mw = mwares[mw]
-            if result := await mw.response_exception(exc=exc, req=req, session=session, dl=self):
-                # TODO stats here
+    async def process_resp_exception(
+        self, exc: Exception, req: Request, session: Session, mwares: Union[Dict, MiddlewarePipeline] = None
+    ):
+        instrument = tracing.get()
+        for mw, hook in self.pipeline(mwares).response_exception:
+            if instrument is None:
+                result = await hook(exc=exc, req=req, session=session, dl=self)
+            else:
+                started = perf_counter()
+                result = await hook(exc=exc, req=req, session=session, dl=self)
+                instrument.record(
+                    phases.MIDDLEWARE,
+                    perf_counter() - started,
+                    req,
+                    middleware=type(mw).__name__,
+                    hook="response_exception",
+                )
+            if result:
                 return result
 
+    def gauges(self) -> Dict[str, Dict[Tuple, float]]:
+        """current state of downloader components for metric export"""
+        return {
+            "stats": {(("key", key),): value for key, value in self.stats.items()},
+            "session_pool": {(("key", key),): value for key, value in self.sessions.snapshot().items()},
+            "limiter": {(("key", key),): value for key, value in self.scheduler.stats.items()},
+            "inflight_coalesced": {(): len(self._inflight)},
+            "deferred": {(): len(self.delayed)},
+        }
+
+    def metrics_snapshot(self) -> Dict[str, Dict[str, object]]:
+        """snapshot of downloader metrics as dict"""
+        metrics = self.metrics if self.metrics is not None else Metrics()
+        return metrics.snapshot(gauges=self.gauges())
+
+    def prometheus(self) -> str:
+        """downloader metrics in Prometheus text exposition format"""
+        metrics = self.metrics if self.metrics is not None else Metrics()
+        return metrics.prometheus(gauges=self.gauges())
+
     async def close(self):
-        for key, session in self.sessions.items():
-            log.debug(f'closing session "{key}"')
-            await session.close()
-        self.sessions = {}
+        log.info(f"session pool: {self.sessions.snapshot()}")
+        await self.sessions.close()
+        for mw in (self.mwares or {}).values():
+            await mw.close()
+        if self._connector is not None and self.shared_connector is True:
+            await self._connector.close()
+            self._connector = None
+        if self._own_executor and self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
         self.stats["close"] = time()
         if self.stats.get("open"):
             self.stats["elapsed"] = self.stats["close"] - self.stats["open"]
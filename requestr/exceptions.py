@@ -14,6 +14,9 @@ class RequestFailed(Exception):
         self.args = args
         self.kwargs = kwargs
 
+    def __reduce__(self):
+        return type(self), (self.req, self.reason, *self.args)
+
 
 class RequestDropped(Exception):
     """
@@ -27,6 +30,10 @@ class RequestDropped(Exception):
         self.args = args
         self.kwargs = kwargs
 
+    def __reduce__(self):
+        return type(self), (self.req, self.reason, *self.args)
+
+
 class MwareRedirectLimit(Exception):
     def __init__(self, reason:str, history: List[Request], *args, **kwargs):
         self.reason = reason
@@ -0,0 +1,218 @@
+import asyncio
+import os
+import pickle
+import sqlite3
+from time import time
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Iterable, Optional, Tuple, Union
+
+from loguru import logger as log
+
+from requestr.middlewares import Middleware
+from requestr.request import Request
+from requestr.response import Response
+
+if TYPE_CHECKING:
+    from requestr.downloader import Downloader
+
+PENDING, IN_PROGRESS, DONE, FAILED = 0, 1, 2, 3
+STATES = {PENDING: "pending", IN_PROGRESS: "in_progress", DONE: "done", FAILED: "failed"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    id INTEGER PRIMARY KEY,
+    slot TEXT NOT NULL,
+    state INTEGER NOT NULL DEFAULT 0,
+    payload BLOB NOT NULL,
+    updated REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS requests_pending ON requests (slot, id) WHERE state = 0;
+CREATE INDEX IF NOT EXISTS requests_claimed ON requests (slot) WHERE state = 1;
+CREATE TABLE IF NOT EXISTS slots (
+    slot TEXT PRIMARY KEY,
+    pending INTEGER NOT NULL DEFAULT 0,
+    served INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS slots_ready ON slots (served) WHERE pending > 0;
+"""
+
+
+class Frontier:
+    """
+    Persistent queue of pending requests in sqlite database on disk:
+    - requests are stored pickled together with their `meta` (e.g. retry counters)
+    - dequeueing is fair across slots: slot served longest ago goes next
+    - completions are checkpointed, requests claimed but not completed
+      when process died are queued again when frontier is reopened
+    """
+
+    def __init__(self, path: Union[str, os.PathLike] = ".requestr_frontier.sqlite") -> None:
+        self.path = path
+        self.claimed = 0
+        self._db: Optional[sqlite3.Connection] = None
+        self._served = 0
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(str(self.path), isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(SCHEMA)
+            self._recover()
+        return self._db
+
+    def _recover(self):
+        """return requests claimed by previous run back to queue"""
+        db = self._db
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            claimed = db.execute("SELECT slot, COUNT(*) FROM requests WHERE state = 1 GROUP BY slot").fetchall()
+            if claimed:
+                log.info(f"frontier {self.path}: requeueing {sum(n for _, n in claimed)} unfinished requests")
+                db.execute("UPDATE requests SET state = 0 WHERE state = 1")
+                db.executemany("UPDATE slots SET pending = pending + ? WHERE slot = ?", [(n, s) for s, n in claimed])
+        self._served = db.execute("SELECT COALESCE(MAX(served), 0) FROM slots").fetchone()[0]
+
+    def push(self, req: Request) -> int:
+        """add request to queue; returns its frontier id"""
+        return self.push_many([req])[0]
+
+    def push_many(self, reqs: Iterable[Request]) -> list:
+        """add requests to queue in single transaction"""
+        db = self.db
+        ids = []
+        now = time()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            for req in reqs:
+                req.meta.pop("frontier_id", None)
+                payload = pickle.dumps(req, protocol=pickle.HIGHEST_PROTOCOL)
+                cursor = db.execute(
+                    "INSERT INTO requests (slot, state, payload, updated) VALUES (?, 0, ?, ?)", (req.slot, payload, now)
+                )
+                ids.append(cursor.lastrowid)
+                db.execute(
+                    "INSERT INTO slots (slot, pending) VALUES (?, 1) "
+                    "ON CONFLICT (slot) DO UPDATE SET pending = pending + 1",
+                    (req.slot,),
+                )
+        return ids
+
+    def pop(self) -> Optional[Request]:
+        """claim next request of slot served longest ago; None when queue is empty"""
+        db = self.db
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute("SELECT slot FROM slots WHERE pending > 0 ORDER BY served LIMIT 1").fetchone()
+            if row is None:
+                return None
+            slot = row[0]
+            req_id, payload = db.execute(
+                "SELECT id, payload FROM requests WHERE state = 0 AND slot = ? ORDER BY id LIMIT 1", (slot,)
+            ).fetchone()
+            self._served += 1
+            db.execute("UPDATE requests SET state = 1, updated = ? WHERE id = ?", (time(), req_id))
+            db.execute("UPDATE slots SET pending = pending - 1, served = ? WHERE slot = ?", (self._served, slot))
+        self.claimed += 1
+        req = pickle.loads(payload)
+        req.meta["frontier_id"] = req_id
+        return req
+
+    def _finish(self, req: Request, state: int, error: str = None, payload: bytes = None):
+        req_id = req.meta.pop("frontier_id")
+        self.db.execute(
+            "UPDATE requests SET state = ?, updated = ?, error = ?, payload = COALESCE(?, payload) WHERE id = ?",
+            (state, time(), error, payload, req_id),
+        )
+        self.claimed -= 1
+
+    def done(self, req: Request):
+        """checkpoint successful completion of claimed request"""
+        self._finish(req, DONE)
+
+    def failed(self, req: Request, error: Union[str, Exception]):
+        """checkpoint failure of claimed request, request is stored with its current meta"""
+        if isinstance(error, Exception):
+            error = f"{type(error).__name__}: {getattr(error, 'reason', error)}"
+        self._finish(req, FAILED, error, self._payload(req))
+
+    def release(self, req: Request):
+        """return claimed request back to queue with its current meta"""
+        db = self.db
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            self._finish(req, PENDING, payload=self._payload(req))
+            db.execute("UPDATE slots SET pending = pending + 1 WHERE slot = ?", (req.slot,))
+
+    @staticmethod
+    def _payload(req: Request) -> bytes:
+        req_id = req.meta.pop("frontier_id", None)
+        try:
+            return pickle.dumps(req, protocol=pickle.HIGHEST_PROTOCOL)
+        finally:
+            req.meta["frontier_id"] = req_id
+
+    async def crawl(
+        self,
+        dl: "Downloader",
+        concurrency: int = 100,
+        mwares: Dict[int, Middleware] = None,
+    ) -> AsyncIterator[Tuple[Request, Union[Response, Exception]]]:
+        """
+        send queued requests through downloader with at most `concurrency` in flight
+        and yield their results; request is checkpointed as done (or failed) once consumer
+        has processed its result, so new requests pushed while processing keep crawl going
+        """
+        inflight = set()
+        try:
+            while True:
+                while len(inflight) < concurrency:
+                    req = self.pop()
+                    if req is None:
+                        break
+                    task = asyncio.ensure_future(dl.send(req, mwares=mwares))
+                    task.request = req
+                    inflight.add(task)
+                if not inflight:
+                    return
+                done, _ = await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    inflight.discard(task)
+                    req = task.request
+                    if task.cancelled() or task.exception() is not None:
+                        error = asyncio.CancelledError() if task.cancelled() else task.exception()
+                        try:
+                            yield req, error
+                        finally:
+                            self.failed(req, error)
+                    else:
+                        try:
+                            yield req, task.result()
+                        finally:
+                            self.done(req)
+        finally:
+            for task in inflight:
+                task.cancel()
+            for task in inflight:
+                self.release(task.request)
+
+    def stats(self) -> Dict[str, int]:
+        """amount of requests in every state (scans whole table)"""
+        counts = dict(self.db.execute("SELECT state, COUNT(*) FROM requests GROUP BY state").fetchall())
+        return {name: counts.get(state, 0) for state, name in STATES.items()}
+
+    def __len__(self) -> int:
+        """amount of pending requests"""
+        return self.db.execute("SELECT COALESCE(SUM(pending), 0) FROM slots").fetchone()[0]
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
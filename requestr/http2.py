@@ -0,0 +1,204 @@
+"""
+HTTP/2 slot sessions: concurrent requests of a slot are multiplexed as streams over single connection
+per host rather than opening connection per in-flight request. Requires httpx with h2 support:
+
+    pip install httpx[http2]
+"""
+
+import asyncio
+import gzip
+from typing import Callable, Dict, Optional
+
+from aiohttp import BasicAuth, ClientConnectionError, ClientTimeout
+from loguru import logger as log
+from multidict import CIMultiDict
+from yarl import URL
+
+from requestr.request import Request
+from requestr.response import DEFAULT_CHUNK_SIZE, Response, StreamResponse
+from requestr.transport import Transport
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None
+
+
+def _timeout(timeout: ClientTimeout) -> "httpx.Timeout":
+    # httpx has no total timeout so it bounds every phase instead
+    return httpx.Timeout(
+        timeout.total,
+        connect=timeout.sock_connect or timeout.connect or timeout.total,
+        read=timeout.sock_read or timeout.total,
+    )
+
+
+def _auth(auth: Optional[BasicAuth]) -> Optional[tuple]:
+    return (auth.login, auth.password) if auth is not None else None
+
+
+class Http2Session:
+    """
+    Slot session speaking HTTP/2 that Downloader uses in place of aiohttp `ClientSession`,
+    request, response and middleware contract stay the same:
+
+        async with Downloader(http2=["example.com"]) as dl:
+            resp = await dl.send(Request("https://example.com"))
+
+    HTTP/2 is negotiated with ALPN over TLS, servers without it are spoken to in HTTP/1.1;
+    `prior_knowledge=True` speaks HTTP/2 right away, e.g. to cleartext (h2c) servers.
+    httpx binds proxy to client so session keeps client per proxy, all of them sharing one cookie jar.
+    Transport errors are raised as their aiohttp counterparts so retry middlewares handle them as usual.
+    aiohttp specific session and request options (ssl, compress, chunked etc.) are ignored.
+    """
+
+    def __init__(
+        self,
+        headers: Optional[Dict] = None,
+        cookies: Optional[Dict] = None,
+        timeout: Optional[ClientTimeout] = None,
+        max_connections: Optional[int] = None,
+        prior_knowledge: bool = False,
+        verify: bool = True,
+        **kwargs,
+    ) -> None:
+        if httpx is None:
+            raise ImportError("HTTP/2 sessions require httpx: pip install httpx[http2]")
+        if kwargs:
+            log.debug(f"HTTP/2 session ignores aiohttp session options {list(kwargs)}")
+        self.headers = headers
+        self.cookies = httpx.Cookies(cookies)
+        self.timeout = _timeout(timeout) if timeout is not None else httpx.Timeout(300)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.prior_knowledge = prior_knowledge
+        self.verify = verify
+        self._clients: Dict[Optional[str], httpx.AsyncClient] = {}
+        self._closed = False
+
+    def client(self, proxy: Optional[str] = None, proxy_auth: BasicAuth = None, proxy_headers: Dict = None):
+        """httpx client sending requests through proxy"""
+        key = str(proxy) if proxy else None
+        client = self._clients.get(key)
+        if client is None:
+            client = httpx.AsyncClient(
+                http2=True,
+                http1=not self.prior_knowledge,
+                headers=self.headers,
+                timeout=self.timeout,
+                limits=self.limits,
+                verify=self.verify,
+                proxy=httpx.Proxy(key, auth=_auth(proxy_auth), headers=proxy_headers) if key else None,
+            )
+            client.cookies.jar = self.cookies.jar
+            self._clients[key] = client
+        return client
+
+    async def request(self, req: Request) -> "httpx.Response":
+        """send request and return response once its headers arrive; body is read by `read` or `stream`"""
+        client = self.client(req.proxy, req.proxy_auth, req.proxy_headers)
+        data, content = (req.data, None) if isinstance(req.data, dict) else (None, req.data)
+        timeout = req.timeout
+        request = client.build_request(
+            req.method,
+            str(req.url),
+            params=req.params,
+            headers=req._headers,
+            cookies=req.cookies,
+            data=data,
+            content=content,
+            json=req.json,
+            timeout=_timeout(timeout) if isinstance(timeout, ClientTimeout) else httpx.USE_CLIENT_DEFAULT,
+        )
+        try:
+            return await client.send(
+                request, stream=True, auth=_auth(req.auth), follow_redirects=req.allow_redirects is not False
+            )
+        except httpx.TimeoutException as e:
+            raise asyncio.TimeoutError(str(e)) from e
+        except httpx.TransportError as e:
+            raise ClientConnectionError(str(e)) from e
+
+    @staticmethod
+    async def read(response: "httpx.Response", decompress: bool = True) -> Response:
+        """read whole body of response returned by `request`"""
+        try:
+            content = await response.aread()
+        except httpx.TimeoutException as e:
+            raise asyncio.TimeoutError(str(e)) from e
+        except httpx.TransportError as e:
+            raise ClientConnectionError(str(e)) from e
+        finally:
+            await response.aclose()
+        headers = CIMultiDict(response.headers.multi_items())
+        if decompress and headers.get("Content-Type") == "application/x-gzip":
+            content = gzip.decompress(content)
+        return Response(
+            url=URL(str(response.url)),
+            status=response.status_code,
+            content=content,
+            method=response.request.method,
+            headers=headers,
+        )
+
+    @staticmethod
+    def stream(
+        response: "httpx.Response",
+        request: Optional[Request] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        decompress: bool = True,
+    ) -> StreamResponse:
+        """stream body of response returned by `request`; response has to be closed with `release`"""
+        headers = CIMultiDict(response.headers.multi_items())
+        return StreamResponse(
+            url=URL(str(response.url)),
+            status=response.status_code,
+            chunks=response.aiter_bytes(chunk_size),
+            method=response.request.method,
+            headers=headers,
+            encoding=response.charset_encoding or "utf-8",
+            request=request,
+            decompress=decompress and headers.get("Content-Type") == "application/x-gzip",
+        )
+
+    @staticmethod
+    async def release(response: "httpx.Response"):
+        await response.aclose()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    async def close(self):
+        self._closed = True
+        clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            await client.aclose()
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(clients={len(self._clients)}, prior_knowledge={self.prior_knowledge})"
+
+
+class Http2Transport(Transport):
+    """transport serving slots with `Http2Session`, see `Downloader(http2=...)`"""
+
+    def __init__(self, session_cls: Callable = Http2Session) -> None:
+        self.session_cls = session_cls
+
+    async def request(self, req: Request, session: Http2Session) -> "httpx.Response":
+        return await session.request(req)
+
+    async def read(self, raw: "httpx.Response", session: Http2Session) -> Response:
+        return await session.read(raw)
+
+    def stream(
+        self,
+        raw: "httpx.Response",
+        session: Http2Session,
+        request: Optional[Request] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        decompress: bool = True,
+    ) -> StreamResponse:
+        return session.stream(raw, request=request, chunk_size=chunk_size, decompress=decompress)
+
+    async def release(self, raw: "httpx.Response", session: Http2Session):
+        await session.release(raw)
@@ -0,0 +1,102 @@
+import random
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+from requestr.metrics import DEFAULT_BUCKETS, Histogram
+
+if TYPE_CHECKING:
+    from requestr.request import Request
+
+# phases of Downloader.send
+SESSION = "session"  # session lookup or creation
+MIDDLEWARE = "middleware"  # single middleware hook, labeled with middleware class and hook name
+LIMITER = "limiter"  # waiting for rate limiter
+NETWORK = "network"  # sending request until response headers arrive
+READ = "read"  # reading and decompressing response body
+
+# hooks and lookups take microseconds so buckets start well below default ones
+PROFILE_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025) + DEFAULT_BUCKETS
+
+
+class Instrument:
+    """
+    Receiver of `Downloader.send` phase timings. Downloader asks `sample` once per request
+    and only sampled requests are timed, so requests that aren't sampled pay no timing overhead.
+    """
+
+    def sample(self, req: "Request") -> bool:
+        return True
+
+    def record(self, phase: str, seconds: float, req: "Request", **labels):
+        pass
+
+
+class Instruments(Instrument):
+    """fan out of timings to several instruments that sampled the same request"""
+
+    def __init__(self, instruments: Iterable[Instrument]) -> None:
+        self.instruments = list(instruments)
+
+    def record(self, phase: str, seconds: float, req: "Request", **labels):
+        for instrument in self.instruments:
+            instrument.record(phase, seconds, req, **labels)
+
+
+def sampled(instruments: List[Instrument], req: "Request") -> Optional[Instrument]:
+    """instrument receiving timings of request or None when no instrument sampled it"""
+    picked = [instrument for instrument in instruments if instrument.sample(req)]
+    if not picked:
+        return None
+    return picked[0] if len(picked) == 1 else Instruments(picked)
+
+
+# instrument of request being sent in current task
+tracing: ContextVar[Optional[Instrument]] = ContextVar("tracing", default=None)
+
+
+class Profiler(Instrument):
+    """
+    Aggregates phase timings of `sample_rate` share of requests per phase and middleware class
+    to find where send time goes, e.g. slow custom middleware:
+
+        profiler = Profiler(sample_rate=0.05)
+        async with Downloader(instrument=profiler) as dl:
+            ...
+        print(profiler.report())
+    """
+
+    def __init__(self, sample_rate: float = 1.0, buckets: Tuple[float, ...] = PROFILE_BUCKETS) -> None:
+        self.sample_rate = sample_rate
+        self.buckets = buckets
+        self.sampled = 0
+        self.timings: Dict[Tuple[str, str], Histogram] = {}
+
+    def sample(self, req: "Request") -> bool:
+        if self.sample_rate >= 1 or random.random() < self.sample_rate:
+            self.sampled += 1
+            return True
+        return False
+
+    def record(self, phase: str, seconds: float, req: "Request", middleware: str = "", hook: str = "", **labels):
+        key = (phase, f"{middleware}.{hook}" if middleware else "")
+        try:
+            histogram = self.timings[key]
+        except KeyError:
+            histogram = self.timings[key] = Histogram(self.buckets)
+        histogram.observe(seconds)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """timings of every phase ordered by total time spent in it"""
+        ordered = sorted(self.timings.items(), key=lambda item: item[1].sum, reverse=True)
+        return {f"{phase}/{name}" if name else phase: histogram.snapshot() for (phase, name), histogram in ordered}
+
+    def report(self) -> str:
+        """human readable table of snapshot"""
+        lines = [f"{'phase':<50} {'count':>8} {'total s':>10} {'p50 ms':>9} {'p99 ms':>9}"]
+        for name, timing in self.snapshot().items():
+            lines.append(
+                f"{name:<50} {timing['count']:>8} {timing['sum']:>10.3f} "
+                f"{timing['p50'] * 1000:>9.2f} {timing['p99'] * 1000:>9.2f}"
+            )
+        lines.append(f"sampled requests: {self.sampled}")
+        return "\n".join(lines)
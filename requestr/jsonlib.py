@@ -0,0 +1,164 @@
+"""
+JSON decoding backend: fastest available of orjson, simdjson, ujson and stdlib json,
+all of them decode utf-8 bytes directly so response bodies don't need to be decoded to text first.
+"""
+
+import json
+import re
+from typing import Any, Callable, Dict, List, Union
+
+BACKENDS: Dict[str, Callable[[Union[bytes, str]], Any]] = {}
+
+try:
+    import orjson
+
+    BACKENDS["orjson"] = orjson.loads
+except ImportError:
+    pass
+try:
+    import simdjson
+
+    BACKENDS["simdjson"] = simdjson.loads
+except ImportError:
+    pass
+try:
+    import ujson
+
+    BACKENDS["ujson"] = ujson.loads
+except ImportError:
+    pass
+BACKENDS["json"] = json.loads
+
+backend: str = next(iter(BACKENDS))
+_loads = BACKENDS[backend]
+
+
+def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    """decode json document with selected backend"""
+    return _loads(data)
+
+
+def use(name: str):
+    """select json backend by name, e.g. `use("json")` for stdlib"""
+    global backend, _loads
+    try:
+        _loads = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f'json backend "{name}" is not available, expected one of {list(BACKENDS)}') from None
+    backend = name
+
+
+class JsonArraySplitter:
+    """
+    Splits top level json array into raw encoded items as it's fed with chunks,
+    so items can be decoded one by one without holding whole document:
+
+        splitter = JsonArraySplitter()
+        for chunk in chunks:
+            for item in splitter.feed(chunk):
+                print(loads(item))
+        splitter.close()
+    """
+
+    token_re = re.compile(rb'["\[\]{},]')
+    string_special_re = re.compile(rb'["\\]')
+    whitespace = b" \t\r\n"
+
+    def __init__(self) -> None:
+        self.buffer = bytearray()
+        self.pos = 0  # scan position in buffer
+        self.start = 0  # start of current item in buffer
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False  # string chunk ended with backslash escaping first byte of next one
+        self.emitted = 0
+        self.opened = False
+        self.closed = False
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        """add chunk of document; returns items completed by it"""
+        if self.closed:
+            if chunk.strip(self.whitespace):
+                raise ValueError("data after end of json array")
+            return []
+        buffer = self.buffer
+        buffer += chunk
+        items = []
+        if not self.opened:
+            stripped = buffer.lstrip(self.whitespace)
+            if not stripped:
+                return items
+            if stripped[:1] != b"[":
+                raise ValueError("json document is not an array")
+            self.opened = True
+            self.pos = self.start = len(buffer) - len(stripped) + 1
+            self.depth = 1
+        while not self.closed:
+            if self.in_string:
+                if not self._string_end(buffer):
+                    break  # string continues in next chunk
+                self.in_string = False
+                continue
+            match = self.token_re.search(buffer, self.pos)
+            if match is None:
+                self.pos = len(buffer)
+                break
+            token, i = match.group(), match.start()
+            self.pos = i + 1
+            if token == b'"':
+                self.in_string = True
+            elif token in b"[{":
+                self.depth += 1
+            elif token in b"]}":
+                self.depth -= 1
+                if self.depth == 0:
+                    # item after last comma is required, `[1,]` is invalid
+                    self._emit(items, i, required=self.emitted > 0)
+                    self.closed = True
+                    if buffer[self.pos :].strip(self.whitespace):
+                        raise ValueError("data after end of json array")
+            elif self.depth == 1:  # comma between top level items
+                self._emit(items, i, required=True)
+                self.start = i + 1
+        # drop consumed part of buffer
+        if self.start:
+            del buffer[: self.start]
+            self.pos -= self.start
+            self.start = 0
+        return items
+
+    def _string_end(self, buffer: bytearray) -> bool:
+        """move scan position past end of current string; scanned part of unfinished string isn't rescanned"""
+        pos = self.pos
+        if self.escaped:
+            if pos >= len(buffer):
+                return False
+            pos += 1
+            self.escaped = False
+        while True:
+            match = self.string_special_re.search(buffer, pos)
+            if match is None:
+                self.pos = len(buffer)
+                return False
+            i = match.start()
+            if match.group() == b'"':
+                self.pos = i + 1
+                return True
+            if i + 1 >= len(buffer):
+                self.escaped = True
+                self.pos = len(buffer)
+                return False
+            pos = i + 2  # skip escaped byte
+
+    def _emit(self, items: List[bytes], end: int, required: bool):
+        item = bytes(self.buffer[self.start : end]).strip(self.whitespace)
+        if item:
+            items.append(item)
+            self.emitted += 1
+        elif required:
+            raise ValueError("empty item in json array")
+
+    def close(self):
+        """check document was complete"""
+        if not self.closed:
+            raise ValueError("incomplete json array")
@@ -0,0 +1,216 @@
+import random
+from bisect import bisect_left
+from time import perf_counter
+from types import SimpleNamespace
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from aiohttp import TraceConfig
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """streaming histogram of observations in fixed buckets"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """estimate quantile by interpolating inside bucket"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def snapshot(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    labels = list(labels)
+    if not labels:
+        return ""
+    escaped = (
+        key + '="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"' for key, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class Metrics:
+    """
+    Registry of labeled counters and histograms exportable with gauges
+    as snapshot dict or Prometheus text exposition format at any time.
+    With `per_slot` disabled slot labels are collapsed to keep cardinality low on broad crawls,
+    otherwise slots beyond first `max_slots` share `OVERFLOW_SLOT` label.
+    Request and response byte counters hook every body chunk so they're recorded only with `traffic` enabled.
+    Middleware hook timings are taken of `sample_rate` share of requests only.
+    """
+
+    OVERFLOW_SLOT = "_other"
+
+    def __init__(
+        self,
+        prefix: str = "requestr",
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+        per_slot: bool = True,
+        max_slots: int = 100,
+        traffic: bool = False,
+        sample_rate: float = 0.01,
+    ):
+        self.prefix = prefix
+        self.buckets = buckets
+        self.per_slot = per_slot
+        self.max_slots = max_slots
+        self.traffic = traffic
+        self.sample_rate = sample_rate
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._slots: Set[str] = set()
+
+    def slot(self, slot: str) -> str:
+        if not self.per_slot:
+            return "*"
+        if slot in self._slots:
+            return slot
+        if len(self._slots) < self.max_slots:
+            self._slots.add(slot)
+            return slot
+        return self.OVERFLOW_SLOT
+
+    def inc(self, name: str, value: float = 1, **labels):
+        try:
+            series = self.counters[name]
+        except KeyError:
+            series = self.counters[name] = {}
+        key = _labels(labels)
+        series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        try:
+            histograms = self.histograms[name]
+        except KeyError:
+            histograms = self.histograms[name] = {}
+        key = _labels(labels)
+        try:
+            histogram = histograms[key]
+        except KeyError:
+            histogram = histograms[key] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def sample(self, req) -> bool:
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def record(self, phase: str, seconds: float, req, **labels):
+        """`requestr.instrument.Instrument` receiver: middleware hook timings, other phases have own metrics"""
+        if phase == "middleware":
+            self.observe("middleware_seconds", seconds, **labels)
+
+    def trace_config(self, slot: str) -> TraceConfig:
+        """aiohttp trace config recording connection phase timings and traffic of session"""
+        slot = self.slot(slot)
+        trace = TraceConfig(trace_config_ctx_factory=SimpleNamespace)
+
+        async def on_request_start(session, ctx, params):
+            ctx.start = perf_counter()
+
+        async def on_dns_start(session, ctx, params):
+            ctx.dns_start = perf_counter()
+
+        async def on_dns_end(session, ctx, params):
+            self.observe("dns_seconds", perf_counter() - ctx.dns_start, slot=slot)
+
+        async def on_connect_start(session, ctx, params):
+            ctx.connect_start = perf_counter()
+
+        async def on_connect_end(session, ctx, params):
+            self.observe("connect_seconds", perf_counter() - ctx.connect_start, slot=slot)
+
+        async def on_request_end(session, ctx, params):
+            self.observe("ttfb_seconds", perf_counter() - ctx.start, slot=slot)
+
+        async def on_chunk_sent(session, ctx, params):
+            self.inc("bytes_out_total", len(params.chunk), slot=slot)
+
+        async def on_chunk_received(session, ctx, params):
+            self.inc("bytes_in_total", len(params.chunk), slot=slot)
+
+        async def on_exception(session, ctx, params):
+            self.inc("request_exceptions_total", slot=slot, exception=type(params.exception).__name__)
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_dns_resolvehost_start.append(on_dns_start)
+        trace.on_dns_resolvehost_end.append(on_dns_end)
+        trace.on_connection_create_start.append(on_connect_start)
+        trace.on_connection_create_end.append(on_connect_end)
+        trace.on_request_end.append(on_request_end)
+        if self.traffic:
+            trace.on_request_chunk_sent.append(on_chunk_sent)
+            trace.on_response_chunk_received.append(on_chunk_received)
+        trace.on_request_exception.append(on_exception)
+        return trace
+
+    def snapshot(self, gauges: Dict[str, Dict[Labels, float]] = None) -> Dict[str, Dict[str, object]]:
+        """all metrics and given gauges as {name: {formatted labels: value}}"""
+        result = {}
+        for name, series in self.counters.items():
+            result[name] = {_format_labels(labels): value for labels, value in series.items()}
+        for name, series in self.histograms.items():
+            result[name] = {_format_labels(labels): histogram.snapshot() for labels, histogram in series.items()}
+        for name, series in (gauges or {}).items():
+            result[name] = {_format_labels(labels): value for labels, value in series.items()}
+        return result
+
+    def prometheus(self, gauges: Dict[str, Dict[Labels, float]] = None) -> str:
+        """metrics and given gauges in Prometheus text exposition format"""
+        lines = []
+        for name, series in self.counters.items():
+            name = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in series.items():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        for name, series in self.histograms.items():
+            name = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        for name, series in (gauges or {}).items():
+            name = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in series.items():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
@@ -16,6 +16,11 @@ if TYPE_CHECKING:
 
 
 class Middleware:
+    # observers watch outcomes without ever returning from response hooks: their response and
+    # response_exception hooks run ahead of the rest of the chain, so retry middlewares
+    # (or any other middleware that short-circuits it) can't hide responses and exceptions from them
+    observer = False
+
     def __init__(self) -> None:
         self.log = logging.getLogger(type(self).__name__)
 
@@ -49,7 +54,15 @@ class Middleware:
         """
         return
 
+    async def close(self):
+        """release resources held by middleware, called when Downloader closes"""
+        return
+
 
 from requestr.middlewares.headers import RandomUserAgent
-from requestr.middlewares.proxy import RotatingProxyPool
+from requestr.middlewares.proxy import ManagedProxyPool, RotatingProxyPool
 from requestr.middlewares.retry import RetryStatuses, RetryExceptions
+from requestr.middlewares.cache import HttpCache
+from requestr.middlewares.throttle import AutoThrottle
+from requestr.middlewares.dedup import Dedup
+from requestr.middlewares.archive import ArchiveRecorder
@@ -0,0 +1,50 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Optional, Tuple, Union
+
+from requestr.archive import Archive
+from requestr.middlewares import Middleware
+from requestr.request import Request
+from requestr.response import Response
+from requestr.session import Session
+
+if TYPE_CHECKING:
+    from requestr.downloader import Downloader
+
+
+class ArchiveRecorder(Middleware):
+    """
+    middleware that records every response passing through downloader with its request and timing
+    to Archive; responses replayed from archive and ones not in `statuses` (all by default) are skipped.
+    Place it before middlewares that replace responses to record them as received.
+    Compression and writes run in recorder's own thread so they don't block event loop.
+    """
+
+    def __init__(
+        self,
+        archive: Union[Archive, str, os.PathLike] = ".requestr_archive",
+        statuses: Optional[Tuple[int, ...]] = None,
+    ) -> None:
+        super().__init__()
+        self.archive = archive if isinstance(archive, Archive) else Archive(archive)
+        self.statuses = statuses
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def response(self, resp: Response, req: Request, session: Session, dl: "Downloader", **meta):
+        if req is None or resp.meta.get("archived"):
+            return
+        if self.statuses and resp.status not in self.statuses:
+            return
+        if self._executor is None:
+            # single thread keeps appends to archive in order
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="requestr-archive")
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.archive.write, req, resp)
+        dl.stats["archive/recorded"] += 1
+
+    async def close(self):
+        if self._executor is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self.archive.close)
+            self._executor.shutdown()
+            self._executor = None
+        self.archive.close()
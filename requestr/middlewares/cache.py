@@ -0,0 +1,212 @@
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from time import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Tuple, Union
+
+from multidict import CIMultiDict
+from yarl import URL
+
+from requestr.middlewares import Middleware
+from requestr.request import Request
+from requestr.response import Response
+from requestr.session import Session
+from requestr.utils import request_fingerprint
+
+if TYPE_CHECKING:
+    from requestr.downloader import Downloader
+
+max_age_re = re.compile(r"(?:^|,)\s*(?:s-maxage|max-age)\s*=\s*\"?(\d+)", re.I)
+# headers describing wire body which is stored decoded
+wire_headers = ("Content-Encoding", "Content-Length", "Transfer-Encoding")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    method TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    content BLOB NOT NULL,
+    encoding TEXT NOT NULL,
+    stored REAL NOT NULL,
+    expires REAL NOT NULL,
+    etag TEXT,
+    last_modified TEXT
+)
+"""
+
+
+class HttpCache(Middleware):
+    """
+    middleware that caches responses in sqlite database on disk:
+    - fresh cached responses are returned without sending request
+    - stale responses with ETag or Last-Modified are revalidated with conditional request
+      and 304 Not Modified response is answered from cache
+    freshness is taken from Cache-Control max-age or falls back to `ttl` seconds;
+    responses with Cache-Control no-store are never stored.
+    Database access and compression run in cache's own thread so they don't block event loop.
+    """
+
+    cacheable_statuses = (200, 203, 300, 301, 308, 404, 410)
+
+    def __init__(
+        self,
+        path: Union[str, os.PathLike] = ".requestr_cache.sqlite",
+        ttl: float = 3600,
+        methods: Tuple[str, ...] = ("GET", "HEAD"),
+        statuses: Tuple[int, ...] = None,
+        respect_cache_control: bool = True,
+        compress: bool = True,
+    ) -> None:
+        super().__init__()
+        self.path = path
+        self.ttl = ttl
+        self.methods = methods
+        self.statuses = statuses or self.cacheable_statuses
+        self.respect_cache_control = respect_cache_control
+        self.compress = compress
+        self._db: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            # connection is used from cache's thread, `purge` may be called from any
+            self._db = sqlite3.connect(str(self.path), isolation_level=None, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(SCHEMA)
+        return self._db
+
+    async def _run(self, func: Callable, *args) -> Any:
+        """run blocking cache operation in cache's single thread, sqlite connection stays in it"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="requestr-cache")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(func, *args))
+
+    def _validators(self, key: str) -> Optional[Tuple[float, Optional[str], Optional[str]]]:
+        return self.db.execute("SELECT expires, etag, last_modified FROM responses WHERE key = ?", (key,)).fetchone()
+
+    def _refresh(self, key: str, expires: float, req: Request) -> Optional[Response]:
+        self.db.execute("UPDATE responses SET expires = ? WHERE key = ?", (expires, key))
+        return self.load(key, req)
+
+    async def request(self, req: Request, session: Session, dl: "Downloader", **meta):
+        if req.method.upper() not in self.methods or req.meta.get("cache") is False:
+            return
+        key = request_fingerprint(req)
+        row = await self._run(self._validators, key)
+        if row is None:
+            dl.stats["cache/miss"] += 1
+            return
+        expires, etag, last_modified = row
+        if expires > time():
+            dl.stats["cache/hit"] += 1
+            return await self._run(self.load, key, req)
+        if etag or last_modified:
+            # stale entry: ask server whether it has changed
+            req.meta["cache_revalidate"] = key
+            if etag:
+                req.headers["If-None-Match"] = etag
+            if last_modified:
+                req.headers["If-Modified-Since"] = last_modified
+            dl.stats["cache/revalidate"] += 1
+        else:
+            dl.stats["cache/expired"] += 1
+
+    async def response(self, resp: Response, req: Request, session: Session, dl: "Downloader", **meta):
+        if req is None or req.method.upper() not in self.methods or req.meta.get("cache") is False:
+            return
+        key = req.meta.pop("cache_revalidate", None)
+        if key and resp.status == 304:
+            dl.stats["cache/not_modified"] += 1
+            return await self._run(self._refresh, key, self._expires(resp.headers), req)
+        if resp.status not in self.statuses:
+            return
+        expires = self._expires(resp.headers)
+        if expires is None:
+            return
+        await self._run(self.store, key or request_fingerprint(req), resp, expires)
+        dl.stats["cache/store"] += 1
+
+    def _expires(self, headers: Dict) -> Optional[float]:
+        """expiration timestamp of response or None if it shouldn't be stored"""
+        if not self.respect_cache_control:
+            return time() + self.ttl
+        cache_control = headers.get("Cache-Control", "").lower()
+        if "no-store" in cache_control:
+            return None
+        if "no-cache" in cache_control:
+            return time()  # store for revalidation only
+        match = max_age_re.search(cache_control)
+        return time() + (int(match.group(1)) if match else self.ttl)
+
+    def store(self, key: str, resp: Response, expires: float):
+        content = zlib.compress(resp.content, 1) if self.compress else resp.content
+        headers = [(name, value) for name, value in resp.headers.items() if name.title() not in wire_headers]
+        headers = json.dumps(headers + [("Content-Length", str(len(resp.content)))])
+        self.db.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                key,
+                str(resp.url),
+                resp.method,
+                resp.status,
+                headers,
+                content,
+                resp.encoding,
+                time(),
+                expires,
+                resp.headers.get("ETag"),
+                resp.headers.get("Last-Modified"),
+            ),
+        )
+
+    def load(self, key: str, req: Request = None) -> Optional[Response]:
+        row = self.db.execute(
+            "SELECT url, method, status, headers, content, encoding FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        url, method, status, headers, content, encoding = row
+        if self.compress:
+            content = zlib.decompress(content)
+        return Response(
+            url=URL(url),
+            status=status,
+            content=content,
+            method=method,
+            headers=CIMultiDict(json.loads(headers)),
+            encoding=encoding,
+            request=req,
+            meta={"cached": True},
+        )
+
+    def purge(self, expired_only: bool = True) -> int:
+        """remove entries from cache; returns amount of removed entries"""
+        if expired_only:
+            # entries with validators can still be revalidated
+            cursor = self.db.execute(
+                "DELETE FROM responses WHERE expires < ? AND etag IS NULL AND last_modified IS NULL", (time(),)
+            )
+        else:
+            cursor = self.db.execute("DELETE FROM responses")
+        return cursor.rowcount
+
+    def _close_db(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    async def close(self):
+        if self._executor is not None:
+            await self._run(self._close_db)
+            self._executor.shutdown()
+            self._executor = None
+        self._close_db()
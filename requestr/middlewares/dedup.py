@@ -0,0 +1,203 @@
+import heapq
+import math
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Iterable, Tuple, Union
+
+from requestr.exceptions import RequestDropped
+from requestr.middlewares import Middleware
+from requestr.request import Request
+from requestr.session import Session
+from requestr.utils import request_fingerprint
+
+if TYPE_CHECKING:
+    from requestr.downloader import Downloader
+
+
+class ExactFilter:
+    """
+    set of 64 bit fingerprint prefixes kept in sorted array (8 bytes per entry)
+    with unsorted buffer of recent additions that's merged in once it grows.
+    Chance of two different fingerprints colliding stays below 1e-5 for 10 million entries.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike] = None, buffer_size: int = 2**16) -> None:
+        self.path = path
+        self.buffer_size = buffer_size
+        self._sorted = array("Q")
+        self._buffer = set()
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                self._sorted.frombytes(f.read())
+
+    @staticmethod
+    def _key(fp: bytes) -> int:
+        return int.from_bytes(fp[:8], "little")
+
+    def _contains(self, key: int) -> bool:
+        if key in self._buffer:
+            return True
+        i = bisect_left(self._sorted, key)
+        return i < len(self._sorted) and self._sorted[i] == key
+
+    def add(self, fp: bytes) -> bool:
+        """add fingerprint; returns whether it was seen before"""
+        key = self._key(fp)
+        if self._contains(key):
+            return True
+        self._buffer.add(key)
+        # merging is linear so buffer grows with filter to keep additions amortized O(1)
+        if len(self._buffer) >= max(self.buffer_size, len(self._sorted) >> 4):
+            self._merge()
+        return False
+
+    def _merge(self):
+        self._sorted = array("Q", heapq.merge(self._sorted, sorted(self._buffer)))
+        self._buffer.clear()
+
+    def __contains__(self, fp: bytes) -> bool:
+        return self._contains(self._key(fp))
+
+    def __len__(self) -> int:
+        return len(self._sorted) + len(self._buffer)
+
+    def save(self):
+        if not self.path:
+            return
+        self._merge()
+        with open(self.path, "wb") as f:
+            self._sorted.tofile(f)
+
+    def close(self):
+        self.save()
+
+
+class BloomFilter:
+    """
+    Bloom filter sized for `capacity` entries at `error_rate` false positive rate.
+    With `path` bits live in memory mapped file so filter is persisted as it's filled
+    and reopening existing file keeps its original size.
+    """
+
+    header = struct.Struct("<4sIQQ")  # magic, hashes, bits, count
+    magic = b"RQBF"
+
+    def __init__(
+        self, capacity: int = 10_000_000, error_rate: float = 0.001, path: Union[str, os.PathLike] = None
+    ) -> None:
+        self.path = path
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.count = 0
+        self._file = None
+        if path:
+            self._open(path)
+        else:
+            self._bits = bytearray(self.header.size + (self.bits + 7) // 8)
+
+    def _open(self, path):
+        size = self.header.size + (self.bits + 7) // 8
+        exists = os.path.exists(path) and os.path.getsize(path) >= self.header.size
+        self._file = open(path, "r+b" if exists else "w+b")
+        if exists:
+            magic, self.hashes, self.bits, self.count = self.header.unpack(self._file.read(self.header.size))
+            if magic != self.magic:
+                self._file.close()
+                raise ValueError(f"{path} is not a bloom filter file")
+        else:
+            self._file.truncate(size)
+            self._file.write(self.header.pack(self.magic, self.hashes, self.bits, 0))
+            self._file.flush()
+        self._bits = mmap.mmap(self._file.fileno(), 0)
+
+    def _indexes(self, fp: bytes) -> Iterable[int]:
+        # double hashing: k indexes from two 64 bit halves of fingerprint
+        h1 = int.from_bytes(fp[:8], "little")
+        h2 = int.from_bytes(fp[8:16], "little") | 1
+        offset = self.header.size * 8
+        for i in range(self.hashes):
+            yield offset + (h1 + i * h2) % self.bits
+
+    def add(self, fp: bytes) -> bool:
+        """add fingerprint; returns whether it was (probably) seen before"""
+        seen = True
+        bits = self._bits
+        for index in self._indexes(fp):
+            byte, mask = index >> 3, 1 << (index & 7)
+            if not bits[byte] & mask:
+                bits[byte] |= mask
+                seen = False
+        if not seen:
+            self.count += 1
+        return seen
+
+    def __contains__(self, fp: bytes) -> bool:
+        bits = self._bits
+        return all(bits[index >> 3] & (1 << (index & 7)) for index in self._indexes(fp))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def save(self):
+        if self._file is None:
+            return
+        self._bits[: self.header.size] = self.header.pack(self.magic, self.hashes, self.bits, self.count)
+        self._bits.flush()
+
+    def close(self):
+        if self._file is None:
+            return
+        self.save()
+        self._bits.close()
+        self._file.close()
+        self._file = None
+
+
+class Dedup(Middleware):
+    """
+    middleware that drops requests equivalent to already seen ones with `RequestDropped`;
+    requests are equivalent when method, canonical url (params merged, query sorted, no fragment),
+    body and values of selected `headers` match.
+    - "exact" mode keeps 8 bytes per seen request
+    - "bloom" mode keeps roughly 1.2 bytes per request at 1% `error_rate`
+      but drops that share of unseen requests as false positives
+    `path` persists seen requests across runs; set `meta["dont_filter"]` to let request through.
+    """
+
+    def __init__(
+        self,
+        mode: str = "exact",
+        path: Union[str, os.PathLike] = None,
+        capacity: int = 10_000_000,
+        error_rate: float = 0.001,
+        headers: Tuple[str, ...] = (),
+    ) -> None:
+        super().__init__()
+        if mode == "exact":
+            self.filter = ExactFilter(path)
+        elif mode == "bloom":
+            self.filter = BloomFilter(capacity, error_rate, path)
+        else:
+            raise ValueError(f'unknown dedup mode "{mode}", expected "exact" or "bloom"')
+        self.headers = headers
+
+    async def request(self, req: Request, session: Session, dl: "Downloader", **meta):
+        if req.meta.get("dont_filter"):
+            return
+        fp = request_fingerprint(req, self.headers)
+        # request middlewares run again for retries of already admitted request
+        if req.meta.get("fingerprint") == fp:
+            return
+        if self.filter.add(bytes.fromhex(fp)):
+            dl.stats["dedup/dropped"] += 1
+            raise RequestDropped(req, "duplicate request")
+        req.meta["fingerprint"] = fp
+        dl.stats["dedup/seen"] += 1
+
+    async def close(self):
+        self.filter.close()
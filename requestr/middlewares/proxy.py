@@ -1,8 +1,12 @@
+import asyncio
 import random
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional, Tuple
+
+from aiohttp.client_exceptions import ClientConnectionError
+
 from requestr import session
 from requestr.middlewares import Middleware
-from requestr.proxy import ProxyPool
+from requestr.proxy import ProxyBindings, ProxyManager, ProxyPool
 from requestr.request import Request
 from requestr.response import Response
 from requestr.session import Session
@@ -11,17 +15,140 @@ if TYPE_CHECKING:
     from requestr.downloader import Downloader
 
 
+def sticky_key(req: Request) -> str:
+    """key proxy is bound to in sticky mode: `meta["session_key"]` if set, otherwise request slot"""
+    return req.meta.get("session_key") or req.slot
+
+
 class RotatingProxyPool(Middleware):
-    """middleware that sets random proxy from proxy pool for every request"""
+    """
+    middleware that sets random proxy from proxy pool for every request.
+
+    With `sticky=True` every slot (or `meta["session_key"]`) is bound to single proxy, so its cookies
+    keep coming from same IP and pooled connections through that proxy are reused.
+    Binding rotates when proxy fails with connection error or after `sticky_ttl` seconds
+    or `sticky_requests` requests.
+    Failures are observed ahead of retry middlewares, so retried request already gets rotated proxy.
+    """
+
+    observer = True
+    failure_exceptions = (ClientConnectionError, asyncio.TimeoutError)
 
-    def __init__(self, *proxy_pools: ProxyPool) -> None:
+    def __init__(
+        self,
+        *proxy_pools: ProxyPool,
+        sticky: bool = False,
+        sticky_ttl: Optional[float] = None,
+        sticky_requests: Optional[int] = None,
+    ) -> None:
         super().__init__()
         self.proxy_pools = proxy_pools
+        self.bindings = ProxyBindings(sticky_ttl, sticky_requests) if sticky else None
 
     async def request(self, req: Request, session: session, dl: "Downloader", **meta):
-        if req.proxy:
+        if req.proxy and not req.meta.get("sticky_proxy"):
             return
-        pool = random.choice(self.proxy_pools)
-        req.proxy = pool.random
+        if self.bindings is None:
+            pool = random.choice(self.proxy_pools)
+            proxy = pool.random
+        else:
+            key = sticky_key(req)
+            bound = self.bindings.get(key)
+            if bound is None:
+                pool = random.choice(self.proxy_pools)
+                bound = self.bindings.bind(key, (pool, pool.random))
+            pool, proxy = bound
+            req.meta["sticky_proxy"] = True
+        req.proxy = proxy
         req.proxy_auth = pool.auth
         req.proxy_headers = pool.headers
+
+    async def response_exception(self, exc: Exception, req: Request, session: Session, dl: "Downloader", **meta):
+        if not req.meta.get("sticky_proxy") or not isinstance(exc, self.failure_exceptions):
+            return
+        key = sticky_key(req)
+        bound = self.bindings.peek(key)
+        # binding may have rotated already by another request of same slot
+        if bound is not None and bound[1] == req.proxy:
+            dl.stats["proxy/rotated"] += 1
+            self.bindings.unbind(key)
+
+
+class ManagedProxyPool(Middleware):
+    """
+    middleware that sets proxy picked by ProxyManager for every request and reports results back:
+    - responses with `ban_statuses` quarantine proxy right away
+    - server errors and connection exceptions count as proxy failures
+    - other responses are successes with their latency
+    retried requests get freshly picked proxy. It's an observer, so outcomes are reported
+    ahead of retry middlewares whatever its priority.
+
+    With `sticky=True` every slot (or `meta["session_key"]`) keeps its proxy, so pooled connections
+    through it are reused, until proxy fails, gets quarantined or binding expires
+    after `sticky_ttl` seconds or `sticky_requests` requests.
+    """
+
+    observer = True
+    ban_statuses = (403, 407, 429)
+    failure_exceptions = (ClientConnectionError, asyncio.TimeoutError)
+
+    def __init__(
+        self,
+        manager: ProxyManager,
+        ban_statuses: Tuple[int, ...] = None,
+        sticky: bool = False,
+        sticky_ttl: Optional[float] = None,
+        sticky_requests: Optional[int] = None,
+    ) -> None:
+        super().__init__()
+        self.manager = manager
+        self.statuses = ban_statuses or self.ban_statuses
+        self.bindings = ProxyBindings(sticky_ttl, sticky_requests) if sticky else None
+
+    def pick(self, req: Request) -> str:
+        if self.bindings is None:
+            return self.manager.random
+        key = sticky_key(req)
+        proxy = self.bindings.get(key)
+        if proxy is None or not self.manager.available(proxy):
+            proxy = self.bindings.bind(key, self.manager.random)
+        return proxy
+
+    def rotate(self, req: Request, proxy: str):
+        """unbind failed proxy from request's key so next request picks another one"""
+        if self.bindings is None:
+            return
+        key = sticky_key(req)
+        if self.bindings.peek(key) == proxy:
+            self.bindings.unbind(key)
+
+    async def request(self, req: Request, session: Session, dl: "Downloader", **meta):
+        if req.proxy and not req.meta.get("managed_proxy"):
+            return
+        req.proxy = self.pick(req)
+        req.proxy_auth = self.manager.auth
+        req.proxy_headers = self.manager.headers
+        req.meta["managed_proxy"] = True
+
+    async def response(self, resp: Response, req: Request, session: Session, dl: "Downloader", **meta):
+        if req is None or not req.meta.get("managed_proxy"):
+            return
+        proxy = str(req.proxy)
+        if resp.status in self.statuses:
+            dl.stats["proxy/banned"] += 1
+            self.manager.failure(proxy, ban=True)
+            self.rotate(req, proxy)
+        elif resp.status >= 500:
+            self.manager.failure(proxy)
+            self.rotate(req, proxy)
+        else:
+            self.manager.success(proxy, resp.elapsed)
+
+    async def response_exception(self, exc: Exception, req: Request, session: Session, dl: "Downloader", **meta):
+        if req.meta.get("managed_proxy") and isinstance(exc, self.failure_exceptions):
+            dl.stats["proxy/failed"] += 1
+            self.manager.failure(str(req.proxy))
+            self.rotate(req, str(req.proxy))
+
+    async def close(self):
+        await self.manager.close()
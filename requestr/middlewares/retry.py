@@ -2,7 +2,7 @@ from requestr.exceptions import RequestFailed, RequestDropped
 from requestr.session import Session
 from aiohttp import BasicAuth
 from aiohttp.client_exceptions import ClientResponseError, ClientConnectionError
-from typing import TYPE_CHECKING, Callable, List, Union, Iterator, Tuple
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Union, Iterator, Tuple
 from requestr import Request, Response, request
 from requestr.proxy import ProxyPool
 from requestr.middlewares import Middleware
@@ -18,12 +18,32 @@ Number = Union[int, float]
 
 
 class RetryMW(Middleware):
+    """
+    base retry middleware: retried request is returned with `meta["delay"]`
+    so Downloader holds it in delay queue rather than sleeping inside middleware.
+
+    - `jitter` draws "full jitter" delay uniformly from 0 to backoff value so retries don't fire in waves
+    - `budget` limits retries per slot to a ratio of sent requests: every new request deposits
+      `budget` tokens (up to `budget_cap`) and every retry withdraws one
+    """
+
     _default_sleep = 0, 1, 3, 6, 10, 16, 32, 64, 128
 
-    def __init__(self, times=2, sleep: Union[Number, Tuple[Number]] = None):
+    def __init__(
+        self,
+        times=2,
+        sleep: Union[Number, Tuple[Number]] = None,
+        jitter: bool = False,
+        budget: Optional[float] = None,
+        budget_cap: float = 10,
+    ):
         super().__init__()
         self.sleep = sleep or self._default_sleep
         self.times = times
+        self.jitter = jitter
+        self.budget = budget
+        self.budget_cap = budget_cap
+        self._budgets: Dict[str, float] = {}
 
     async def request(self, req: Request, session: Session, dl: "Downloader", **meta):
         # set retry meta to all new requests
@@ -31,17 +51,35 @@ class RetryMW(Middleware):
             req.meta["max_retries"] = self.times
         if "retries" not in req.meta:
             req.meta["retries"] = 0
+        if self.budget and req.meta["retries"] == 0:
+            balance = self._budgets.get(req.slot)
+            if balance is None:
+                return
+            # slots without entry have full budget, so only slots that are paying back retries are kept
+            if balance + self.budget >= self.budget_cap:
+                del self._budgets[req.slot]
+            else:
+                self._budgets[req.slot] = balance + self.budget
 
     def _amount_to_sleep(self, req: Request):
         if isinstance(self.sleep, (int, float)):
-            return self.sleep
+            backoff = self.sleep
         else:
-            return self.sleep[req.meta["retries"]]
+            backoff = self.sleep[min(req.meta["retries"], len(self.sleep) - 1)]
+        if self.jitter:
+            return random.uniform(0, backoff)
+        return backoff
 
     async def _retry(self, req: Request, session: Session, dl: "Downloader", **meta):
         retries, max_retries = req.meta["retries"], req.meta["max_retries"]
         if retries >= max_retries:
             raise RequestFailed(req=req, reason=f"retries exceeded after {retries} retries")
+        if self.budget:
+            balance = self._budgets.get(req.slot, self.budget_cap)
+            if balance < 1:
+                dl.stats["req/retry/budget_exhausted"] += 1
+                raise RequestFailed(req=req, reason=f'retry budget of slot "{req.slot}" exhausted')
+            self._budgets[req.slot] = balance - 1
         req.meta["retries"] += 1
         dl.stats["req/retry"] += 1
 
@@ -51,17 +89,22 @@ class RetryMW(Middleware):
         self.log.debug(
             f"retrying {req.url} ({retries}/{max_retries} in {amount_to_sleep} seconds) by {type(self)} mware"
         )
-        await asyncio.sleep(amount_to_sleep)
+        req.meta["delay"] = amount_to_sleep
         return req
 
+    def _options(self) -> Dict:
+        return dict(
+            times=self.times, sleep=self.sleep, jitter=self.jitter, budget=self.budget, budget_cap=self.budget_cap
+        )
+
 
 class RetryExceptions(RetryMW):
     """middleware to retry specific response exceptions"""
 
     default_exceptions = (ClientResponseError, ClientConnectionError)
 
-    def __init__(self, *exceptions: Callable, times=2, sleep: Union[Number, Tuple[Number]] = None):
-        super().__init__(times=times, sleep=sleep)
+    def __init__(self, *exceptions: Callable, times=2, sleep: Union[Number, Tuple[Number]] = None, **kwargs):
+        super().__init__(times=times, sleep=sleep, **kwargs)
         self.exceptions = exceptions or self.default_exceptions
 
     async def response_exception(self, exc: Exception, req: Request, session: Session, dl: "Downloader", **meta):
@@ -71,7 +114,7 @@ class RetryExceptions(RetryMW):
 
     def __add__(self, other):
         exceptions = self.exceptions + other.exceptions
-        return type(self)(*exceptions, times=self.times, sleep=self.sleep)
+        return type(self)(*exceptions, **self._options())
 
 
 class RetryStatuses(RetryMW):
@@ -79,8 +122,8 @@ class RetryStatuses(RetryMW):
 
     default_statuses = (500,)
 
-    def __init__(self, *statuses: int, times=2, sleep: Union[Number, Tuple[Number]] = None):
-        super().__init__(times=times, sleep=sleep)
+    def __init__(self, *statuses: int, times=2, sleep: Union[Number, Tuple[Number]] = None, **kwargs):
+        super().__init__(times=times, sleep=sleep, **kwargs)
         self.statuses = statuses or self.default_statuses
 
     async def response(self, resp: Response, req: Request, session: Session, dl: "Downloader", **meta):
@@ -90,4 +133,4 @@ class RetryStatuses(RetryMW):
 
     def __add__(self, other):
         statuses = self.statuses + other.statuses
-        return type(self)(*statuses, times=self.times, sleep=self.sleep)
+        return type(self)(*statuses, **self._options())
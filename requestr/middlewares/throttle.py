@@ -0,0 +1,163 @@
+import asyncio
+from collections import deque
+from email.utils import parsedate_to_datetime
+from time import time
+from typing import TYPE_CHECKING, Callable, Deque, Dict, Optional, Tuple
+
+from aiohttp.client_exceptions import ServerTimeoutError
+
+from requestr.middlewares import Middleware
+from requestr.request import Request
+from requestr.response import Response
+from requestr.session import Session
+
+if TYPE_CHECKING:
+    from requestr.downloader import Downloader
+
+
+def retry_after(value: Optional[str]) -> Optional[float]:
+    """seconds from Retry-After header value which can be either delay seconds or http date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class SlotState:
+    __slots__ = ("latencies", "baseline", "backoff_at", "rate", "ceiling")
+
+    def __init__(self, window: int) -> None:
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.baseline: Optional[float] = None  # lowest p95 latency seen
+        self.backoff_at = 0.0
+        # learned rate outlives slot's sessions which are recreated with Downloader `limit`
+        self.rate: Optional[float] = None
+        self.ceiling: Optional[float] = None
+
+    @property
+    def p95(self) -> Optional[float]:
+        if len(self.latencies) < self.latencies.maxlen:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+class AutoThrottle(Middleware):
+    """
+    middleware that adapts request rate of every slot (AIMD):
+    - rate grows additively while responses are healthy
+    - rate is cut multiplicatively on backoff statuses (429, 503), timeouts
+      or when p95 latency rises above `target_latency` or `latency_factor` times slot's best p95
+    - Retry-After header of backoff responses pauses slot for requested time
+    rate is applied to slot's session limiter, so Downloader `limit` serves as starting rate,
+    and it's kept per slot so sessions recreated by the session pool continue at learned rate.
+    Without `max_rate` rate grows up to `max_factor` times the starting rate.
+
+    It's an observer, so it sees every response and exception ahead of retry middlewares
+    whatever its priority; the priority only orders it among other observers.
+    """
+
+    observer = True
+    backoff_statuses = (429, 503)
+    backoff_exceptions = (asyncio.TimeoutError, ServerTimeoutError)
+
+    def __init__(
+        self,
+        min_rate: float = 0.5,
+        max_rate: Optional[float] = None,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        target_latency: Optional[float] = None,
+        latency_factor: float = 2.0,
+        window: int = 20,
+        cooldown: float = 1.0,
+        statuses: Tuple[int, ...] = None,
+        exceptions: Tuple[Callable, ...] = None,
+        max_factor: float = 10.0,
+    ) -> None:
+        super().__init__()
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.max_factor = max_factor
+        self.increase = increase
+        self.decrease = decrease
+        self.target_latency = target_latency
+        self.latency_factor = latency_factor
+        self.window = window
+        self.cooldown = cooldown
+        self.statuses = statuses or self.backoff_statuses
+        self.exceptions = exceptions or self.backoff_exceptions
+        self.slots: Dict[str, SlotState] = {}
+
+    def _state(self, slot: str) -> SlotState:
+        try:
+            return self.slots[slot]
+        except KeyError:
+            state = self.slots[slot] = SlotState(self.window)
+            return state
+
+    def rate(self, session: Session) -> float:
+        return session.limiter.max_rate / session.limiter.time_period
+
+    def _set_rate(self, slot: str, session: Session, rate: float):
+        state = self._state(slot)
+        if state.ceiling is None:
+            state.ceiling = self.max_rate or self.rate(session) * self.max_factor
+        state.rate = max(self.min_rate, min(rate, state.ceiling))
+        session.limiter.max_rate = state.rate * session.limiter.time_period
+
+    async def request(self, req: Request, session: Session, dl: "Downloader", **meta):
+        # session replaced by the pool starts at Downloader `limit` again
+        rate = self._state(req.slot).rate
+        if rate is not None and self.rate(session) != rate:
+            session.limiter.max_rate = rate * session.limiter.time_period
+
+    def _backoff(self, req: Request, session: Session, dl: "Downloader", reason: str, pause: float = None):
+        state = self._state(req.slot)
+        now = time()
+        if pause:
+            dl.scheduler.pause(req.slot, pause)
+            dl.stats["autothrottle/pause"] += pause
+        # one burst of failures should only cut rate once
+        if now - state.backoff_at < self.cooldown:
+            return
+        state.backoff_at = now
+        state.latencies.clear()
+        rate = self.rate(session)
+        self._set_rate(req.slot, session, rate * self.decrease)
+        dl.stats["autothrottle/decrease"] += 1
+        self.log.debug(f'slot "{req.slot}" rate {rate:.2f} -> {self.rate(session):.2f} req/s ({reason})')
+
+    async def response(self, resp: Response, req: Request, session: Session, dl: "Downloader", **meta):
+        if req is None:
+            return
+        if resp.status in self.statuses:
+            self._backoff(req, session, dl, f"status {resp.status}", retry_after(resp.headers.get("Retry-After")))
+            return
+        state = self._state(req.slot)
+        if resp.elapsed is not None:
+            state.latencies.append(resp.elapsed)
+            p95 = state.p95
+            if p95 is not None:
+                if self.target_latency and p95 > self.target_latency:
+                    self._backoff(req, session, dl, f"p95 latency {p95:.2f}s above target")
+                    return
+                if state.baseline is not None and p95 > state.baseline * self.latency_factor:
+                    self._backoff(req, session, dl, f"p95 latency {p95:.2f}s rising")
+                    return
+                if state.baseline is None or p95 < state.baseline:
+                    state.baseline = p95
+        # additive increase of roughly `increase` req/s per second of healthy traffic
+        rate = self.rate(session)
+        self._set_rate(req.slot, session, rate + self.increase / max(rate, 1))
+        dl.stats["autothrottle/increase"] += 1
+
+    async def response_exception(self, exc: Exception, req: Request, session: Session, dl: "Downloader", **meta):
+        if isinstance(exc, self.exceptions):
+            self._backoff(req, session, dl, f"exception {type(exc).__name__}")
@@ -0,0 +1,67 @@
+from typing import Callable, Dict, List, Optional, Tuple
+
+from requestr.middlewares import Middleware
+
+Hook = Tuple[Middleware, Callable]
+
+
+def overrides(mw: Middleware, hook: str) -> bool:
+    """whether middleware implements hook or just inherits no-op from base Middleware"""
+    return getattr(type(mw), hook, None) is not getattr(Middleware, hook)
+
+
+class MiddlewarePipeline:
+    """
+    Middleware dict compiled to ordered hook chains:
+    - request hooks are called in ascending priority order
+    - response and response exception hooks in descending order, observers before the rest
+    Hooks that are not overridden by middleware are left out completely.
+    """
+
+    def __init__(self, mwares: Optional[Dict[int, Middleware]]) -> None:
+        self.mwares = mwares
+        self._snapshot = dict(mwares or {})
+        ordered = [self._snapshot[key] for key in sorted(self._snapshot)]
+        self.request: List[Hook] = [(mw, mw.request) for mw in ordered if overrides(mw, "request")]
+        # stable sort keeps descending priority among observers and among the rest
+        backwards = sorted(reversed(ordered), key=lambda mw: not mw.observer)
+        self.response: List[Hook] = [(mw, mw.response) for mw in backwards if overrides(mw, "response")]
+        self.response_exception: List[Hook] = [
+            (mw, mw.response_exception) for mw in backwards if overrides(mw, "response_exception")
+        ]
+
+    def is_stale(self, mwares: Optional[Dict[int, Middleware]]) -> bool:
+        """whether middleware set has changed since pipeline was compiled"""
+        return mwares is not self.mwares or (mwares or {}) != self._snapshot
+
+    def __repr__(self) -> str:
+        return (
+            f"{type(self).__name__}(request={len(self.request)}, response={len(self.response)}, "
+            f"response_exception={len(self.response_exception)})"
+        )
+
+
+class PipelineCache:
+    """compiled pipelines cached by middleware dict identity"""
+
+    def __init__(self, size: int = 32) -> None:
+        self.size = size
+        self._pipelines: Dict[int, MiddlewarePipeline] = {}
+
+    def get(self, mwares: Optional[Dict[int, Middleware]]) -> MiddlewarePipeline:
+        key = id(mwares)
+        pipeline = self._pipelines.get(key)
+        # pipeline keeps reference to its dict so id can't be reused while cached
+        if pipeline is None or pipeline.is_stale(mwares):
+            pipeline = MiddlewarePipeline(mwares)
+            self._pipelines.pop(key, None)
+            if len(self._pipelines) >= self.size:
+                del self._pipelines[next(iter(self._pipelines))]
+            self._pipelines[key] = pipeline
+        return pipeline
+
+    def clear(self):
+        self._pipelines.clear()
+
+    def __len__(self) -> int:
+        return len(self._pipelines)
@@ -1,6 +1,11 @@
-from typing import List, Optional
-from aiohttp import BasicAuth
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from aiohttp import BasicAuth, ClientError, ClientSession, ClientTimeout
 from aiohttp.typedefs import LooseHeaders
+from loguru import logger as log
+from time import monotonic
+import asyncio
+import heapq
 import random
 
 
@@ -25,3 +30,311 @@ class ProxyPool:
         return self.pool.pop()
 
 
+class WeightTree:
+    """Fenwick tree of non-negative weights: O(log n) weight updates and weighted random picks"""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.weights = [0.0] * size
+        self._tree = [0.0] * (size + 1)
+        self._top = 1 << (size.bit_length() - 1) if size else 0
+        self._updates = 0
+
+    def __setitem__(self, index: int, weight: float):
+        delta = weight - self.weights[index]
+        self.weights[index] = weight
+        i = index + 1
+        while i <= self.size:
+            self._tree[i] += delta
+            i += i & -i
+        self._updates += 1
+        if self._updates >= 10_000:
+            self._rebuild()
+
+    def __getitem__(self, index: int) -> float:
+        return self.weights[index]
+
+    def _rebuild(self):
+        # float deltas drift over many updates, rebuild from weights in O(n)
+        tree = [0.0] + self.weights
+        for i in range(1, self.size + 1):
+            parent = i + (i & -i)
+            if parent <= self.size:
+                tree[parent] += tree[i]
+        self._tree = tree
+        self._updates = 0
+
+    @property
+    def total(self) -> float:
+        total, i = 0.0, self.size
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def find(self, value: float) -> int:
+        """index at which cumulative weight exceeds value"""
+        pos, mask = 0, self._top
+        while mask:
+            nxt = pos + mask
+            if nxt <= self.size and self._tree[nxt] <= value:
+                value -= self._tree[nxt]
+                pos = nxt
+            mask >>= 1
+        return min(pos, self.size - 1)
+
+    def pick(self) -> Optional[int]:
+        """weighted random index or None when all weights are zero"""
+        total = self.total
+        if total <= 0:
+            return None
+        index = self.find(random.random() * total)
+        if not self.weights[index]:
+            # rounding landed on zero weight, fall back to heaviest
+            index = max(range(self.size), key=self.weights.__getitem__)
+        return index
+
+
+class ProxyHealth:
+    """health record of single proxy"""
+
+    __slots__ = ("successes", "failures", "latency", "fails_in_row", "strikes", "quarantined_until")
+
+    def __init__(self) -> None:
+        self.successes = 0
+        self.failures = 0
+        self.latency: Optional[float] = None  # exponentially weighted moving average
+        self.fails_in_row = 0
+        self.strikes = 0  # times quarantined in a row, doubles cool-down
+        self.quarantined_until = 0.0
+
+    @property
+    def success_rate(self) -> float:
+        # smoothed so new proxies start at 0.5 rather than extremes
+        return (self.successes + 1) / (self.successes + self.failures + 2)
+
+    def snapshot(self) -> Dict:
+        return {
+            "successes": self.successes,
+            "failures": self.failures,
+            "success_rate": round(self.success_rate, 3),
+            "latency": self.latency,
+            "quarantined": self.quarantined_until > monotonic(),
+        }
+
+
+class ProxyManager(ProxyPool):
+    """
+    Proxy pool that learns from results:
+    - proxies are picked at random weighted by score: smoothed success rate
+      discounted by latency EWMA relative to `latency_scale` seconds
+    - proxy is quarantined after `quarantine_after` failures in a row or on ban signal,
+      cool-down doubles with every quarantine in a row up to `max_cooldown`
+    - with `probe_url` quarantined proxies are re-probed in background once cool-down passes,
+      otherwise they simply return to rotation
+    `random` picks weighted proxy, so manager can stand in for ProxyPool;
+    results are reported with `success` and `failure` (see ManagedProxyPool middleware).
+    """
+
+    def __init__(
+        self,
+        pool: List[str],
+        auth: Optional[BasicAuth] = None,
+        headers: Optional[LooseHeaders] = None,
+        alpha: float = 0.2,
+        latency_scale: float = 1.0,
+        quarantine_after: int = 3,
+        cooldown: float = 30,
+        max_cooldown: float = 3600,
+        probe_url: Optional[str] = None,
+        probe_timeout: float = 10,
+    ) -> None:
+        super().__init__(pool, auth, headers)
+        self.alpha = alpha
+        self.latency_scale = latency_scale
+        self.quarantine_after = quarantine_after
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.probe_url = probe_url
+        self.probe_timeout = probe_timeout
+        self.index = {proxy: i for i, proxy in enumerate(pool)}
+        self.health = [ProxyHealth() for _ in pool]
+        self.weights = WeightTree(len(pool))
+        # (release time, proxy index) of quarantined proxies
+        self._quarantine: List[Tuple[float, int]] = []
+        self._prober: Optional[asyncio.Task] = None
+        self._session: Optional[ClientSession] = None
+        for i in range(len(pool)):
+            self.weights[i] = self.score(i)
+
+    def score(self, index: int) -> float:
+        health = self.health[index]
+        latency = health.latency or 0.0
+        return health.success_rate / (1 + latency / self.latency_scale)
+
+    @property
+    def random(self) -> str:
+        """weighted random healthy proxy"""
+        self._release(monotonic())
+        if not self.proxies:
+            raise ValueError("ProxyManager has no proxies to pick from")
+        index = self.weights.pick()
+        if index is None:
+            # everything is quarantined, use the one that's released soonest
+            index = self._quarantine[0][1] if self._quarantine else random.randrange(len(self.proxies))
+        return self.proxies[index]
+
+    def available(self, proxy: str) -> bool:
+        """whether proxy isn't quarantined"""
+        return self.health[self.index[proxy]].quarantined_until <= monotonic()
+
+    def success(self, proxy: str, latency: Optional[float] = None):
+        i = self.index.get(proxy)
+        if i is None:
+            return
+        health = self.health[i]
+        health.successes += 1
+        health.fails_in_row = 0
+        health.strikes = 0
+        if latency is not None:
+            if health.latency is None:
+                health.latency = latency
+            else:
+                health.latency += self.alpha * (latency - health.latency)
+        if not health.quarantined_until:
+            self.weights[i] = self.score(i)
+
+    def failure(self, proxy: str, ban: bool = False):
+        """record failed request; `ban` quarantines proxy right away"""
+        i = self.index.get(proxy)
+        if i is None:
+            return
+        health = self.health[i]
+        health.failures += 1
+        health.fails_in_row += 1
+        if health.quarantined_until:
+            return
+        if ban or health.fails_in_row >= self.quarantine_after:
+            self.quarantine(proxy)
+        else:
+            self.weights[i] = self.score(i)
+
+    def quarantine(self, proxy: str):
+        i = self.index[proxy]
+        health = self.health[i]
+        cooldown = min(self.cooldown * 2**health.strikes, self.max_cooldown)
+        health.strikes += 1
+        health.quarantined_until = monotonic() + cooldown
+        self.weights[i] = 0.0
+        heapq.heappush(self._quarantine, (health.quarantined_until, i))
+        log.info(f"proxy {proxy} quarantined for {cooldown:.0f}s")
+        if self.probe_url and self._prober is None:
+            self._prober = asyncio.ensure_future(self._probe_forever())
+
+    def _reinstate(self, i: int):
+        health = self.health[i]
+        health.quarantined_until = 0.0
+        health.fails_in_row = 0
+        self.weights[i] = self.score(i)
+
+    def _release(self, now: float):
+        """return proxies with passed cool-down to rotation, unless they are probed"""
+        if self.probe_url:
+            return
+        while self._quarantine and self._quarantine[0][0] <= now:
+            _, i = heapq.heappop(self._quarantine)
+            if self.health[i].quarantined_until:
+                self._reinstate(i)
+
+    async def probe(self, proxy: str) -> bool:
+        """check proxy by requesting `probe_url` through it"""
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(timeout=ClientTimeout(total=self.probe_timeout))
+        try:
+            async with self._session.get(
+                self.probe_url, proxy=proxy, proxy_auth=self.auth, proxy_headers=self.headers
+            ) as resp:
+                await resp.read()
+                return resp.status < 400
+        except (ClientError, asyncio.TimeoutError):
+            return False
+
+    async def _probe_forever(self):
+        while True:
+            delay = self._quarantine[0][0] - monotonic() if self._quarantine else self.cooldown
+            await asyncio.sleep(max(delay, 0.1))
+            now = monotonic()
+            due = []
+            while self._quarantine and self._quarantine[0][0] <= now:
+                due.append(heapq.heappop(self._quarantine)[1])
+            for i, ok in zip(due, await asyncio.gather(*[self.probe(self.proxies[i]) for i in due])):
+                proxy = self.proxies[i]
+                if ok:
+                    log.info(f"proxy {proxy} passed probe, returning to rotation")
+                    self._reinstate(i)
+                else:
+                    self.quarantine(proxy)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        return {proxy: self.health[i].snapshot() for proxy, i in self.index.items()}
+
+    async def close(self):
+        if self._prober is not None:
+            self._prober.cancel()
+            self._prober = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class ProxyBindings:
+    """
+    Sticky key (e.g. slot) -> proxy bindings that expire after `ttl` seconds or `max_requests` uses;
+    at most `max_size` least recently used bindings are kept.
+    """
+
+    def __init__(self, ttl: Optional[float] = None, max_requests: Optional[int] = None, max_size: int = 100_000):
+        self.ttl = ttl
+        self.max_requests = max_requests
+        self.max_size = max_size
+        self.stats = Counter()
+        # key -> [proxy, bound at, uses]
+        self._bindings: "OrderedDict[str, list]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        """proxy bound to key, counting one use; None when there's no live binding"""
+        binding = self._bindings.get(key)
+        if binding is None:
+            return None
+        proxy, bound_at, uses = binding
+        if (self.ttl and monotonic() - bound_at > self.ttl) or (self.max_requests and uses >= self.max_requests):
+            del self._bindings[key]
+            self.stats["expired"] += 1
+            return None
+        binding[2] += 1
+        self._bindings.move_to_end(key)
+        return proxy
+
+    def bind(self, key: str, proxy: Any) -> Any:
+        self._bindings[key] = [proxy, monotonic(), 1]
+        self._bindings.move_to_end(key)
+        self.stats["bound"] += 1
+        while len(self._bindings) > self.max_size:
+            self._bindings.popitem(last=False)
+        return proxy
+
+    def peek(self, key: str) -> Optional[Any]:
+        """proxy bound to key without counting use or checking expiry"""
+        binding = self._bindings.get(key)
+        return binding[0] if binding is not None else None
+
+    def unbind(self, key: str):
+        """drop binding, e.g. when its proxy failed, so key rotates to new proxy"""
+        if self._bindings.pop(key, None) is not None:
+            self.stats["rotated"] += 1
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._bindings
+
+    def __len__(self) -> int:
+        return len(self._bindings)
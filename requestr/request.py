@@ -1,6 +1,4 @@
-from typing import Union, Dict, Optional, Any, Mapping
 from types import SimpleNamespace
-from dataclasses import dataclass, field
 from ssl import SSLContext
 from typing import (
     Any,
@@ -14,15 +12,70 @@ from typing import (
 
 from aiohttp.typedefs import LooseCookies, LooseHeaders, StrOrURL
 from aiohttp.helpers import BasicAuth
-from aiohttp.typedefs import LooseCookies, LooseHeaders
 from aiohttp.helpers import sentinel
 from aiohttp.client import ClientTimeout
 from aiohttp.client_reqrep import Fingerprint
 from yarl import URL
 
+# rarely used aiohttp request options and their defaults,
+# only options that differ from default are stored on Request
+OPTION_DEFAULTS = {
+    "skip_auto_headers": None,
+    "auth": None,
+    "allow_redirects": True,
+    "max_redirects": 10,
+    "compress": None,
+    "chunked": None,
+    "expect100": False,
+    "raise_for_status": None,
+    "read_until_eof": True,
+    "timeout": sentinel,
+    "verify_ssl": None,
+    "fingerprint": None,
+    "ssl_context": None,
+    "ssl": None,
+    "trace_request_ctx": None,
+    "read_bufsize": None,
+}
+
+
+def _option(name: str) -> property:
+    default = OPTION_DEFAULTS[name]
+
+    def fget(self: "Request"):
+        options = self._options
+        return default if options is None else options.get(name, default)
+
+    def fset(self: "Request", value):
+        if self._options is None:
+            self._options = {}
+        self._options[name] = value
+
+    return property(fget, fset, doc=f"aiohttp `{name}` request option")
 
 
 class Request:
+    """
+    Compact request: url is parsed and `meta`/`headers` are created only when first accessed;
+    rarely used aiohttp options are kept in single overflow dict only when they differ from defaults.
+    """
+
+    __slots__ = (
+        "_url",
+        "_slot",
+        "_meta",
+        "_headers",
+        "_options",
+        "method",
+        "params",
+        "data",
+        "json",
+        "cookies",
+        "proxy",
+        "proxy_auth",
+        "proxy_headers",
+    )
+
     def __init__(
         self,
         url: StrOrURL,
@@ -54,35 +107,146 @@ class Request:
         # extended,
         meta: Dict = None,
         slot: str = "",
-        ):
-            self.url = URL(url)
-            self.slot = slot or self.url.host
-            self.meta = meta or {}
-            self.method = method
-            self.params = params
-            self.data = data
-            self.json = json
-            self.cookies = cookies
-            self.headers = headers or {}
-            self.skip_auto_headers = skip_auto_headers
-            self.auth = auth
-            self.allow_redirects = allow_redirects
-            self.max_redicrects = max_redirects
-            self.compress = compress
-            self.chuncked = chunked
-            self.expect100 = expect100
-            self.raise_for_status = raise_for_status
-            self.read_unti_eof = read_until_eof
-            self.proxy = proxy
-            self.proxy_auth = proxy_auth
-            self.timeout = timeout
-            self.verify_ssl = verify_ssl
-            self.fingerprint = fingerprint
-            self.ssl_context = ssl_context
-            self.ssl = ssl
-            self.proxy_headers = proxy_headers
-            self.trace_request_ctx = trace_request_ctx
-            self.read_buffsize = read_bufsize
+    ):
+        self._url = url
+        self._slot = slot or None
+        self._meta = meta or None
+        self._headers = headers or None
+        self.method = method
+        self.params = params
+        self.data = data
+        self.json = json
+        self.cookies = cookies
+        self.proxy = proxy
+        self.proxy_auth = proxy_auth
+        self.proxy_headers = proxy_headers
+        options = (
+            ("skip_auto_headers", skip_auto_headers),
+            ("auth", auth),
+            ("allow_redirects", allow_redirects),
+            ("max_redirects", max_redirects),
+            ("compress", compress),
+            ("chunked", chunked),
+            ("expect100", expect100),
+            ("raise_for_status", raise_for_status),
+            ("read_until_eof", read_until_eof),
+            ("timeout", timeout),
+            ("verify_ssl", verify_ssl),
+            ("fingerprint", fingerprint),
+            ("ssl_context", ssl_context),
+            ("ssl", ssl),
+            ("trace_request_ctx", trace_request_ctx),
+            ("read_bufsize", read_bufsize),
+        )
+        self._options = {name: value for name, value in options if value is not OPTION_DEFAULTS[name]} or None
+
+    @property
+    def url(self) -> URL:
+        url = self._url
+        if not isinstance(url, URL):
+            url = self._url = URL(url)
+        return url
+
+    @url.setter
+    def url(self, value: StrOrURL):
+        if self._slot is None:
+            # slot is bound to original url
+            self._slot = self.url.host
+        self._url = URL(value)
+
+    @property
+    def slot(self) -> str:
+        if self._slot is None:
+            self._slot = self.url.host
+        return self._slot
+
+    @slot.setter
+    def slot(self, value: str):
+        self._slot = value
+
+    @property
+    def meta(self) -> Dict:
+        if self._meta is None:
+            self._meta = {}
+        return self._meta
+
+    @meta.setter
+    def meta(self, value: Dict):
+        self._meta = value
+
+    @property
+    def headers(self) -> LooseHeaders:
+        if self._headers is None:
+            self._headers = {}
+        return self._headers
+
+    @headers.setter
+    def headers(self, value: LooseHeaders):
+        self._headers = value
+
+    skip_auto_headers = _option("skip_auto_headers")
+    auth = _option("auth")
+    allow_redirects = _option("allow_redirects")
+    max_redirects = _option("max_redirects")
+    compress = _option("compress")
+    chunked = _option("chunked")
+    expect100 = _option("expect100")
+    raise_for_status = _option("raise_for_status")
+    read_until_eof = _option("read_until_eof")
+    timeout = _option("timeout")
+    verify_ssl = _option("verify_ssl")
+    fingerprint = _option("fingerprint")
+    ssl_context = _option("ssl_context")
+    ssl = _option("ssl")
+    trace_request_ctx = _option("trace_request_ctx")
+    read_bufsize = _option("read_bufsize")
+    # legacy attribute names
+    max_redicrects = max_redirects
+    chuncked = chunked
+    read_unti_eof = read_until_eof
+    read_buffsize = read_bufsize
+
+    def aiohttp_kwargs(self) -> Dict[str, Any]:
+        """keyword arguments of `aiohttp.ClientSession._request` for this request"""
+        kwargs = {
+            "method": self.method,
+            "str_or_url": self.url,
+            "params": self.params,
+            "data": self.data,
+            "json": self.json,
+            "cookies": self.cookies,
+            "headers": self._headers,
+            "proxy": self.proxy,
+            "proxy_auth": self.proxy_auth,
+            "proxy_headers": self.proxy_headers,
+        }
+        if self._options:
+            kwargs.update(self._options)
+        return kwargs
+
+    def copy(self) -> "Request":
+        """copy of request with its own meta, headers and options"""
+        new = object.__new__(type(self))
+        new.__setstate__(self.__getstate__())
+        if new._meta is not None:
+            new._meta = dict(new._meta)
+        if new._headers is not None:
+            new._headers = new._headers.copy()
+        if new._options is not None:
+            new._options = dict(new._options)
+        return new
+
+    __copy__ = copy
+
+    def __getstate__(self):
+        # compact positional state; subclasses without __slots__ keep their __dict__
+        return tuple(getattr(self, name) for name in Request.__slots__) + (getattr(self, "__dict__", None),)
+
+    def __setstate__(self, state):
+        for name, value in zip(Request.__slots__, state):
+            setattr(self, name, value)
+        if state[-1]:
+            self.__dict__.update(state[-1])
 
     def __repr__(self) -> str:
-        return f"{type(self).__name__}({self.method} {self.url})"
\ No newline at end of file
+        return f"{type(self).__name__}({self.method} {self.url})"
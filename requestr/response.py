@@ -1,16 +1,61 @@
-from typing import TYPE_CHECKING, Dict, List, Optional
+from typing import IO, TYPE_CHECKING, Any, AsyncIterator, Callable, Dict, List, Optional, Union
 from aiohttp import ClientResponse, hdrs
 from aiohttp.helpers import reify
+from multidict import CIMultiDict
 from yarl import URL
 import re
-import json
+import codecs
 import gzip
+import os
+import zlib
 from parsel import Selector  # TODO make optional
 
+from requestr import jsonlib
+
 if TYPE_CHECKING:
     from requestr.request import Request
 
 json_re = re.compile(r"^application/(?:[\w.+-]+?\+)?json")
+charset_re = re.compile(r"charset\s*=\s*[\"']?([\w.:-]+)", re.I)
+meta_charset_re = re.compile(rb"<meta[^>]+charset\s*=\s*[\"']?\s*([\w.:-]+)", re.I)
+# utf-32 marks go first as utf-32-le mark starts with utf-16-le mark
+BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+SNIFF_SIZE = 4096
+DEFAULT_CHUNK_SIZE = 2 ** 16
+
+
+def _codec(name: Union[bytes, str]) -> Optional[str]:
+    if isinstance(name, bytes):
+        name = name.decode("ascii", "ignore")
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return None
+
+
+def detect_encoding(headers: Dict, body: bytes, default: str = "utf-8") -> str:
+    """
+    encoding of body from cheapest source to most expensive one: Content-Type charset,
+    byte order mark and for html <meta> charset in first few kilobytes of body
+    """
+    content_type = headers.get(hdrs.CONTENT_TYPE, "")
+    match = charset_re.search(content_type)
+    if match and _codec(match.group(1)):
+        return _codec(match.group(1))
+    for bom, encoding in BOMS:
+        if body.startswith(bom):
+            return encoding
+    if not content_type or "html" in content_type or "xml" in content_type:
+        match = meta_charset_re.search(memoryview(body)[:SNIFF_SIZE])
+        if match and _codec(match.group(1)):
+            return _codec(match.group(1))
+    return default
 
 
 class Response:
@@ -22,51 +67,108 @@ class Response:
         content: bytes = b"",
         method: str = "GET",
         headers: Dict = None,
-        encoding: str = "utf-8",
+        encoding: Optional[str] = None,
         request: Optional["Request"] = None,
         meta: Dict = None,
+        elapsed: Optional[float] = None,
     ) -> None:
         self.status = status
-        self.encoding = encoding
+        self._encoding = encoding  # detected lazily when not given
         self._content = content
         self.method = method
         self.url = url
         self.headers = headers or {}
         self.request = request
         self.meta = meta or {}
+        self.elapsed = elapsed  # seconds from sending request to reading response body
         self._cache = {}
         self.history: List["Response"] = []
 
-    @reify
-    def content(self):
+    @property
+    def encoding(self) -> str:
+        if self._encoding is None:
+            self._encoding = detect_encoding(self.headers, self._content)
+        return self._encoding
+
+    @encoding.setter
+    def encoding(self, value: str):
+        self._encoding = value
+        self._cache.clear()
+
+    @property
+    def content(self) -> bytes:
         return self._content
 
     @reify
     def text(self):
-        return self.content.decode(self.encoding)
+        return str(self._content, self.encoding)
 
     @reify
     def tree(self):
-        return Selector(text=self.text, base_url=str(self.url))
+        # lxml parses body bytes directly, text is only reused when it was already decoded
+        text = self._cache.get("text")
+        if text is not None:
+            return Selector(text=text, base_url=str(self.url))
+        encoding = "utf-8" if self.encoding == "utf-8-sig" else self.encoding
+        return Selector(body=self._content, encoding=encoding, base_url=str(self.url))
 
     @reify
-    def json(
+    def json(self) -> Any:
+        """decoded JSON body, see `get_json` for decoding options"""
+        return self.get_json()
+
+    def get_json(
         self,
         *,
         content_type: Optional[str] = "application/json",
-    ) -> Dict:
-        """Read and decodes JSON response."""
+        loads: Callable[[Union[bytes, str]], Any] = None,
+    ) -> Any:
+        """
+        Decode JSON body with `loads` or selected `requestr.jsonlib` backend;
+        utf-8 body is decoded straight from bytes unless text was already decoded.
+        Unless `content_type` is None response Content-Type has to match it.
+        """
         if content_type:
-            if not json_re.search(self.headers.get(hdrs.CONTENT_TYPE, "").lower()):
-                raise ValueError(
-                    f"Attempt to decode JSON with unexpected mimetype",
-                )
-        return json.loads(self.text)
+            actual = self.headers.get(hdrs.CONTENT_TYPE, "").lower()
+            matches = json_re.search(actual) if content_type == "application/json" else content_type in actual
+            if not matches:
+                raise ValueError(f"Attempt to decode JSON with unexpected mimetype: {actual}")
+        loads = loads or jsonlib.loads
+        text = self._cache.get("text")
+        if text is None and self.encoding == "utf-8":
+            return loads(self._content)
+        return loads(self.text)
+
+    def copy(self, **overrides) -> "Response":
+        """
+        shallow copy of response sharing body buffer but with its own headers,
+        meta and decoded body caches
+        """
+        kwargs = dict(
+            url=self.url,
+            status=self.status,
+            content=self._content,
+            method=self.method,
+            headers=self.headers.copy(),
+            encoding=self._encoding,
+            request=self.request,
+            meta=dict(self.meta),
+            elapsed=self.elapsed,
+        )
+        kwargs.update(overrides)
+        return type(self)(**kwargs)
+
+    def __getstate__(self):
+        # decoded body caches (text, parsed tree) are rebuilt on demand so only body bytes are shipped
+        state = self.__dict__.copy()
+        state["_cache"] = {}
+        if not isinstance(self.headers, dict):
+            state["headers"] = CIMultiDict(self.headers)
+        return state
 
     @classmethod
     async def from_aiohttp(cls, response: ClientResponse, decompress=True):
         content = await response.read()
-        encoding = response.get_encoding()
         headers = response.headers
         if decompress and headers.get("Content-Type") == "application/x-gzip":
             content = gzip.decompress(content)
@@ -77,9 +179,164 @@ class Response:
             content=content,
             method=response.method,
             headers=headers,
-            encoding=encoding,
             request=None,  # TODO
         )
 
     def __repr__(self) -> str:
-        return f"{type(self).__name__}({self.status} {self.url})"
\ No newline at end of file
+        return f"{type(self).__name__}({self.status} {self.url})"
+
+
+class StreamResponse:
+    """
+    Response which body is consumed incrementally as async iterator of chunks
+    rather than read to memory at once. Body can be consumed only once.
+    """
+
+    def __init__(
+        self,
+        url: URL,
+        status: int,
+        *,
+        chunks: AsyncIterator[bytes],
+        method: str = "GET",
+        headers: Dict = None,
+        encoding: str = "utf-8",
+        request: Optional["Request"] = None,
+        meta: Dict = None,
+        decompress: bool = False,
+    ) -> None:
+        self.status = status
+        self.encoding = encoding
+        self.method = method
+        self.url = url
+        self.headers = headers or {}
+        self.request = request
+        self.meta = meta or {}
+        self.decompress = decompress
+        self.bytes_read = 0  # raw bytes received before decompression
+        self._chunks = chunks
+        self._consumed = False
+
+    async def iter_chunks(self) -> AsyncIterator[bytes]:
+        """iterate through (decompressed) body chunks"""
+        if self._consumed:
+            raise RuntimeError("response body stream has already been consumed")
+        self._consumed = True
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if self.decompress else None
+        async for chunk in self._chunks:
+            self.bytes_read += len(chunk)
+            if decompressor is None:
+                yield chunk
+                continue
+            while chunk:
+                data = decompressor.decompress(chunk)
+                if data:
+                    yield data
+                # gzip stream can have multiple members
+                if decompressor.eof:
+                    chunk = decompressor.unused_data
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                else:
+                    chunk = b""
+        if decompressor is not None:
+            tail = decompressor.flush()
+            if tail:
+                yield tail
+
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        return self.iter_chunks()
+
+    async def iter_json(self, loads: Callable[[bytes], Any] = None) -> AsyncIterator[Any]:
+        """
+        decode items of top level JSON array as body streams in,
+        so huge arrays are processed without holding whole body in memory:
+
+            async for item in resp.iter_json():
+                ...
+        """
+        loads = loads or jsonlib.loads
+        splitter = jsonlib.JsonArraySplitter()
+        async for chunk in self.iter_chunks():
+            for item in splitter.feed(chunk):
+                yield loads(item)
+        splitter.close()
+
+    async def to_file(self, file: Union[str, os.PathLike, IO[bytes]]) -> int:
+        """spill body to file path or binary file object; returns amount of bytes written"""
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, "wb") as f:
+                return await self.to_file(f)
+        written = 0
+        async for chunk in self:
+            file.write(chunk)
+            written += len(chunk)
+        return written
+
+    async def read_into(self, buffer: Union[bytearray, memoryview]) -> int:
+        """read body into preallocated writable buffer; returns amount of bytes written"""
+        view = memoryview(buffer).cast("B")
+        written = 0
+        async for chunk in self:
+            end = written + len(chunk)
+            if end > len(view):
+                raise ValueError(f"response body doesn't fit into buffer of {len(view)} bytes")
+            view[written:end] = chunk
+            written = end
+        return written
+
+    async def read(self) -> Response:
+        """buffer whole body and return regular Response"""
+        content = b"".join([chunk async for chunk in self])
+        return Response(
+            url=self.url,
+            status=self.status,
+            content=content,
+            method=self.method,
+            headers=self.headers,
+            encoding=self.encoding,
+            request=self.request,
+            meta=self.meta,
+        )
+
+    @classmethod
+    def from_aiohttp(
+        cls,
+        response: ClientResponse,
+        request: Optional["Request"] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        decompress: bool = True,
+    ) -> "StreamResponse":
+        headers = response.headers
+        return cls(
+            url=response.url,
+            status=response.status,
+            chunks=response.content.iter_chunked(chunk_size),
+            method=response.method,
+            headers=headers,
+            encoding=response.charset or "utf-8",
+            request=request,
+            decompress=decompress and headers.get("Content-Type") == "application/x-gzip",
+        )
+
+    @classmethod
+    def from_response(cls, response: Response, chunk_size: int = DEFAULT_CHUNK_SIZE) -> "StreamResponse":
+        """stream already buffered Response, e.g. one returned by middleware"""
+        content = response.content
+
+        async def chunks():
+            for start in range(0, len(content), chunk_size):
+                yield content[start : start + chunk_size]
+
+        return cls(
+            url=response.url,
+            status=response.status,
+            chunks=chunks(),
+            method=response.method,
+            headers=response.headers,
+            encoding=response.encoding,
+            request=response.request,
+            meta=response.meta,
+        )
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.status} {self.url})"
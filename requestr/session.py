@@ -1 +1,150 @@
+import asyncio
+from collections import Counter, OrderedDict
+from time import monotonic
+from typing import Dict, Iterator, Optional, Tuple
+
 from aiohttp import ClientSession as Session
+from loguru import logger as log
+
+
+class SessionPool:
+    """
+    Slot -> Session mapping with optional size bound and idle expiration:
+    - when pool exceeds max_size least recently used session is evicted and closed
+    - sessions that were idle for longer than ttl seconds are closed by background reaper
+    Sessions that are in use (checked out) are never closed under running requests,
+    evicted busy sessions are closed once last request checks them back in.
+    """
+
+    def __init__(self, max_size: Optional[int] = None, ttl: Optional[float] = None, reap_interval: float = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.reap_interval = reap_interval or (ttl / 2 if ttl else None)
+        self.stats = Counter()
+        # ordered from least to most recently used
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._last_used: Dict[str, float] = {}
+        self._busy: Dict[Session, int] = {}
+        self._evicted = set()
+        self._reaper: Optional[asyncio.Task] = None
+
+    def get(self, key: str) -> Optional[Session]:
+        """retrieve session and mark it as recently used"""
+        try:
+            session = self._sessions[key]
+        except KeyError:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        self._touch(key)
+        return session
+
+    async def put(self, key: str, session: Session) -> Session:
+        """register session under key, replacing (and closing) existing one"""
+        if key in self._sessions:
+            await self._discard(key)
+        self._sessions[key] = session
+        self._last_used[key] = monotonic()
+        if self.max_size:
+            while len(self._sessions) > self.max_size:
+                lru_key = next(iter(self._sessions))
+                log.debug(f'evicting least recently used session "{lru_key}"')
+                self.stats["evictions"] += 1
+                await self._discard(lru_key)
+        if self.ttl and self._reaper is None:
+            self._reaper = asyncio.ensure_future(self._reap_forever())
+        return session
+
+    def checkout(self, session: Session) -> Session:
+        """mark session as in use so it's not closed under running request"""
+        self._busy[session] = self._busy.get(session, 0) + 1
+        return session
+
+    async def checkin(self, session: Session, key: str = None):
+        """release session checked out by `checkout`"""
+        count = self._busy.get(session, 0) - 1
+        if count > 0:
+            self._busy[session] = count
+            return
+        self._busy.pop(session, None)
+        if session in self._evicted:
+            self._evicted.discard(session)
+            await session.close()
+        elif key in self._sessions:
+            self._touch(key)
+
+    async def reap(self) -> int:
+        """close sessions that have been idle for longer than ttl; returns amount of closed sessions"""
+        if not self.ttl:
+            return 0
+        deadline = monotonic() - self.ttl
+        expired = []
+        for key in self._sessions:
+            # sessions are ordered by last use so we can stop at first fresh one
+            if self._last_used[key] > deadline:
+                break
+            if self._sessions[key] not in self._busy:
+                expired.append(key)
+        for key in expired:
+            log.debug(f'closing session "{key}" idle for more than {self.ttl} seconds')
+            self.stats["expired"] += 1
+            await self._discard(key)
+        return len(expired)
+
+    async def _reap_forever(self):
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            await self.reap()
+
+    def _touch(self, key: str):
+        self._sessions.move_to_end(key)
+        self._last_used[key] = monotonic()
+
+    async def _discard(self, key: str):
+        session = self._sessions.pop(key)
+        del self._last_used[key]
+        if session in self._busy:
+            self._evicted.add(session)
+        else:
+            await session.close()
+
+    async def close(self):
+        """close all sessions and stop reaper"""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        sessions, evicted = list(self._sessions.items()), list(self._evicted)
+        self._sessions.clear()
+        self._last_used.clear()
+        self._busy.clear()
+        self._evicted.clear()
+        for key, session in sessions:
+            log.debug(f'closing session "{key}"')
+            await session.close()
+        for session in evicted:
+            await session.close()
+
+    @property
+    def live(self) -> int:
+        return len(self._sessions)
+
+    def snapshot(self) -> Dict[str, int]:
+        return {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, **self.stats, "live": self.live}
+
+    def items(self) -> Iterator[Tuple[str, Session]]:
+        return iter(list(self._sessions.items()))
+
+    def __getitem__(self, key: str) -> Session:
+        return self._sessions[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._sessions
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._sessions))
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(live={self.live}, max_size={self.max_size}, ttl={self.ttl})"
@@ -0,0 +1,217 @@
+import asyncio
+import multiprocessing
+import os
+import pickle
+import queue
+import threading
+import zlib
+from itertools import count
+from multiprocessing.connection import Connection
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger as log
+
+from requestr.downloader import Downloader
+from requestr.request import Request
+from requestr.response import Response
+
+
+def _dumps(message: Tuple) -> bytes:
+    try:
+        data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+        if message[2] is not None:
+            # exceptions with custom constructors may pickle but fail to unpickle
+            pickle.loads(data)
+        return data
+    except Exception as e:
+        job_id, _, exc = message
+        error = RuntimeError(
+            f"unpicklable shard result: {exc!r}" if exc is not None else f"unpicklable shard result: {e}"
+        )
+        return pickle.dumps((job_id, None, error))
+
+
+class _PipeWriter:
+    """
+    Sends messages to pipe from dedicated thread: blocking writes on event loop would deadlock
+    parent and shard once both pipe buffers fill up, as neither of them reads while it's stuck writing.
+    """
+
+    def __init__(self, conn: Connection, name: str) -> None:
+        self.conn = conn
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def send(self, data: bytes):
+        self._queue.put(data)
+
+    def _run(self):
+        while True:
+            data = self._queue.get()
+            if data is None:
+                return
+            try:
+                self.conn.send_bytes(data)
+            except OSError:
+                # other side went away, its reader reports that
+                return
+
+    def close(self, timeout: float = None):
+        """stop once queued messages are sent"""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+async def _handle(dl: Downloader, writer: _PipeWriter, job_id: int, req: Request, callback: Optional[Callable]):
+    try:
+        result = await dl.send(req)
+        if callback is not None:
+            result = await dl.offload(callback, result)
+        message = (job_id, result, None)
+    except Exception as e:
+        message = (job_id, None, e)
+    writer.send(_dumps(message))
+
+
+async def _serve(conn: Connection, downloader_kwargs: Dict):
+    loop = asyncio.get_running_loop()
+    jobs = asyncio.Queue()
+
+    def receive():
+        try:
+            jobs.put_nowait(pickle.loads(conn.recv_bytes()))
+        except EOFError:
+            # parent went away
+            loop.remove_reader(conn.fileno())
+            jobs.put_nowait(None)
+
+    loop.add_reader(conn.fileno(), receive)
+    writer = _PipeWriter(conn, "requestr-shard-writer")
+    tasks = set()
+    async with Downloader(**downloader_kwargs) as dl:
+        while True:
+            job = await jobs.get()
+            if job is None:
+                break
+            task = asyncio.ensure_future(_handle(dl, writer, *job))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        loop.remove_reader(conn.fileno())
+        await asyncio.gather(*tasks, return_exceptions=True)
+    await loop.run_in_executor(None, writer.close)
+    conn.close()
+
+
+def _shard_main(conn: Connection, downloader_kwargs: Dict):
+    asyncio.run(_serve(conn, downloader_kwargs))
+
+
+class ShardedDownloader:
+    """
+    Runs `shards` Downloader event loops in separate processes to use multiple cores.
+    Requests are routed to shards by slot, so session, cookies and rate limit of every slot
+    live in exactly one process, and responses are sent back pickled:
+
+        async with ShardedDownloader(shards=4, limit=10) as dl:
+            data = await dl.send(Request(url), callback=parse)
+
+    with `callback` response is processed in shard process and only its (picklable) result
+    is sent back, which keeps parsing off the main event loop and avoids shipping bodies.
+    Keyword arguments are passed to every shard's Downloader and have to be picklable.
+    Unix only: shard pipes are watched with event loop readers.
+    """
+
+    def __init__(self, shards: int = None, mp_context: str = "spawn", **downloader_kwargs) -> None:
+        self.shards = shards or os.cpu_count() or 1
+        self.mp_context = mp_context
+        self.downloader_kwargs = downloader_kwargs
+        self.stats = {"sent": 0, "received": 0, "failed": 0}
+        self._conns: List[Connection] = []
+        self._writers: List[_PipeWriter] = []
+        self._processes: List[multiprocessing.Process] = []
+        self._pending: Dict[int, Tuple[int, asyncio.Future]] = {}
+        self._ids = count()
+
+    def shard(self, slot: str) -> int:
+        """index of shard serving slot; stable across processes unlike `hash()`"""
+        return zlib.crc32(slot.encode()) % self.shards
+
+    async def open(self):
+        ctx = multiprocessing.get_context(self.mp_context)
+        loop = asyncio.get_running_loop()
+        for i in range(self.shards):
+            conn, child_conn = ctx.Pipe()
+            process = ctx.Process(
+                target=_shard_main,
+                args=(child_conn, self.downloader_kwargs),
+                name=f"requestr-shard-{i}",
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            loop.add_reader(conn.fileno(), self._receive, i, conn)
+            self._conns.append(conn)
+            self._writers.append(_PipeWriter(conn, f"requestr-shard-{i}-writer"))
+            self._processes.append(process)
+        log.info(f"started {self.shards} downloader shards")
+
+    def _receive(self, shard: int, conn: Connection):
+        try:
+            job_id, result, exc = pickle.loads(conn.recv_bytes())
+        except EOFError:
+            asyncio.get_running_loop().remove_reader(conn.fileno())
+            self._fail_shard(shard)
+            return
+        _, future = self._pending.pop(job_id, (None, None))
+        if future is None or future.done():
+            return
+        if exc is not None:
+            self.stats["failed"] += 1
+            future.set_exception(exc)
+        else:
+            self.stats["received"] += 1
+            future.set_result(result)
+
+    def _fail_shard(self, shard: int):
+        for job_id, (job_shard, future) in list(self._pending.items()):
+            if job_shard == shard:
+                del self._pending[job_id]
+                if not future.done():
+                    future.set_exception(ConnectionError(f"downloader shard {shard} exited"))
+
+    async def send(self, req: Request, callback: Callable[[Response], Any] = None) -> Any:
+        """send request through shard of its slot; returns response or result of `callback`"""
+        shard = self.shard(req.slot)
+        future = asyncio.get_running_loop().create_future()
+        job_id = next(self._ids)
+        self._pending[job_id] = (shard, future)
+        self._writers[shard].send(pickle.dumps((job_id, req, callback), protocol=pickle.HIGHEST_PROTOCOL))
+        self.stats["sent"] += 1
+        try:
+            return await future
+        finally:
+            self._pending.pop(job_id, None)
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        for writer in self._writers:
+            writer.send(pickle.dumps(None))
+        for process in self._processes:
+            await loop.run_in_executor(None, process.join, 30)
+            if process.is_alive():
+                process.terminate()
+        for writer in self._writers:
+            await loop.run_in_executor(None, writer.close, 5)
+        for conn in self._conns:
+            loop.remove_reader(conn.fileno())
+            conn.close()
+        self._conns, self._writers, self._processes = [], [], []
+        log.info(f"closed downloader shards: {self.stats}")
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
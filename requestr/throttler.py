@@ -1,36 +1,356 @@
 import asyncio
-from typing import Deque
-from time import time
+import heapq
+import warnings
+from collections import Counter, deque
+from itertools import count
+from typing import Deque, Dict, List, Optional, Tuple
 
+# tolerance for float rounding of refilled tokens and timer wakeups
+EPSILON = 1e-9
 
-class Throttler:
-    def __init__(self, rate_limit, period=1.0, retry_interval=0.01):
-        self.rate_limit = rate_limit
+
+class TokenBucket:
+    """
+    token bucket refilled at `rate` tokens per second up to `capacity` tokens;
+    waiters are kept in heap of (-priority, seq, future) so higher priority is served first
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "waiters", "scheduled")
+
+    def __init__(self, rate: float, capacity: float, now: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self.scheduled = False
+
+    def refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    @property
+    def ready(self) -> bool:
+        return self.tokens >= 1 - EPSILON
+
+    def delay(self) -> float:
+        """seconds until next token is available"""
+        return 0.0 if self.ready else (1 - self.tokens) / self.rate
+
+    @property
+    def priority(self) -> int:
+        """priority of next waiter"""
+        return -self.waiters[0][0] if self.waiters else 0
+
+    @property
+    def idle(self) -> bool:
+        return not self.waiters and not self.scheduled and self.tokens >= self.capacity - EPSILON
+
+
+class RateScheduler:
+    """
+    Central rate limiter of all slots: every slot has its own token bucket
+    and optionally all slots share global bucket capping total rate.
+
+    Slots with waiting requests are kept in a heap keyed by time their next token is available
+    and single timer wakes up only the waiters that can proceed, so cost doesn't grow with amount of slots.
+    Waiters of higher priority go first both within slot and among slots competing for global tokens,
+    slots of same priority are served round-robin.
+    """
+
+    def __init__(self, global_limit: Optional[float] = None, period: float = 1.0) -> None:
+        self.global_limit = global_limit
         self.period = period
-        self.retry_interval = retry_interval
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.stats = Counter()
+        self._global: Optional[TokenBucket] = None
+        self._heap: List[Tuple[float, int, str]] = []
+        self._seq = count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_at = float("inf")
+        self._waking = False
+        self._prune_at = 1024
 
-        self._task_logs = Deque()
+    def limiter(self, slot: str, max_rate: float, time_period: float = 1.0) -> "SlotLimiter":
+        """limiter of single slot for `async with` use"""
+        return SlotLimiter(self, slot, max_rate, time_period)
 
-    def flush(self):
-        now = time()
-        while self._task_logs:
-            if now - self._task_logs[0] > self.period:
-                self._task_logs.popleft()
-            else:
-                break
+    def _bucket(self, slot: str, rate: float, capacity: float, now: float) -> TokenBucket:
+        bucket = self.buckets.get(slot)
+        if bucket is None:
+            if len(self.buckets) >= self._prune_at:
+                self.prune()
+            bucket = self.buckets[slot] = TokenBucket(rate, capacity, now)
+        else:
+            bucket.refill(now)
+            bucket.rate, bucket.capacity = rate, capacity
+        return bucket
 
-    async def acquire(self):
-        while True:
-            self.flush()
-            if len(self._task_logs) < self.rate_limit:
-                break
-            await asyncio.sleep(self.retry_interval)
+    def _global_bucket(self, now: float) -> Optional[TokenBucket]:
+        if not self.global_limit:
+            return None
+        if self._global is None:
+            self._global = TokenBucket(self.global_limit / self.period, self.global_limit, now)
+        else:
+            self._global.refill(now)
+        return self._global
+
+    async def acquire(self, slot: str, rate: float, capacity: float = None, priority: int = 0):
+        """wait until slot (and global budget) has a token and consume it; higher `priority` goes first"""
+        loop = asyncio.get_event_loop()
+        now = loop.time()
+        # bucket has to hold at least one token or it never gets ready at rates below 1/s
+        bucket = self._bucket(slot, rate, max(capacity or rate, 1), now)
+        global_bucket = self._global_bucket(now)
+        # requests due for global token that are waiting to be woken up go first
+        if (
+            not bucket.waiters
+            and bucket.ready
+            and (global_bucket is None or (global_bucket.ready and not self._due(now)))
+        ):
+            self._consume(bucket, global_bucket)
+            self.stats["acquired"] += 1
+            return
+
+        waiter = loop.create_future()
+        entry = (-priority, next(self._seq), waiter)
+        heapq.heappush(bucket.waiters, entry)
+        self._schedule(slot, bucket, global_bucket, now, loop)
+        self.stats["waits"] += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if entry in bucket.waiters:
+                bucket.waiters.remove(entry)
+                heapq.heapify(bucket.waiters)
+            raise
+        finally:
+            self.stats["waited"] += loop.time() - now
+        self.stats["acquired"] += 1
+
+    def _due(self, now: float) -> bool:
+        """whether some slot is due to be served by the timer"""
+        return bool(self._heap) and self._heap[0][0] <= now + EPSILON
+
+    @staticmethod
+    def _consume(bucket: TokenBucket, global_bucket: Optional[TokenBucket]):
+        bucket.tokens -= 1
+        if global_bucket is not None:
+            global_bucket.tokens -= 1
+
+    def _schedule(
+        self, slot: str, bucket: TokenBucket, global_bucket: Optional[TokenBucket], now: float, loop, seq: int = None
+    ):
+        if bucket.scheduled:
+            return
+        delay = bucket.delay()
+        if global_bucket is not None:
+            delay = max(delay, global_bucket.delay())
+        bucket.scheduled = True
+        heapq.heappush(self._heap, (now + delay, next(self._seq) if seq is None else seq, slot))
+        if not self._waking:
+            self._arm(loop)
+
+    def _arm(self, loop):
+        when = self._heap[0][0]
+        if self._timer is not None:
+            if when >= self._timer_at:
+                return
+            self._timer.cancel()
+        self._timer_at = when
+        self._timer = loop.call_at(when, self._wake, loop)
+
+    def _wake(self, loop):
+        self._timer, self._timer_at = None, float("inf")
+        self._waking = True
+        now = loop.time()
+        due = []
+        while self._heap and self._heap[0][0] <= now + EPSILON:
+            _, seq, slot = heapq.heappop(self._heap)
+            bucket = self.buckets[slot]
+            bucket.scheduled = False
+            # drop cancelled waiters
+            while bucket.waiters and bucket.waiters[0][2].done():
+                heapq.heappop(bucket.waiters)
+            if bucket.waiters:
+                due.append((-bucket.priority, seq, slot, bucket))
+        due.sort()
+        global_bucket = self._global_bucket(now)
+        for _, seq, slot, bucket in due:
+            bucket.refill(now)
+            # one token per slot visit so slots take turns on global budget;
+            # slot that wasn't served keeps its place in line
+            if bucket.ready and (global_bucket is None or global_bucket.ready):
+                self._consume(bucket, global_bucket)
+                heapq.heappop(bucket.waiters)[2].set_result(None)
+                seq = None
+            if bucket.waiters:
+                self._schedule(slot, bucket, global_bucket, now, loop, seq=seq)
+        self._waking = False
+        if self._heap:
+            self._arm(loop)
+
+    def pause(self, slot: str, seconds: float):
+        """hold back slot so its next token is available only after `seconds`"""
+        bucket = self.buckets.get(slot)
+        if bucket is None:
+            return
+        bucket.refill(asyncio.get_event_loop().time())
+        bucket.tokens = min(bucket.tokens, 1 - seconds * bucket.rate)
+
+    def prune(self):
+        """forget buckets of idle slots; full bucket is same as new one"""
+        now = asyncio.get_event_loop().time()
+        for bucket in self.buckets.values():
+            bucket.refill(now)
+        for slot in [slot for slot, bucket in self.buckets.items() if bucket.idle]:
+            del self.buckets[slot]
+        self._prune_at = max(1024, len(self.buckets) * 2)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_timer"], state["_timer_at"] = None, float("inf")
+        return state
+
+
+class SlotLimiter:
+    """`aiolimiter.AsyncLimiter` compatible handle to slot of RateScheduler"""
 
-        self._task_logs.append(time())
+    def __init__(self, scheduler: RateScheduler, slot: str, max_rate: float, time_period: float = 1.0) -> None:
+        self.scheduler = scheduler
+        self.slot = slot
+        self.max_rate = max_rate
+        self.time_period = time_period
+
+    async def acquire(self, priority: int = 0):
+        await self.scheduler.acquire(self.slot, self.max_rate / self.time_period, self.max_rate, priority)
 
     async def __aenter__(self):
         await self.acquire()
 
-
     async def __aexit__(self, exc_type, exc, tb):
         pass
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.slot!r}, {self.max_rate}/{self.time_period}s)"
+
+
+class Throttler(SlotLimiter):
+    """standalone rate limiter of `rate_limit` tasks per `period` seconds"""
+
+    def __init__(self, rate_limit, period=1.0, retry_interval=None):
+        if retry_interval is not None:
+            # waiters are woken up by timer instead of polling
+            warnings.warn("Throttler retry_interval is ignored and will be removed", DeprecationWarning, stacklevel=2)
+        super().__init__(RateScheduler(), "", rate_limit, period)
+        self.rate_limit = rate_limit
+        self.period = period
+
+
+class DelayQueue:
+    """
+    Timer heap of delayed tasks, e.g. retries waiting for their backoff:
+    all waiters share single loop timer armed for the earliest deadline.
+    """
+
+    def __init__(self) -> None:
+        self._heap: List[Tuple[float, int, asyncio.Future]] = []
+        self._seq = count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_at = float("inf")
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    async def sleep(self, seconds: float):
+        """wait in queue until `seconds` have passed"""
+        loop = asyncio.get_event_loop()
+        waiter = loop.create_future()
+        when = loop.time() + seconds
+        heapq.heappush(self._heap, (when, next(self._seq), waiter))
+        self._arm(loop)
+        await waiter
+
+    def _arm(self, loop):
+        when = self._heap[0][0]
+        if self._timer is not None:
+            if when >= self._timer_at:
+                return
+            self._timer.cancel()
+        self._timer_at = when
+        self._timer = loop.call_at(when, self._wake, loop)
+
+    def _wake(self, loop):
+        self._timer, self._timer_at = None, float("inf")
+        now = loop.time()
+        while self._heap and self._heap[0][0] <= now + EPSILON:
+            _, _, waiter = heapq.heappop(self._heap)
+            if not waiter.done():
+                waiter.set_result(None)
+        if self._heap:
+            self._arm(loop)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_timer"], state["_timer_at"] = None, float("inf")
+        return state
+
+
+class SendWindow:
+    """
+    Concurrency window of bulk sending: requests waiting in DelayQueue
+    give up their place so fresh work can proceed and rejoin the window once due.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._freed: Optional[asyncio.Future] = None
+
+    @property
+    def full(self) -> bool:
+        return self.active >= self.size
+
+    def reserve(self):
+        """take place in window without waiting"""
+        self.active += 1
+
+    async def acquire(self):
+        while self.active >= self.size:
+            waiter = asyncio.get_event_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # place freed for this waiter goes to the next one
+                if waiter.done() and not waiter.cancelled():
+                    self._wake()
+                raise
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._wake()
+
+    def _wake(self):
+        # requests rejoining window take precedence over new work
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        if self._freed is not None and not self._freed.done():
+            self._freed.set_result(None)
+
+    def freed(self) -> asyncio.Future:
+        """future resolved once window has room for new work"""
+        if self._freed is None or self._freed.done():
+            self._freed = asyncio.get_event_loop().create_future()
+            if not self.full and not self._waiters:
+                self._freed.set_result(None)
+        return self._freed
@@ -0,0 +1,163 @@
+"""
+Transports carry requests of `Downloader.send` over network (or not at all):
+middleware pipeline, rate limiter, retries and stats run on top of them unchanged.
+
+Every slot session is created by its transport and remembers it, so slots can be served by different transports.
+Response is fetched in two steps so network time and body read time can be told apart:
+`request` returns raw response once its headers arrive and `read` or `stream` turn it to `Response`.
+"""
+
+import asyncio
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, Optional, Union
+
+from aiohttp import ClientConnectionError, ClientResponse
+from aiohttp import ClientSession as Session
+
+from requestr.request import Request
+from requestr.response import DEFAULT_CHUNK_SIZE, Response, StreamResponse
+from requestr.utils import request_fingerprint
+
+
+class Transport:
+    """base of transports; `session_cls` creates slot sessions holding connections, cookies etc."""
+
+    session_cls: Callable = Session
+
+    def new_session(self, session_cls: Callable = None, **session_kwargs) -> Any:
+        return (session_cls or self.session_cls)(**session_kwargs)
+
+    async def request(self, req: Request, session: Any) -> Any:
+        """send request and return raw response once its headers arrive"""
+        raise NotImplementedError
+
+    async def read(self, raw: Any, session: Any) -> Response:
+        """read whole body of raw response"""
+        raise NotImplementedError
+
+    def stream(
+        self,
+        raw: Any,
+        session: Any,
+        request: Optional[Request] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        decompress: bool = True,
+    ) -> StreamResponse:
+        """wrap raw response which body is consumed incrementally"""
+        raise NotImplementedError
+
+    async def release(self, raw: Any, session: Any):
+        """free connection of streamed raw response"""
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}()"
+
+
+class AiohttpTransport(Transport):
+    """default transport: aiohttp `ClientSession` per slot with HTTP/1.1 connection pool"""
+
+    def __init__(self, session_cls: Callable = Session) -> None:
+        self.session_cls = session_cls
+
+    async def request(self, req: Request, session: Session) -> ClientResponse:
+        return await session._request(**req.aiohttp_kwargs())
+
+    async def read(self, raw: ClientResponse, session: Session) -> Response:
+        return await Response.from_aiohttp(raw)
+
+    def stream(
+        self,
+        raw: ClientResponse,
+        session: Session,
+        request: Optional[Request] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        decompress: bool = True,
+    ) -> StreamResponse:
+        return StreamResponse.from_aiohttp(raw, request=request, chunk_size=chunk_size, decompress=decompress)
+
+    async def release(self, raw: ClientResponse, session: Session):
+        raw.release()
+
+
+class NullSession:
+    """slot session of transports without connection state"""
+
+    def __init__(self, **session_kwargs) -> None:
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+class ReplayTransport(Transport):
+    """
+    Zero network transport answering requests with recorded responses, e.g. to benchmark
+    scheduler and middleware overhead in isolation or to test middlewares deterministically:
+
+        transport = ReplayTransport([resp1, resp2])  # matched by fingerprint of `resp.request`
+        transport = ReplayTransport(lambda req: Response(req.url, 200, content=b"ok"))
+        async with Downloader(transport=transport) as dl:
+            ...
+
+    requests are matched by `request_fingerprint` including values of `headers`;
+    unmatched requests fail with `ClientConnectionError` like unreachable hosts do.
+    Every response is a copy so recorded ones are never modified.
+    """
+
+    session_cls = NullSession
+
+    def __init__(
+        self,
+        responses: Union[Iterable[Response], Callable[[Request], Optional[Response]]] = (),
+        latency: float = 0.0,
+        headers: Iterable[str] = (),
+    ) -> None:
+        self.latency = latency
+        self.headers = tuple(headers)
+        self.stats = Counter()
+        self.responses: Dict[str, Response] = {}
+        self.responder: Optional[Callable[[Request], Optional[Response]]] = None
+        if callable(responses):
+            self.responder = responses
+        else:
+            for resp in responses:
+                self.add(resp)
+
+    def fingerprint(self, req: Request) -> str:
+        return request_fingerprint(req, headers=self.headers)
+
+    def add(self, resp: Response, req: Request = None):
+        """record response to `req`, by default to the request it was received for"""
+        self.responses[self.fingerprint(req or resp.request)] = resp
+
+    def find(self, req: Request) -> Optional[Response]:
+        """recorded response to request"""
+        if self.responder is not None:
+            return self.responder(req)
+        return self.responses.get(self.fingerprint(req))
+
+    async def request(self, req: Request, session: NullSession) -> Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        resp = self.find(req)
+        if resp is None:
+            self.stats["misses"] += 1
+            raise ClientConnectionError(f"no recorded response for {req}")
+        self.stats["hits"] += 1
+        return resp.copy(request=req)
+
+    async def read(self, raw: Response, session: NullSession) -> Response:
+        return raw
+
+    def stream(
+        self,
+        raw: Response,
+        session: NullSession,
+        request: Optional[Request] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        decompress: bool = True,
+    ) -> StreamResponse:
+        return StreamResponse.from_response(raw, chunk_size=chunk_size)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(responses={len(self.responses)}, latency={self.latency})"
@@ -1,3 +1,53 @@
+import hashlib
+import json
+from typing import Any, Iterable, Mapping, Optional, TYPE_CHECKING
+
+from yarl import URL
+
+if TYPE_CHECKING:
+    from requestr.request import Request
+
+
 def domain_from_url(url: str):
     """gets domain from url sometimes"""
-    return str(url).split("://", 1)[-1].split("/")[0]
\ No newline at end of file
+    return str(url).split("://", 1)[-1].split("/")[0]
+
+
+def canonical_url(url: URL, params: Optional[Mapping[str, str]] = None) -> str:
+    """url with params appended like aiohttp does, query sorted and fragment dropped so equivalent urls compare equal"""
+    url = URL(url)
+    if params:
+        url = url.extend_query(params)
+    if url.query_string:
+        url = url.with_query(sorted(url.query.items()))
+    return str(url.with_fragment(None))
+
+
+def _body_bytes(data: Any) -> bytes:
+    if data is None:
+        return b""
+    if isinstance(data, bytes):
+        return data
+    if isinstance(data, str):
+        return data.encode()
+    if isinstance(data, Mapping):
+        return json.dumps(sorted((str(k), str(v)) for k, v in data.items())).encode()
+    return repr(data).encode()
+
+
+def request_fingerprint(req: "Request", headers: Iterable[str] = ()) -> str:
+    """
+    hash identifying equivalent requests: method, canonical url, body
+    and values of selected headers (case insensitive names)
+    """
+    fp = hashlib.sha1()
+    fp.update(req.method.upper().encode())
+    fp.update(b"\0" + canonical_url(req.url, req.params).encode())
+    fp.update(b"\0" + _body_bytes(req.data))
+    if req.json is not None:
+        fp.update(b"\0" + json.dumps(req.json, sort_keys=True).encode())
+    if headers:
+        req_headers = {str(k).lower(): v for k, v in (req.headers or {}).items()}
+        for name in sorted(h.lower() for h in headers):
+            fp.update(b"\0" + name.encode() + b":" + str(req_headers.get(name, "")).encode())
+    return fp.hexdigest()
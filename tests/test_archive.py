@@ -0,0 +1,96 @@
+import os
+
+import pytest
+from multidict import CIMultiDict
+from yarl import URL
+
+from requestr import Request, Response
+from requestr.archive import Archive, ArchiveTransport
+from requestr.downloader import Downloader
+from requestr.middlewares import ArchiveRecorder
+
+
+def exchange(i: int):
+    req = Request(f"http://example.com/{i}", "POST", params={"q": "x"}, data=b"body", headers={"X-Id": str(i)})
+    resp = Response(
+        URL(f"http://example.com/{i}?q=x"),
+        200 if i % 2 else 404,
+        content=b"<p>%d</p>" % i * 50,
+        headers=CIMultiDict([("Content-Type", "text/html"), ("Set-Cookie", "a=1"), ("Set-Cookie", "b=2")]),
+        request=req,
+        elapsed=0.25,
+    )
+    return req, resp
+
+
+def test_Archive(tmp_path):
+    with Archive(tmp_path, segment_size=2048) as archive:
+        for i in range(20):
+            archive.write(*exchange(i))
+        req, resp = exchange(3)
+        replayed = archive.get(req)
+        assert replayed.status == 200 and replayed.content == resp.content and replayed.elapsed == 0.25
+        assert replayed.headers.getall("Set-Cookie") == ["a=1", "b=2"]
+        assert replayed.request.method == "POST" and replayed.request.headers["X-Id"] == "3"
+        assert replayed.meta["archived"] and str(replayed.url) == "http://example.com/3?q=x"
+        assert archive.get(Request("http://example.com/missing")) is None
+    assert len(archive.segments) > 1
+    # index is rebuilt from segment files on reopen
+    with Archive(tmp_path) as archive:
+        assert len(archive) == 20
+        assert exchange(7)[0] in archive
+        assert [resp.status for resp in archive] == [404, 200] * 10
+        assert archive.get(exchange(4)[0]).content == exchange(4)[1].content
+
+
+def test_Archive_torn_write(tmp_path):
+    with Archive(tmp_path) as archive:
+        archive.write(*exchange(1))
+    segment = os.path.join(tmp_path, "segment-00000.warc.gz")
+    size = os.path.getsize(segment)
+    # process died in the middle of second exchange
+    with open(segment, "ab") as f:
+        f.write(b"\x1f\x8b partial")
+    with open(os.path.join(tmp_path, "segment-00000.idx"), "a") as f:
+        f.write("deadbeef 1")
+    with Archive(tmp_path) as archive:
+        assert len(archive) == 1
+        assert os.path.getsize(segment) == size
+        archive.write(*exchange(2))
+    with Archive(tmp_path) as archive:
+        assert [resp.request.url.path for resp in archive] == ["/1", "/2"]
+
+
+def test_Archive_request_body(tmp_path):
+    reqs = [
+        Request("http://example.com/json", "POST", json={"b": [1, 2], "a": None}),
+        Request("http://example.com/form", "POST", data={"q": "x y", "empty": ""}),
+        Request("http://example.com/text", "POST", data="żodis"),
+        Request("http://example.com/bytes", "POST", data=b"\x00\xff"),
+        Request("http://example.com/none"),
+    ]
+    with Archive(tmp_path) as archive:
+        for req in reqs:
+            archive.write(req, Response(req.url, 200, request=req))
+        # rebuilt requests have the same body and fingerprint as recorded ones
+        for req in reqs:
+            replayed = archive.get(req).request
+            assert (replayed.data, replayed.json) == (req.data, req.json)
+            assert archive.fingerprint(replayed) == archive.fingerprint(req)
+
+
+@pytest.mark.asyncio
+async def test_archive_record_and_replay(httpbin, tmp_path):
+    recorder = ArchiveRecorder(Archive(tmp_path))
+    async with Downloader(mwares={100: recorder}) as dl:
+        live = [await dl.send(Request(f"{httpbin.url}/{path}")) for path in ("html", "json", "status/418")]
+        assert dl.stats["archive/recorded"] == 3
+    transport = ArchiveTransport(Archive(tmp_path))
+    async with Downloader(transport=transport, mwares={100: ArchiveRecorder(Archive(tmp_path))}) as dl:
+        replayed = [await dl.send(Request(f"{httpbin.url}/{path}")) for path in ("html", "json", "status/418")]
+        # replayed responses aren't recorded again
+        assert not dl.stats["archive/recorded"]
+    assert [resp.status for resp in replayed] == [resp.status for resp in live] == [200, 200, 418]
+    assert replayed[0].text == live[0].text
+    assert replayed[1].json == live[1].json
+    assert transport.stats == {"hits": 3}
@@ -8,9 +8,13 @@ from aiohttp import BasicAuth
 from aiohttp import TCPConnector
 from aiohttp.client_exceptions import ClientConnectionError
 from requestr import Request, Response, Session
-from requestr.downloader import Downloader, DEFAULT_HEADERS
+from requestr.downloader import Downloader, DEFAULT_HEADERS, _send_window
 from requestr.exceptions import MwareRedirectLimit, RequestFailed
 from requestr.middlewares import Middleware, RetryStatuses
+from requestr.instrument import Profiler
+from requestr.metrics import Metrics
+from requestr.shards import ShardedDownloader
+from requestr.transport import ReplayTransport
 from yarl import URL
 
 
@@ -262,3 +266,251 @@ async def test_downloader_session_cookies(httpbin):
     # ensure explicit existing slot works
     resp = await dl.send(Request(httpbin + "/cookies", slot=_resp.request.slot))
     assert resp.json["cookies"] == {"my_cookie": "foobar"}
+
+
+@pytest.mark.asyncio
+async def test_downloader_shared_connector(httpbin):
+    async with Downloader(shared_connector=True) as dl:
+        await dl.send(Request(httpbin + "/html", slot="foo"))
+        await dl.send(Request(httpbin + "/html", slot="bar"))
+        foo, bar = dl.sessions["foo"], dl.sessions["bar"]
+        assert foo.connector is bar.connector is dl.connector
+        assert foo.cookie_jar is not bar.cookie_jar
+        assert foo.limiter is not bar.limiter
+        # replacing slot session keeps shared connector open
+        await dl.new_session("foo")
+        assert foo.closed and not dl.connector.closed
+        connector = dl.connector
+    assert connector.closed
+
+
+@pytest.mark.asyncio
+async def test_downloader_stream(httpbin):
+    async with Downloader() as dl:
+        async with dl.stream(Request(httpbin + "/bytes/100000"), chunk_size=1024) as resp:
+            assert resp.status == 200
+            chunks = [chunk async for chunk in resp]
+        assert len(chunks) > 1
+        assert sum(len(chunk) for chunk in chunks) == 100000
+        # request middlewares still apply
+        assert resp.request.headers["User-Agent"]
+
+
+@pytest.mark.asyncio
+async def test_downloader_coalesce(httpbin):
+    async with Downloader(coalesce=True) as dl:
+        reqs = [Request(httpbin + "/delay/1?b=2&a=1") for i in range(4)] + [Request(httpbin + "/delay/1?a=1&b=2")]
+        resps = await asyncio.gather(*[dl.send(req) for req in reqs])
+        assert [resp.request for resp in resps] == reqs
+        assert len({id(resp) for resp in resps}) == 5
+        assert len({resp.content for resp in resps}) == 1
+        assert {"req/scheduled": 5, "req/sent": 1, "req/coalesced": 4}.items() <= dl.stats.items()
+        # different slot doesn't share download
+        await asyncio.gather(dl.send(Request(httpbin + "/html")), dl.send(Request(httpbin + "/html", slot="other")))
+        assert dl.stats["req/sent"] == 3
+        assert not dl._inflight
+
+
+@pytest.mark.asyncio
+async def test_downloader_send_many(httpbin):
+    pulled = []
+
+    def reqs():
+        for i in range(6):
+            pulled.append(i)
+            yield Request(httpbin + f"/delay/{(6 - i) / 10}?i={i}")
+
+    async with Downloader() as dl:
+        results = dl.send_many(reqs(), concurrency=2, ordered=True)
+        req, resp = await results.__anext__()
+        # requests are pulled lazily
+        assert pulled == [0, 1]
+        assert resp.request is req
+        results = [(req, resp)] + [result async for result in results]
+        assert [req.url.query["i"] for req, _ in results] == [str(i) for i in range(6)]
+
+        async def areqs():
+            yield Request(httpbin + "/status/200")
+            yield Request(httpbin + "/status/404")
+            yield Request("http://doesnotexist-for-sure.io/")
+
+        results = [result async for result in dl.send_many(areqs(), return_exceptions=True, mwares={})]
+        assert len(results) == 3
+        assert sum(isinstance(resp, ClientConnectionError) for _, resp in results) == 1
+        assert sorted(resp.status for _, resp in results if isinstance(resp, Response)) == [200, 404]
+        with pytest.raises(ClientConnectionError):
+            [result async for result in dl.send_many(areqs(), mwares={})]
+
+
+@pytest.mark.asyncio
+async def test_downloader_metrics(httpbin):
+    async with Downloader(metrics=Metrics(traffic=True, sample_rate=1)) as dl:
+        await asyncio.gather(*[dl.send(Request(httpbin + "/bytes/1000")) for i in range(3)])
+        await dl.send(Request(httpbin + "/status/404"))
+        slot = Request(httpbin.url).slot
+        snapshot = dl.metrics_snapshot()
+        assert snapshot["responses_total"] == {f'{{slot="{slot}",status="200"}}': 3, f'{{slot="{slot}",status="404"}}': 1}
+        assert snapshot["bytes_in_total"][f'{{slot="{slot}"}}'] >= 3000
+        assert snapshot["ttfb_seconds"][f'{{slot="{slot}"}}']["count"] == 4
+        assert snapshot["response_seconds"][f'{{slot="{slot}"}}']["p50"] > 0
+        assert snapshot["middleware_seconds"]['{hook="request",middleware="RandomUserAgent"}']["count"] == 4
+        assert snapshot["session_pool"]['{key="live"}'] == 1
+        text = dl.prometheus()
+        assert "# TYPE requestr_ttfb_seconds histogram" in text
+        assert f'requestr_responses_total{{slot="{slot}",status="200"}} 3' in text
+        assert f'requestr_response_seconds_bucket{{slot="{slot}",le="+Inf"}} 4' in text
+    # slots beyond the cap share one label
+    metrics = Metrics(max_slots=2)
+    assert [metrics.slot(slot) for slot in "abca"] == ["a", "b", "_other", "a"]
+    assert Metrics(per_slot=False).slot("a") == "*"
+    assert not Downloader().metrics
+    # unsampled requests are counted but their middleware hooks aren't timed
+    async with Downloader(metrics=Metrics(sample_rate=0)) as dl:
+        await dl.send(Request(httpbin + "/status/200"))
+        snapshot = dl.metrics_snapshot()
+        assert "responses_total" in snapshot and "middleware_seconds" not in snapshot
+
+
+@pytest.mark.asyncio
+async def test_downloader_send_many_deferred_retry(httpbin):
+    async with Downloader(mwares={0: RetryStatuses(500, times=1, sleep=1)}) as dl:
+        reqs = [Request(httpbin + "/status/500"), Request(httpbin + "/status/200"), Request(httpbin + "/status/201")]
+        results = [result async for result in dl.send_many(reqs, concurrency=1, return_exceptions=True)]
+        # retrying request waits outside of concurrency window
+        assert [type(resp) for _, resp in results] == [Response, Response, RequestFailed]
+        assert [req.url.path for req, _ in results] == ["/status/200", "/status/201", "/status/500"]
+
+
+@pytest.mark.asyncio
+async def test_downloader_send_many_ordered_bounded():
+    started = []
+
+    class Slow(Middleware):
+        async def request(self, req, session, dl, **meta):
+            started.append(req)
+            if req.url.path == "/0":
+                await asyncio.sleep(0.2)
+
+    def respond(req):
+        return Response(req.url, 200, request=req)
+
+    async with Downloader(mwares={0: Slow()}, transport=ReplayTransport(respond)) as dl:
+        reqs = [Request(f"http://example.com/{i}") for i in range(20)]
+        results = dl.send_many(reqs, concurrency=3, ordered=True)
+        req, _ = await results.__anext__()
+        # finished requests behind slow first one count towards concurrency until yielded
+        assert req is reqs[0] and len(started) == 3
+        assert [req for req, _ in [(req, None)] + [result async for result in results]] == reqs
+        # leftover requests are cancelled and awaited when consumer stops early
+        results = dl.send_many(reqs, concurrency=3)
+        await results.__anext__()
+        await results.aclose()
+        assert not [task for task in asyncio.all_tasks() if getattr(task, "request", None) in reqs]
+
+
+@pytest.mark.asyncio
+async def test_downloader_send_many_cancelled_deferred():
+    windows = []
+
+    class Window(Middleware):
+        async def request(self, req, session, dl, **meta):
+            windows.append(_send_window.get())
+
+    def respond(req):
+        return Response(req.url, 500 if req.url.path == "/fail" else 200, request=req)
+
+    mwares = {0: Window(), 1: RetryStatuses(500, times=1, sleep=0.05)}
+    async with Downloader(mwares=mwares, transport=ReplayTransport(respond, latency=0.2)) as dl:
+        reqs = [Request("http://example.com/fail"), Request("http://example.com/ok")]
+
+        async def cancel_deferred():
+            # failed request is due at 0.25s and waits for place taken by second one
+            await asyncio.sleep(0.3)
+            task = next(task for task in asyncio.all_tasks() if getattr(task, "request", None) is reqs[0])
+            task.cancel()
+
+        canceller = asyncio.ensure_future(cancel_deferred())
+        with pytest.raises(asyncio.CancelledError):
+            [result async for result in dl.send_many(reqs, concurrency=1)]
+        await canceller
+        await asyncio.sleep(0.3)
+    # request cancelled while waiting to rejoin window didn't release place it didn't hold
+    assert windows[0].active == 0
+
+
+@pytest.mark.asyncio
+async def test_downloader_retry_budget(httpbin):
+    dl = Downloader(mwares={0: RetryStatuses(500, times=5, sleep=0, budget=0.1, budget_cap=1)})
+    with pytest.raises(RequestFailed) as exc:
+        await dl.send(Request(httpbin + "/status/500"))
+    assert "budget" in exc.value.reason
+    assert {"req/retry": 1, "req/sent": 2, "req/retry/budget_exhausted": 1}.items() <= dl.stats.items()
+    await dl.close()
+
+
+def _status(resp):
+    return resp.status
+
+
+@pytest.mark.asyncio
+async def test_downloader_offload(httpbin):
+    async with Downloader(executor="thread") as dl:
+        resp = await dl.send(Request(httpbin.url + "/json"))
+        assert await dl.offload(lambda resp: resp.json["slideshow"]["title"], resp) == "Sample Slide Show"
+        results = [result async for _, result in dl.send_many([Request(httpbin.url + "/status/201")], callback=_status)]
+        assert results == [201]
+
+
+@pytest.mark.asyncio
+async def test_sharded_downloader(httpbin):
+    async with ShardedDownloader(shards=2, mwares={}) as dl:
+        resp = await dl.send(Request(httpbin.url + "/status/200"))
+        assert resp.status == 200
+        statuses = await asyncio.gather(
+            *[dl.send(Request(httpbin.url + "/status/201", slot=f"slot{i}"), callback=_status) for i in range(4)]
+        )
+        assert statuses == [201] * 4
+        assert dl.shard("slot1") == dl.shard("slot1")
+        assert dl.stats == {"sent": 5, "received": 5, "failed": 0}
+
+
+_LARGE = b"x" * 2**18
+
+
+def _large_response(req):
+    return Response(req.url, 200, content=_LARGE, request=req)
+
+
+@pytest.mark.asyncio
+async def test_sharded_downloader_large_payloads():
+    # requests and responses far larger than pipe buffers in flight both ways at once
+    async with ShardedDownloader(shards=1, mwares={}, transport=ReplayTransport(_large_response)) as dl:
+        reqs = [Request(f"http://example.com/{i}", meta={"payload": _LARGE}) for i in range(200)]
+        resps = await asyncio.gather(*[dl.send(req) for req in reqs])
+        assert all(resp.content == _LARGE for resp in resps)
+        assert dl.stats == {"sent": 200, "received": 200, "failed": 0}
+
+
+@pytest.mark.asyncio
+async def test_downloader_profiler(httpbin):
+    class SlowMiddleware(Middleware):
+        async def request(self, req, session, dl, **meta):
+            await asyncio.sleep(0.05)
+
+    profiler = Profiler()
+    async with Downloader(mwares={0: SlowMiddleware(), 1: RetryStatuses()}, metrics=False, instrument=profiler) as dl:
+        for _ in range(2):
+            await dl.send(Request(httpbin.url + "/status/200"))
+    snapshot = profiler.snapshot()
+    # phases are ordered by total time so slow middleware comes first
+    assert list(snapshot)[0] == "middleware/SlowMiddleware.request"
+    assert snapshot["middleware/SlowMiddleware.request"]["count"] == 2
+    assert snapshot["middleware/RetryStatuses.response"]["count"] == 2
+    for phase in ("session", "limiter", "network", "read"):
+        assert snapshot[phase]["count"] == 2
+    assert "SlowMiddleware.request" in profiler.report()
+
+    sampled = Profiler(sample_rate=0)
+    async with Downloader(mwares={}, metrics=False, instrument=sampled) as dl:
+        await dl.send(Request(httpbin.url + "/status/200"))
+    assert sampled.sampled == 0 and not sampled.timings
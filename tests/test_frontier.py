@@ -0,0 +1,72 @@
+import pytest
+from requestr.downloader import Downloader
+from requestr.frontier import Frontier
+from requestr.request import Request
+
+
+def test_Frontier_fair_dequeue(tmp_path):
+    with Frontier(tmp_path / "frontier.sqlite") as frontier:
+        frontier.push_many([Request(f"http://foo.com/{i}") for i in range(3)])
+        frontier.push_many([Request(f"http://bar.com/{i}") for i in range(2)])
+        assert len(frontier) == 5
+        order = []
+        while True:
+            req = frontier.pop()
+            if req is None:
+                break
+            order.append(str(req.url))
+            frontier.done(req)
+        assert order == [
+            "http://foo.com/0",
+            "http://bar.com/0",
+            "http://foo.com/1",
+            "http://bar.com/1",
+            "http://foo.com/2",
+        ]
+        assert frontier.stats() == {"pending": 0, "in_progress": 0, "done": 5, "failed": 0}
+
+
+def test_Frontier_resume(tmp_path):
+    path = tmp_path / "frontier.sqlite"
+    frontier = Frontier(path)
+    frontier.push_many([Request("http://foo.com/1", meta={"retries": 2}), Request("http://foo.com/2")])
+    first = frontier.pop()
+    assert first.meta["retries"] == 2
+    frontier.done(first)
+    frontier.pop()
+    # process dies without completing claimed request
+    frontier.close()
+
+    frontier = Frontier(path)
+    assert len(frontier) == 1
+    req = frontier.pop()
+    assert str(req.url) == "http://foo.com/2"
+    assert frontier.pop() is None
+    frontier.failed(req, "boom")
+    assert frontier.stats() == {"pending": 0, "in_progress": 0, "done": 1, "failed": 1}
+    frontier.close()
+
+
+def test_Frontier_release_keeps_meta(tmp_path):
+    with Frontier(tmp_path / "frontier.sqlite") as frontier:
+        frontier.push(Request("http://foo.com/1"))
+        req = frontier.pop()
+        req.meta["retries"] = 3
+        frontier.release(req)
+        assert frontier.pop().meta == {"retries": 3, "frontier_id": 1}
+
+
+@pytest.mark.asyncio
+async def test_Frontier_crawl(httpbin, tmp_path):
+    with Frontier(tmp_path / "frontier.sqlite") as frontier:
+        frontier.push(Request(httpbin.url + "/status/200"))
+        statuses = []
+        async with Downloader() as dl:
+            async for req, resp in frontier.crawl(dl, concurrency=2):
+                statuses.append(resp.status)
+                if len(statuses) < 3:
+                    # requests pushed while processing are crawled too
+                    frontier.push(Request(httpbin.url + "/status/200"))
+        assert statuses == [200, 200, 200]
+        assert frontier.stats()["done"] == 3
+        assert frontier.claimed == 0
@@ -0,0 +1,126 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("httpx")
+h2 = pytest.importorskip("h2")
+import h2.config
+import h2.connection
+import h2.events
+
+from requestr import Request
+from requestr.downloader import Downloader
+from requestr.http2 import Http2Session
+from requestr.middlewares import RetryStatuses
+
+
+class H2Server:
+    """cleartext (h2c) HTTP/2 server counting connections and concurrently open streams"""
+
+    def __init__(self, delay: float = 0.05) -> None:
+        self.delay = delay
+        self.connections = 0
+        self.active = 0
+        self.peak = 0
+        self.url = ""
+        self._server = None
+
+    async def __aenter__(self):
+        loop = asyncio.get_running_loop()
+        self._server = await loop.create_server(lambda: H2Protocol(self), "127.0.0.1", 0)
+        self.url = f"http://127.0.0.1:{self._server.sockets[0].getsockname()[1]}"
+        return self
+
+    async def __aexit__(self, *args):
+        self._server.close()
+        await self._server.wait_closed()
+
+
+class H2Protocol(asyncio.Protocol):
+    def __init__(self, server: H2Server) -> None:
+        self.server = server
+        self.conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False))
+        self.headers = {}
+
+    def connection_made(self, transport):
+        self.server.connections += 1
+        self.transport = transport
+        self.conn.initiate_connection()
+        transport.write(self.conn.data_to_send())
+
+    def data_received(self, data: bytes):
+        for event in self.conn.receive_data(data):
+            if isinstance(event, h2.events.RequestReceived):
+                self.headers[event.stream_id] = dict(event.headers)
+            elif isinstance(event, h2.events.StreamEnded):
+                asyncio.ensure_future(self.respond(event.stream_id))
+            elif isinstance(event, h2.events.ConnectionTerminated):
+                self.transport.close()
+        self.transport.write(self.conn.data_to_send())
+
+    async def respond(self, stream_id: int):
+        headers = self.headers.pop(stream_id)
+        path = headers[b":path"].decode()
+        self.server.active += 1
+        self.server.peak = max(self.server.peak, self.server.active)
+        await asyncio.sleep(self.server.delay)
+        self.server.active -= 1
+        status = "503" if path.startswith("/unavailable") else "200"
+        body = json.dumps({"path": path, "stream": stream_id, "cookie": headers.get(b"cookie", b"").decode()}).encode()
+        self.conn.send_headers(
+            stream_id,
+            [(":status", status), ("content-type", "application/json"), ("content-length", str(len(body)))],
+        )
+        self.conn.send_data(stream_id, body, end_stream=True)
+        self.transport.write(self.conn.data_to_send())
+
+
+@pytest.mark.asyncio
+async def test_http2_multiplexing():
+    # streams stay open long enough to overlap even on a loaded machine
+    async with H2Server(delay=0.3) as server, Downloader(http2=True) as dl:
+        await dl.new_session("127.0.0.1", prior_knowledge=True)
+        reqs = [Request(f"{server.url}/{i}", cookies={"id": str(i)}) for i in range(100)]
+        resps = await asyncio.gather(*[dl.send(req) for req in reqs])
+        assert isinstance(dl.sessions["127.0.0.1"], Http2Session)
+    assert [resp.json["path"] for resp in resps] == [f"/{i}" for i in range(100)]
+    assert [resp.json["cookie"] for resp in resps] == [f"id={i}" for i in range(100)]
+    assert all(resp.status == 200 and resp.request is req for resp, req in zip(resps, reqs))
+    assert resps[0].headers["Content-Type"] == "application/json"
+    # all requests shared single connection as concurrent streams
+    assert server.connections == 1
+    assert server.peak > 50
+
+
+@pytest.mark.asyncio
+async def test_http2_slot_selection_and_middlewares(httpbin):
+    async with H2Server(delay=0) as server, Downloader(http2=["h2"]) as dl:
+        await dl.new_session("h2", prior_knowledge=True)
+        resp = await dl.send(Request(httpbin.url + "/status/200"))
+        assert resp.status == 200
+        assert not isinstance(dl.sessions[resp.request.slot], Http2Session)
+        # retry middleware works the same over HTTP/2
+        mwares = {900: RetryStatuses(503, times=2, sleep=[0])}
+        with pytest.raises(Exception):
+            await dl.send(Request(server.url + "/unavailable", slot="h2"), mwares=mwares)
+        assert dl.stats["req/sent"] == 4
+        async with dl.stream(Request(server.url + "/streamed", slot="h2")) as stream:
+            body = b"".join([chunk async for chunk in stream.iter_chunks()])
+        assert json.loads(body)["path"] == "/streamed"
+
+
+@pytest.mark.asyncio
+async def test_http2_session_cls():
+    async with H2Server(delay=0) as server:
+        # per slot session class picks HTTP/2 transport
+        async with Downloader() as dl:
+            await dl.new_session("127.0.0.1", session_cls=Http2Session, prior_knowledge=True)
+            resp = await dl.send(Request(server.url + "/one"))
+            assert resp.json["path"] == "/one"
+            with pytest.raises(TypeError):
+                await dl.new_session("other", session_cls=Http2Session, transport=dl.transport)
+        async with Downloader(session_cls=Http2Session, session_kwargs={"prior_knowledge": True}) as dl:
+            resp = await dl.send(Request(server.url + "/two"))
+            assert resp.json["path"] == "/two"
+    assert server.connections == 2
@@ -1,7 +1,17 @@
+import hashlib
+
 import pytest
-from requestr.middlewares import (RandomUserAgent, RetryExceptions,
+from aiohttp import ServerTimeoutError
+from requestr.downloader import DEFAULT_MWARES, Downloader
+from requestr.exceptions import RequestDropped, RequestFailed
+from requestr.middlewares import (AutoThrottle, Dedup, HttpCache, Middleware, RandomUserAgent, RetryExceptions,
                                   RetryStatuses)
+from requestr.middlewares.dedup import BloomFilter, ExactFilter
+from requestr.middlewares.throttle import SlotState, retry_after
+from requestr.pipeline import MiddlewarePipeline, PipelineCache
 from requestr.request import Request
+from requestr.response import Response
+from requestr.transport import ReplayTransport
 
 
 def test_add_RetryExceptions():
@@ -26,3 +36,208 @@ async def test_RandomUserAgent(mocker):
         req = Request("http://httpbin.org/")
         await mw.request(req, None, None)
         assert req.headers == {"User-Agent": rand}
+
+
+def test_MiddlewarePipeline():
+    class Resp(Middleware):
+        async def response(self, resp, req, session, dl, **meta):
+            return
+
+    ua, retry_status, retry_exc, resp_mw = RandomUserAgent("foo"), RetryStatuses(), RetryExceptions(), Resp()
+    pipeline = MiddlewarePipeline({900: retry_status, 100: ua, 1000: retry_exc, 500: resp_mw})
+    # request hooks in ascending order, response hooks descending; no-op hooks are skipped
+    assert [mw for mw, _ in pipeline.request] == [ua, retry_status, retry_exc]
+    assert [mw for mw, _ in pipeline.response] == [retry_status, resp_mw]
+    assert [mw for mw, _ in pipeline.response_exception] == [retry_exc]
+    # observers see responses ahead of the rest whatever their priority
+    resp_mw.observer = True
+    pipeline = MiddlewarePipeline({900: retry_status, 100: ua, 1000: retry_exc, 500: resp_mw})
+    assert [mw for mw, _ in pipeline.response] == [resp_mw, retry_status]
+
+
+def test_PipelineCache():
+    cache = PipelineCache(size=2)
+    mwares = {0: RandomUserAgent("foo")}
+    pipeline = cache.get(mwares)
+    assert cache.get(mwares) is pipeline
+    # equal but different dict is compiled separately
+    assert cache.get(dict(mwares)) is not pipeline
+    # mutating middleware set recompiles
+    mwares[1] = RetryStatuses()
+    recompiled = cache.get(mwares)
+    assert recompiled is not pipeline
+    assert len(recompiled.request) == 2
+    cache.get({})
+    cache.get({})
+    assert len(cache) == 2
+
+
+@pytest.mark.asyncio
+async def test_HttpCache(httpbin, tmp_path):
+    cache = HttpCache(tmp_path / "cache.sqlite", ttl=0)
+    async with Downloader(mwares={500: cache}) as dl:
+        # max-age from Cache-Control
+        first = await dl.send(Request(httpbin + "/cache/60"))
+        second = await dl.send(Request(httpbin + "/cache/60"))
+        assert not first.meta.get("cached")
+        assert second.meta["cached"] and second.content == first.content
+        # stale entries are revalidated and 304 is served from cache
+        first = await dl.send(Request(httpbin + "/cache"))
+        second = await dl.send(Request(httpbin + "/cache"))
+        assert second.status == 200
+        assert second.meta["cached"] and second.content == first.content
+        assert {
+            "cache/miss": 2,
+            "cache/hit": 1,
+            "cache/revalidate": 1,
+            "cache/not_modified": 1,
+            "cache/store": 2,
+            "req/sent": 3,
+        }.items() <= dl.stats.items()
+    assert cache._db is None
+    # body is stored decoded so headers of encoded wire body aren't kept
+    async with Downloader(mwares={500: HttpCache(tmp_path / "cache.sqlite")}) as dl:
+        first = await dl.send(Request(httpbin + "/gzip"))
+        cached = await dl.send(Request(httpbin + "/gzip"))
+    assert first.headers["Content-Encoding"] == "gzip"
+    assert cached.meta["cached"] and "Content-Encoding" not in cached.headers
+    assert cached.headers["Content-Length"] == str(len(cached.content))
+
+
+def test_retry_after():
+    assert retry_after("120") == 120
+    assert retry_after("") is None
+    assert retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert retry_after("foo") is None
+
+
+@pytest.mark.asyncio
+async def test_AutoThrottle(httpbin):
+    throttle = AutoThrottle(window=4, cooldown=60)
+    async with Downloader(mwares={500: throttle}, limit=10) as dl:
+        await dl.send(Request(httpbin + "/status/200"))
+        limiter = dl.sessions[Request(httpbin.url).slot].limiter
+        assert limiter.max_rate == 10.1
+        # backoff status halves rate, burst of them only once within cooldown
+        await dl.send(Request(httpbin + "/status/429"))
+        await dl.send(Request(httpbin + "/status/503"))
+        assert limiter.max_rate == 5.05
+        assert dl.stats["autothrottle/decrease"] == 1
+
+
+@pytest.mark.asyncio
+async def test_AutoThrottle_behind_retries():
+    def respond(req):
+        if req.url.path == "/timeout":
+            raise ServerTimeoutError("read timeout")
+        return Response(req.url, 429, request=req)
+
+    throttle = AutoThrottle(cooldown=0)
+    mwares = {**DEFAULT_MWARES, 900: RetryStatuses(429, sleep=[0]), 500: throttle}
+    async with Downloader(mwares=mwares, limit=100, transport=ReplayTransport(respond)) as dl:
+        # every attempt backs off although retry middlewares handle them first
+        with pytest.raises(RequestFailed):
+            await dl.send(Request("http://example.com/timeout"))
+        limiter = dl.sessions["example.com"].limiter
+        assert limiter.max_rate == 12.5
+        with pytest.raises(RequestFailed):
+            await dl.send(Request("http://example.com/banned"))
+        assert limiter.max_rate == 1.5625
+        assert dl.stats["autothrottle/decrease"] == 6
+
+
+@pytest.mark.asyncio
+async def test_AutoThrottle_rate_outlives_session():
+    def respond(req):
+        return Response(req.url, 429 if req.url.path == "/banned" else 200, request=req)
+
+    throttle = AutoThrottle(cooldown=0, increase=10, max_factor=2)
+    async with Downloader(mwares={500: throttle}, limit=10, transport=ReplayTransport(respond)) as dl:
+        await dl.send(Request("http://example.com/banned"))
+        assert dl.sessions["example.com"].limiter.max_rate == 5
+        # session recreated with Downloader limit continues at learned rate
+        await dl.new_session("example.com")
+        assert dl.sessions["example.com"].limiter.max_rate == 10
+        await dl.send(Request("http://example.com/ok"))
+        assert dl.sessions["example.com"].limiter.max_rate == 7
+        # growth stops at `max_factor` times starting rate
+        for _ in range(30):
+            await dl.send(Request("http://example.com/ok"))
+        assert dl.sessions["example.com"].limiter.max_rate == 20
+
+
+def test_SlotState_p95():
+    state = SlotState(window=20)
+    state.latencies.extend(range(1, 21))
+    assert state.p95 == 20
+
+
+@pytest.mark.asyncio
+async def test_RetryMW_budget_eviction():
+    mw = RetryStatuses(budget=0.5, budget_cap=2)
+    dl = Downloader(mwares={})
+    for slot in ("a", "b"):
+        req = Request(f"http://{slot}.com")
+        await mw.request(req, None, dl)
+    # slots with full budget aren't tracked
+    assert mw._budgets == {}
+    await mw._retry(req, None, dl)
+    assert mw._budgets == {"b.com": 1}
+    await mw.request(Request("http://b.com"), None, dl)
+    assert mw._budgets == {"b.com": 1.5}
+    await mw.request(Request("http://b.com"), None, dl)
+    assert mw._budgets == {}
+    await dl.close()
+
+
+def test_RetryMW_jitter(mocker):
+    mocker.patch("random.uniform", lambda low, high: high / 2)
+    req = Request("http://httpbin.org/", meta={"retries": 2})
+    assert RetryStatuses(sleep=(0, 1, 4)).__add__(RetryStatuses(jitter=True))._amount_to_sleep(req) == 4
+    assert RetryStatuses(sleep=(0, 1, 4), jitter=True)._amount_to_sleep(req) == 2
+    # retries beyond backoff sequence reuse the last value
+    req.meta["retries"] = 5
+    assert RetryStatuses(sleep=(0, 1, 4))._amount_to_sleep(req) == 4
+
+
+@pytest.mark.asyncio
+async def test_Dedup(httpbin):
+    async with Downloader(mwares={0: Dedup()}) as dl:
+        resp = await dl.send(Request(httpbin.url + "/get?b=2&a=1#top"))
+        assert resp.status == 200
+        with pytest.raises(RequestDropped):
+            await dl.send(Request(httpbin.url + "/get", params={"a": "1", "b": "2"}))
+        # different method is different request
+        await dl.send(Request(httpbin.url + "/anything?a=1&b=2", method="POST"))
+        await dl.send(Request(httpbin.url + "/anything?a=1&b=2", meta={"dont_filter": True}))
+        assert dl.stats["dedup/seen"] == 2
+        assert dl.stats["dedup/dropped"] == 1
+
+
+def test_ExactFilter_persist(tmp_path):
+    path = tmp_path / "seen.bin"
+    seen = ExactFilter(path, buffer_size=4)
+    fps = [bytes([i]) * 20 for i in range(10)]
+    assert not any(seen.add(fp) for fp in fps)
+    assert all(seen.add(fp) for fp in fps)
+    seen.close()
+    seen = ExactFilter(path)
+    assert len(seen) == 10
+    assert all(fp in seen for fp in fps)
+    assert bytes([42]) * 20 not in seen
+
+
+def test_BloomFilter_persist(tmp_path):
+    path = tmp_path / "seen.bloom"
+    seen = BloomFilter(capacity=1000, error_rate=0.01, path=path)
+    fps = [hashlib.sha1(str(i).encode()).digest() for i in range(1000)]
+    for fp in fps:
+        seen.add(fp)
+    seen.close()
+    # size is kept from file regardless of arguments
+    seen = BloomFilter(capacity=10, path=path)
+    assert len(seen) <= 1000
+    assert all(fp in seen for fp in fps)
+    false_positives = sum(hashlib.sha1(str(i).encode()).digest() in seen for i in range(10_000, 20_000))
+    assert false_positives < 300
+    seen.close()
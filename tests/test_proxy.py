@@ -1,6 +1,15 @@
-from requestr.proxy import ProxyPool
+from collections import Counter
 import random
 
+import pytest
+from aiohttp.client_exceptions import ClientConnectionError
+from requestr import Request, Response
+from requestr.downloader import DEFAULT_MWARES, Downloader
+from requestr.exceptions import RequestFailed
+from requestr.middlewares import ManagedProxyPool, RetryStatuses, RotatingProxyPool
+from requestr.transport import ReplayTransport
+from requestr.proxy import ProxyBindings, ProxyManager, ProxyPool, WeightTree
+
 
 def test_ProxyPool():
     random.seed(0)
@@ -10,4 +19,141 @@ def test_ProxyPool():
     assert pool.random == 1
     assert pool.random == 3
     # pool refresh
-    assert pool.random == 3
\ No newline at end of file
+    assert pool.random == 3
+
+
+def test_WeightTree():
+    random.seed(0)
+    tree = WeightTree(4)
+    for i, weight in enumerate([1, 0, 3, 0]):
+        tree[i] = weight
+    assert tree.total == 4
+    picks = Counter(tree.pick() for _ in range(4000))
+    assert set(picks) == {0, 2}
+    assert 2.5 < picks[2] / picks[0] < 3.5
+    tree[0] = tree[2] = 0
+    assert tree.pick() is None
+
+
+def test_ProxyManager_quarantine(mocker):
+    now = mocker.patch("requestr.proxy.monotonic", return_value=100.0)
+    manager = ProxyManager(["http://a", "http://b"], quarantine_after=2, cooldown=10)
+    manager.success("http://a", latency=0.1)
+    manager.failure("http://b")
+    assert manager.score(0) > manager.score(1)
+    manager.failure("http://b")
+    # quarantined proxy gets no traffic until cool-down passes
+    assert {manager.random for _ in range(20)} == {"http://a"}
+    assert manager.snapshot()["http://b"]["quarantined"]
+    now.return_value = 111.0
+    assert "http://b" in {manager.random for _ in range(50)}
+    # repeated quarantine doubles cool-down
+    manager.failure("http://b", ban=True)
+    assert manager.health[1].quarantined_until == 111.0 + 20
+    with pytest.raises(ValueError):
+        ProxyManager([]).random
+
+
+@pytest.mark.asyncio
+async def test_ManagedProxyPool():
+    manager = ProxyManager(["http://a"], quarantine_after=10)
+    statuses = {"/error": 500, "/banned": 429}
+    proxies = []
+
+    def respond(req):
+        proxies.append(req.proxy)
+        if req.url.path == "/down":
+            raise ClientConnectionError("proxy down")
+        return Response(req.url, statuses.get(req.url.path, 200), request=req)
+
+    mwares = {**DEFAULT_MWARES, 950: RetryStatuses(500, 429, sleep=[0]), 500: ManagedProxyPool(manager)}
+    async with Downloader(mwares=mwares, transport=ReplayTransport(respond)) as dl:
+        # retry middlewares run after failures were recorded
+        with pytest.raises(RequestFailed):
+            await dl.send(Request("http://example.com/down"))
+        assert manager.health[0].failures == 3 and dl.stats["proxy/failed"] == 3
+        with pytest.raises(RequestFailed):
+            await dl.send(Request("http://example.com/error"))
+        assert manager.health[0].failures == 6
+        await dl.send(Request("http://example.com/ok"))
+        assert manager.health[0].successes == 1
+        with pytest.raises(RequestFailed):
+            await dl.send(Request("http://example.com/banned"))
+        assert dl.stats["proxy/banned"] == 3
+        assert manager.health[0].quarantined_until
+        # explicitly set proxy is left alone
+        await dl.send(Request("http://example.com/ok", proxy="http://mine"))
+    assert set(proxies[:-1]) == {"http://a"} and proxies[-1] == "http://mine"
+
+
+def test_ProxyBindings(mocker):
+    now = mocker.patch("requestr.proxy.monotonic", return_value=100.0)
+    bindings = ProxyBindings(ttl=10, max_requests=3, max_size=2)
+    assert bindings.get("a") is None
+    bindings.bind("a", "http://1")
+    assert bindings.get("a") == "http://1"
+    assert bindings.get("a") == "http://1"
+    # third use was the binding itself
+    assert bindings.get("a") is None
+    bindings.bind("a", "http://2")
+    now.return_value = 111.0
+    assert bindings.get("a") is None
+    # least recently used binding is dropped
+    for key in "abc":
+        bindings.bind(key, "http://1")
+    assert "a" not in bindings and len(bindings) == 2
+    bindings.unbind("b")
+    assert bindings.stats == {"bound": 5, "expired": 2, "rotated": 1}
+
+
+@pytest.mark.asyncio
+async def test_RotatingProxyPool_sticky():
+    random.seed(0)
+    failing = set()
+
+    def respond(req):
+        if req.proxy in failing:
+            raise ClientConnectionError("proxy down")
+        return Response(req.url, 200, request=req)
+
+    mw = RotatingProxyPool(ProxyPool([f"http://{i}" for i in range(10)]), sticky=True)
+    async with Downloader(mwares={**DEFAULT_MWARES, 500: mw}, transport=ReplayTransport(respond)) as dl:
+        reqs = [Request("http://example.com", slot=slot) for slot in ["a", "a", "b", "a"]]
+        for req in reqs:
+            await dl.send(req)
+        assert reqs[0].proxy == reqs[1].proxy == reqs[3].proxy != reqs[2].proxy
+        # session key overrides slot
+        req = Request("http://example.com", slot="b", meta={"session_key": "a"})
+        await dl.send(req)
+        assert req.proxy == reqs[0].proxy
+        # connection failure rotates binding before retry picks proxy again
+        failing.add(reqs[0].proxy)
+        resp = await dl.send(Request("http://example.com", slot="a"))
+        assert resp.status == 200 and resp.request.proxy != reqs[0].proxy
+        assert dl.stats["proxy/rotated"] == 1 and dl.stats["req/retry"] == 1
+
+
+@pytest.mark.asyncio
+async def test_ManagedProxyPool_sticky():
+    random.seed(0)
+    manager = ProxyManager([f"http://{i}" for i in range(10)])
+    banned = set()
+
+    def respond(req):
+        return Response(req.url, 429 if req.proxy in banned else 200, request=req)
+
+    mwares = {
+        **DEFAULT_MWARES,
+        900: RetryStatuses(429, sleep=[0]),
+        500: ManagedProxyPool(manager, sticky=True, sticky_requests=5),
+    }
+    async with Downloader(mwares=mwares, transport=ReplayTransport(respond)) as dl:
+        resps = [await dl.send(Request("http://example.com", slot="a")) for _ in range(3)]
+        proxy = resps[0].request.proxy
+        assert {resp.request.proxy for resp in resps} == {proxy}
+        # ban quarantines proxy and rotates binding so retry goes through another one
+        banned.add(proxy)
+        resp = await dl.send(Request("http://example.com", slot="a"))
+        assert resp.status == 200 and resp.request.proxy != proxy
+        assert manager.snapshot()[proxy]["quarantined"]
+        assert dl.stats["proxy/banned"] == 1
@@ -0,0 +1,82 @@
+import pickle
+from copy import copy
+
+from aiohttp import ClientTimeout
+from requestr import Request
+from requestr.utils import canonical_url, request_fingerprint
+from yarl import URL
+
+
+def test_request_lazy_fields():
+    req = Request("http://httpbin.org/html")
+    assert req._url == "http://httpbin.org/html"
+    assert req._meta is None and req._headers is None and req._options is None
+    assert req.slot == "httpbin.org"
+    assert req.url == URL("http://httpbin.org/html")
+    req.meta["foo"] = "bar"
+    req.headers["User-Agent"] = "foo"
+    assert req.meta == {"foo": "bar"}
+    assert req.headers == {"User-Agent": "foo"}
+    assert not hasattr(req, "__dict__")
+
+
+def test_request_options():
+    timeout = ClientTimeout(total=5)
+    req = Request("http://httpbin.org/html", allow_redirects=True, max_redirects=3, timeout=timeout)
+    # only non default options are stored
+    assert req._options == {"max_redirects": 3, "timeout": timeout}
+    assert req.allow_redirects is True
+    assert req.max_redicrects == 3
+    req.ssl = False
+    assert req.aiohttp_kwargs() == {
+        "method": "GET",
+        "str_or_url": URL("http://httpbin.org/html"),
+        "params": None,
+        "data": None,
+        "json": None,
+        "cookies": None,
+        "headers": None,
+        "proxy": None,
+        "proxy_auth": None,
+        "proxy_headers": None,
+        "max_redirects": 3,
+        "timeout": timeout,
+        "ssl": False,
+    }
+
+
+def test_request_copy_and_pickle():
+    req = Request(
+        "http://httpbin.org/html", slot="foo", meta={"retries": 1}, headers={"foo": "bar"}, compress="deflate"
+    )
+    for new in (copy(req), pickle.loads(pickle.dumps(req))):
+        assert new is not req
+        assert (new.url, new.slot, new.meta, new.headers, new.compress) == (
+            req.url,
+            "foo",
+            req.meta,
+            req.headers,
+            "deflate",
+        )
+        new.meta["retries"] += 1
+        new.headers["foo"] = "gaz"
+        assert req.meta == {"retries": 1}
+        assert req.headers == {"foo": "bar"}
+
+
+def test_request_url_change_keeps_slot():
+    req = Request("http://httpbin.org/html")
+    req.url = "http://example.com/"
+    assert req.slot == "httpbin.org"
+    assert req.url.host == "example.com"
+
+
+def test_canonical_url_duplicate_keys():
+    # params extend url query like aiohttp does rather than replacing its keys
+    assert canonical_url(URL("http://example.com/?b=2&a=1#top"), {"a": "3"}) == "http://example.com/?a=1&a=3&b=2"
+    assert request_fingerprint(Request("http://example.com/?a=1", params={"a": "2"})) != request_fingerprint(
+        Request("http://example.com/", params={"a": "2"})
+    )
+    assert request_fingerprint(Request("http://example.com/?a=1", params={"a": "2"})) == request_fingerprint(
+        Request("http://example.com/?a=2&a=1")
+    )
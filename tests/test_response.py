@@ -1,4 +1,10 @@
-from requestr import Response
+import codecs
+import json
+import pickle
+
+from multidict import CIMultiDict, CIMultiDictProxy
+from requestr import Response, StreamResponse, jsonlib
+from yarl import URL
 import pytest
 
 def test_response_init():
@@ -20,3 +26,118 @@ def test_invalid_json_response():
     resp = Response("http://httpbin.org", 200, content=b'{"foo": "bar"}')
     with pytest.raises(ValueError):
         assert resp.json
+
+
+async def _chunked(data, size=7):
+    for i in range(0, len(data), size):
+        yield data[i : i + size]
+
+
+@pytest.mark.asyncio
+async def test_stream_response_gzip():
+    import gzip
+
+    body = b"foobar" * 100
+    # multi member gzip stream should be decompressed as a whole
+    stream = StreamResponse("http://httpbin.org", 200, chunks=_chunked(gzip.compress(body) * 2), decompress=True)
+    assert b"".join([chunk async for chunk in stream]) == body * 2
+    assert stream.bytes_read == len(gzip.compress(body)) * 2
+    with pytest.raises(RuntimeError):
+        [chunk async for chunk in stream]
+
+
+@pytest.mark.asyncio
+async def test_stream_response_buffers(tmp_path):
+    resp = Response("http://httpbin.org", 200, content=b"foobar" * 10)
+    assert (await StreamResponse.from_response(resp, chunk_size=4).read()).content == resp.content
+    assert await StreamResponse.from_response(resp).to_file(tmp_path / "body") == 60
+    assert (tmp_path / "body").read_bytes() == resp.content
+    buffer = bytearray(100)
+    assert await StreamResponse.from_response(resp).read_into(buffer) == 60
+    assert buffer[:60] == resp.content
+    with pytest.raises(ValueError):
+        await StreamResponse.from_response(resp).read_into(bytearray(10))
+
+
+def test_response_pickle_drops_caches():
+    resp = Response(URL("http://example.com"), 200, content=b"<p>hi</p>", headers=CIMultiDictProxy(CIMultiDict(a="1")))
+    assert resp.tree.css("p::text").get() == "hi"
+    copy = pickle.loads(pickle.dumps(resp))
+    assert copy.content == b"<p>hi</p>"
+    assert copy.headers["A"] == "1"
+    assert copy.tree.css("p::text").get() == "hi"
+
+
+def test_response_encoding_detection():
+    html = '<html><head><meta charset="windows-1251"></head><body><p>привет</p></body></html>'.encode("cp1251")
+    resp = Response(URL("http://example.com"), 200, content=html, headers={"Content-Type": "text/html"})
+    assert resp.encoding == "cp1251"
+    # tree is parsed from body bytes without decoding text first
+    assert resp.tree.css("p::text").get() == "привет"
+    assert "text" not in resp._cache
+    assert resp.text.endswith("<p>привет</p></body></html>")
+
+    resp = Response(URL("http://example.com"), 200, content=html, headers={"Content-Type": "text/html; charset=UTF8"})
+    assert resp.encoding == "utf-8"
+    resp.encoding = "cp1251"
+    assert "привет" in resp.text
+
+    resp = Response(URL("http://example.com"), 200, content=codecs.BOM_UTF8 + "ąčę".encode())
+    assert resp.encoding == "utf-8-sig"
+    assert resp.text == "ąčę"
+
+
+def test_response_json_from_bytes():
+    resp = Response(
+        URL("http://example.com"), 200, content='{"foo": "ąčę"}'.encode(), headers={"Content-Type": "application/json"}
+    )
+    assert resp.json == {"foo": "ąčę"}
+    assert "text" not in resp._cache
+
+
+def test_response_get_json():
+    resp = Response(URL("http://example.com"), 200, content=b'{"foo": 1}', headers={"Content-Type": "text/plain"})
+    with pytest.raises(ValueError):
+        resp.get_json()
+    assert resp.get_json(content_type=None) == {"foo": 1}
+    assert resp.get_json(content_type="text/plain", loads=json.loads) == {"foo": 1}
+
+
+def test_jsonlib_backends():
+    assert jsonlib.backend in jsonlib.BACKENDS
+    previous = jsonlib.backend
+    jsonlib.use("json")
+    try:
+        assert jsonlib.loads(b'{"foo": [1, 2]}') == {"foo": [1, 2]}
+    finally:
+        jsonlib.use(previous)
+    with pytest.raises(ValueError):
+        jsonlib.use("nope")
+
+
+@pytest.mark.asyncio
+async def test_stream_response_iter_json():
+    items = [{"a": 'x,]}\\"[{'}, [1, [2]], "s", 3.5, None, {"nested": {"b": [True]}}]
+    body = json.dumps(items).encode()
+    for size in (1, 3, 7, len(body)):
+        stream = StreamResponse("http://httpbin.org", 200, chunks=_chunked(body, size))
+        assert [item async for item in stream.iter_json()] == items
+
+    stream = StreamResponse("http://httpbin.org", 200, chunks=_chunked(b"[1, 2", 2))
+    with pytest.raises(ValueError):
+        [item async for item in stream.iter_json()]
+    splitter = jsonlib.JsonArraySplitter()
+    assert splitter.feed(b" [] ") == []
+    with pytest.raises(ValueError):
+        jsonlib.JsonArraySplitter().feed(b'{"a": 1}')
+    with pytest.raises(ValueError):
+        jsonlib.JsonArraySplitter().feed(b"[1,]")
+    # long string split over many chunks is scanned once
+    splitter = jsonlib.JsonArraySplitter()
+    body = b'["' + b'a\\"' * 10000 + b'", 1]'
+    items = []
+    for i in range(0, len(body), 2):
+        items += splitter.feed(body[i : i + 2])
+        if splitter.in_string:
+            assert splitter.pos == len(splitter.buffer)
+    assert [json.loads(item) for item in items] == json.loads(body)
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+from requestr.session import SessionPool
+
+
+class FakeSession:
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_SessionPool_lru():
+    pool = SessionPool(max_size=2)
+    foo, bar, gaz = FakeSession(), FakeSession(), FakeSession()
+    await pool.put("foo", foo)
+    await pool.put("bar", bar)
+    assert pool.get("foo") is foo  # bar is now least recently used
+    await pool.put("gaz", gaz)
+    assert list(pool) == ["foo", "gaz"]
+    assert bar.closed and not foo.closed
+    assert pool.get("bar") is None
+    assert pool.snapshot() == {"hits": 1, "misses": 1, "evictions": 1, "expired": 0, "live": 2}
+    await pool.close()
+    assert foo.closed and gaz.closed
+    assert len(pool) == 0
+
+
+@pytest.mark.asyncio
+async def test_SessionPool_busy_eviction():
+    pool = SessionPool(max_size=1)
+    foo, bar = FakeSession(), FakeSession()
+    await pool.put("foo", pool.checkout(foo))
+    await pool.put("bar", bar)
+    # evicted session is closed only once it's released
+    assert "foo" not in pool and not foo.closed
+    await pool.checkin(foo, "foo")
+    assert foo.closed
+
+
+@pytest.mark.asyncio
+async def test_SessionPool_reaper():
+    pool = SessionPool(ttl=0.1, reap_interval=0.05)
+    foo, bar = FakeSession(), FakeSession()
+    await pool.put("foo", foo)
+    await pool.put("bar", pool.checkout(bar))
+    await asyncio.sleep(0.3)
+    # idle session is reaped, busy one is kept
+    assert foo.closed and not bar.closed
+    assert list(pool) == ["bar"]
+    assert pool.stats["expired"] == 1
+    await pool.close()
@@ -1,7 +1,7 @@
 import pytest
 import asyncio
-from time import time
-from requestr.throttler import Throttler
+from time import sleep, time
+from requestr.throttler import DelayQueue, RateScheduler, SendWindow, Throttler
 from aiolimiter import AsyncLimiter
 
 
@@ -18,3 +18,149 @@ async def test_Throttler():
     elapsed = time() - _start
     # 10 tasks per second (default) should take 5 seconds
     assert int(elapsed) == 5
+
+
+@pytest.mark.asyncio
+async def test_RateScheduler_slots():
+    scheduler = RateScheduler()
+
+    async def do(slot):
+        async with scheduler.limiter(slot, 5):
+            return time()
+
+    _start = time()
+    # 5 req/sec per slot: first 5 are instant, remaining 5 of each slot take a second
+    results = await asyncio.gather(*[do(slot) for slot in ("foo", "bar") for i in range(10)])
+    elapsed = time() - _start
+    assert 0.9 < elapsed < 1.2
+    assert sum(result - _start < 0.1 for result in results) == 10
+    assert scheduler.stats["acquired"] == 20
+    assert scheduler.stats["waits"] == 10
+
+
+@pytest.mark.asyncio
+async def test_RateScheduler_global_limit():
+    scheduler = RateScheduler(global_limit=10)
+    order = []
+
+    async def do(slot):
+        async with scheduler.limiter(slot, 100):
+            order.append(slot)
+
+    _start = time()
+    await asyncio.gather(*[do("foo") for i in range(15)], *[do("bar") for i in range(5)])
+    elapsed = time() - _start
+    # global 10 req/sec cap: 10 instant, 10 more in a second
+    assert 0.9 < elapsed < 1.2
+    # slots waiting for global budget take turns
+    assert order[10:16] == ["foo", "bar"] * 3
+
+
+@pytest.mark.asyncio
+async def test_RateScheduler_fractional_capacity():
+    scheduler = RateScheduler()
+    # half a request per 0.1s still lets requests through one at a time
+    limiter = scheduler.limiter("foo", 0.5, 0.1)
+    _start = time()
+    for i in range(2):
+        async with limiter:
+            pass
+    assert 0.15 < time() - _start < 0.4
+
+
+@pytest.mark.asyncio
+async def test_RateScheduler_priority():
+    scheduler = RateScheduler(global_limit=5)
+    order = []
+
+    async def do(slot, priority=0):
+        await scheduler.acquire(slot, 100, priority=priority)
+        order.append((slot, priority))
+
+    bulk = [asyncio.ensure_future(do("bulk")) for i in range(10)]
+    await asyncio.sleep(0.05)
+    # latency sensitive requests of other slot and of the same slot jump the queue
+    await asyncio.gather(*[do("refresh", 1) for i in range(3)], do("bulk", 2), *bulk)
+    assert order[5:9] == [("bulk", 2), ("refresh", 1), ("refresh", 1), ("refresh", 1)]
+    assert order[9:] == [("bulk", 0)] * 5
+
+
+@pytest.mark.asyncio
+async def test_RateScheduler_priority_fast_path():
+    scheduler = RateScheduler(global_limit=10)
+    order = []
+
+    async def do(slot, priority=0):
+        await scheduler.acquire(slot, 100, priority=priority)
+        order.append(slot)
+
+    for i in range(10):
+        await do("drain")
+    urgent = asyncio.ensure_future(do("urgent", 1))
+    await asyncio.sleep(0)
+    # global token refills while loop is busy, new request of other slot doesn't take it
+    sleep(0.15)
+    await do("bulk")
+    await urgent
+    assert order[10:] == ["urgent", "bulk"]
+
+
+@pytest.mark.asyncio
+async def test_RateScheduler_prune():
+    scheduler = RateScheduler()
+    await asyncio.gather(*[scheduler.acquire(f"slot{i}", 10) for i in range(100)])
+    assert len(scheduler.buckets) == 100
+    await asyncio.sleep(0.15)
+    scheduler.prune()
+    assert not scheduler.buckets
+
+
+@pytest.mark.asyncio
+async def test_Throttler_scheduler():
+    throttle = Throttler(10, 1)
+
+    async def do():
+        async with throttle:
+            await asyncio.sleep(1)
+
+    _start = time()
+    await asyncio.gather(*[do() for i in range(30)])
+    elapsed = time() - _start
+    assert int(elapsed) == 3
+
+
+def test_Throttler_retry_interval():
+    with pytest.deprecated_call():
+        throttle = Throttler(10, 1, retry_interval=0.01)
+    assert throttle.rate_limit == 10
+
+
+@pytest.mark.asyncio
+async def test_DelayQueue():
+    queue = DelayQueue()
+    order = []
+
+    async def do(delay):
+        await queue.sleep(delay)
+        order.append(delay)
+
+    _start = time()
+    await asyncio.gather(do(0.3), do(0.1), do(0.2), do(0))
+    assert order == [0, 0.1, 0.2, 0.3]
+    assert 0.3 <= time() - _start < 0.4
+    assert not len(queue)
+
+
+@pytest.mark.asyncio
+async def test_SendWindow_cancelled_waiter():
+    window = SendWindow(1)
+    window.reserve()
+    first = asyncio.ensure_future(window.acquire())
+    second = asyncio.ensure_future(window.acquire())
+    await asyncio.sleep(0)
+    # place handed to cancelled waiter goes to the next one
+    window.release()
+    first.cancel()
+    await asyncio.wait_for(second, 1)
+    assert first.cancelled()
+    assert window.active == 1
@@ -0,0 +1,52 @@
+import pytest
+from yarl import URL
+
+from requestr import Request, Response
+from requestr.downloader import Downloader
+from requestr.exceptions import RequestFailed
+from requestr.middlewares import RetryExceptions, RetryStatuses
+from requestr.transport import AiohttpTransport, NullSession, ReplayTransport
+
+
+def recorded(url: str, status: int = 200, content: bytes = b"ok") -> Response:
+    return Response(URL(url), status, content=content, request=Request(url))
+
+
+@pytest.mark.asyncio
+async def test_ReplayTransport():
+    transport = ReplayTransport([recorded("http://example.com/a", content=b"a"), recorded("http://example.com/b")])
+    async with Downloader(transport=transport, mwares={1000: RetryExceptions(times=2, sleep=[0])}) as dl:
+        req = Request("http://example.com/a")
+        resp = await dl.send(req)
+        assert resp.content == b"a" and resp.request is req and resp.elapsed is not None
+        assert isinstance(dl.sessions["example.com"], NullSession)
+        async with dl.stream(Request("http://example.com/b")) as stream:
+            assert b"".join([chunk async for chunk in stream.iter_chunks()]) == b"ok"
+        # unrecorded request fails like unreachable host and goes through retries
+        with pytest.raises(RequestFailed):
+            await dl.send(Request("http://example.com/missing"))
+    assert transport.stats == {"hits": 2, "misses": 3}
+    # recorded responses are never modified
+    assert transport.find(Request("http://example.com/a")).request is not req
+
+
+@pytest.mark.asyncio
+async def test_ReplayTransport_responder_with_middlewares():
+    statuses = iter([503, 503, 200])
+    transport = ReplayTransport(lambda req: recorded(str(req.url), status=next(statuses)))
+    async with Downloader(transport=transport, mwares={900: RetryStatuses(503, sleep=[0])}) as dl:
+        resp = await dl.send(Request("http://example.com"))
+        assert resp.status == 200
+        assert dl.stats["req/sent"] == 3 and dl.stats["req/retry"] == 2
+
+
+@pytest.mark.asyncio
+async def test_transport_per_slot(httpbin):
+    transport = ReplayTransport(lambda req: recorded(str(req.url), content=b"replayed"))
+    async with Downloader() as dl:
+        await dl.new_session("replayed", transport=transport)
+        resp = await dl.send(Request(httpbin.url + "/html", slot="replayed"))
+        assert resp.content == b"replayed"
+        resp = await dl.send(Request(httpbin.url + "/html"))
+        assert b"Herman Melville" in resp.content
+        assert isinstance(dl.sessions[resp.request.slot].transport, AiohttpTransport)